@@ -1,15 +1,32 @@
 from fastapi import APIRouter, HTTPException, Depends, Query, Body, File, UploadFile, Form
 from fastapi.responses import StreamingResponse, JSONResponse
 from typing import List, Optional, Dict, Any
-from io import BytesIO
+import asyncio
+import itertools
 import logging
-import json
+from urllib.parse import quote
 
 from audio_processor.music_processor import music_processor
+from audio_processor.job_queue import job_queue, Job, JobContext
+from audio_processor.job_routes import router as job_router, JobUser, check_priority, get_job_user
 
 router = APIRouter(prefix="/music", tags=["music"])
+router.include_router(job_router)
 logger = logging.getLogger(__name__)
 
+def run_music_job(job: Job, context: JobContext) -> Dict[str, Any]:
+    """
+    Generate music for a queued job and save it to storage
+    """
+    result = asyncio.run(music_processor.generate_music(**job.payload, save_to_library=True))
+    audio_data = result.pop("audio_data")
+    
+    context.raise_if_cancelled()
+    result["storage"] = music_processor.storage.upload_audio(audio_data, result["filename"])
+    return result
+
+job_queue.register("music.generate", run_music_job)
+
 @router.post("/generate")
 async def generate_music(
     prompt: str = Body(..., description="Text description of the music to generate"),
@@ -19,10 +36,16 @@ async def generate_music(
     tempo: Optional[int] = Body(None, description="Tempo in BPM"),
     instruments: Optional[List[str]] = Body(None, description="List of instruments to include"),
     duration: Optional[int] = Body(None, description="Duration in seconds"),
-    save_to_library: bool = Body(True, description="Whether to save to user's library")
+    save_to_library: bool = Body(True, description="Whether to save to user's library"),
+    use_cache: bool = Body(True, description="Whether a cached result for the same request may be returned")
 ):
     """
     Generate music based on a text prompt and additional parameters
+    
+    Audio is streamed as it is produced. Only small metadata fields are sent
+    as headers; when saving to the library, the audio is stored under
+    X-Music-Filename once the stream has completed, and the waveform status
+    is available from /music/waveform.
     """
     try:
         # Validate model
@@ -30,7 +53,7 @@ async def generate_music(
             raise HTTPException(status_code=400, detail="Invalid model. Must be 'grok' or 'gemini'")
         
         # Generate music
-        result = await music_processor.generate_music(
+        metadata, audio_stream = music_processor.stream_music(
             prompt=prompt,
             model=model,
             genre=genre,
@@ -38,27 +61,91 @@ async def generate_music(
             tempo=tempo,
             instruments=instruments,
             duration=duration,
-            save_to_library=save_to_library
+            save_to_library=save_to_library,
+            use_cache=use_cache
         )
         
-        # Extract audio data from result
-        audio_data = result.pop("audio_data", None)
-        if not audio_data:
-            raise HTTPException(status_code=500, detail="Failed to generate audio")
+        headers = {
+            "X-Music-Model": metadata["model"],
+            "X-Music-Duration": str(metadata["duration"])
+        }
+        if "filename" in metadata:
+            headers["X-Music-Filename"] = quote(metadata["filename"])
+            headers["X-Music-Waveform"] = quote(metadata["waveform_filename"])
+        
+        # Pull the first chunk before responding, so upstream errors are
+        # still reported as a 500 rather than a truncated 200
+        first_chunk = await asyncio.to_thread(next, audio_stream, b"")
         
-        # Return audio data as streaming response with metadata in headers
+        # Stream audio data as it is generated
         return StreamingResponse(
-            BytesIO(audio_data),
+            itertools.chain([first_chunk], audio_stream),
             media_type="audio/wav",
-            headers={
-                "X-Music-Metadata": json.dumps(result)
-            }
+            headers=headers
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error generating music: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error generating music: {str(e)}")
 
+@router.post("/jobs/generate", status_code=202)
+async def submit_music_job(
+    prompt: str = Body(..., description="Text description of the music to generate"),
+    model: str = Body("grok", description="AI model to use (grok or gemini)"),
+    genre: Optional[str] = Body(None, description="Music genre"),
+    mood: Optional[str] = Body(None, description="Emotional mood"),
+    tempo: Optional[int] = Body(None, description="Tempo in BPM"),
+    instruments: Optional[List[str]] = Body(None, description="List of instruments to include"),
+    duration: Optional[int] = Body(None, description="Duration in seconds"),
+    use_cache: bool = Body(True, description="Whether a cached result for the same request may be returned"),
+    priority: int = Body(0, description="Job priority; higher runs first (above 0 for admins only)"),
+    user: JobUser = Depends(get_job_user)
+):
+    """
+    Queue music generation and return a job ID
+    
+    Follow the job at /music/jobs/{job_id} or /music/jobs/{job_id}/ws. The
+    result holds the saved file's storage info and the waveform status.
+    """
+    if model.lower() not in ["grok", "gemini"]:
+        raise HTTPException(status_code=400, detail="Invalid model. Must be 'grok' or 'gemini'")
+    check_priority(priority, user)
+    
+    try:
+        job = job_queue.submit(
+            "music.generate",
+            {
+                "prompt": prompt,
+                "model": model,
+                "genre": genre,
+                "mood": mood,
+                "tempo": tempo,
+                "instruments": instruments,
+                "duration": duration,
+                "use_cache": use_cache
+            },
+            user_id=user.id,
+            priority=priority
+        )
+        
+        return job.to_dict()
+    except Exception as e:
+        logger.error(f"Error queueing music generation: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error queueing music generation: {str(e)}")
+
+@router.get("/waveform/{waveform_filename}")
+async def get_waveform_status(waveform_filename: str):
+    """
+    Get the status and URL of a waveform image rendered after generation
+    """
+    status = music_processor.get_waveform_status(waveform_filename)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Waveform job not found")
+    
+    return status
+
 @router.get("/genres")
 async def get_available_genres():
     """
@@ -1,23 +1,75 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Depends, BackgroundTasks, Header
 from fastapi.responses import StreamingResponse, JSONResponse
 from typing import Optional, Dict, Any, List
+import asyncio
 import logging
 import json
-import io
+import itertools
 import os
+import requests
+import time
 from pydantic import BaseModel
 
 from processor import audio_processor
+from job_queue import job_queue, Job, JobContext
+from job_routes import router as job_router, JobUser, check_priority, get_job_user
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="SoundScape AI Audio Processor API")
+app.include_router(job_router)
+
+# Seconds between cancellation checks while a generate job streams audio;
+# each check is a query to the job broker
+CANCEL_CHECK_INTERVAL = 1.0
 
 class AudioGenerationRequest(BaseModel):
     prompt: str
     options: Optional[Dict[str, Any]] = None
+    use_cache: bool = True
+
+class AudioGenerationJobRequest(AudioGenerationRequest):
+    priority: int = 0
+
+def run_generate_job(job: Job, context: JobContext) -> Dict[str, Any]:
+    """
+    Generate audio for a queued job and save it to Supabase
+    """
+    payload = job.payload
+    chunks = []
+    next_check = time.monotonic()
+    for chunk in audio_processor.stream_audio(
+        payload["prompt"],
+        payload.get("options"),
+        save_to_supabase=False,
+        use_cache=payload.get("use_cache", True)
+    ):
+        if time.monotonic() >= next_check:
+            context.raise_if_cancelled()
+            next_check = time.monotonic() + CANCEL_CHECK_INTERVAL
+        chunks.append(chunk)
+    
+    audio_data = b"".join(chunks)
+    filename = audio_processor.generated_filename()
+    results = audio_processor.save_generated_audio(audio_data, filename)
+    results['filename'] = filename
+    results['size'] = len(audio_data)
+    return results
+
+def run_process_job(job: Job, context: JobContext) -> Dict[str, Any]:
+    """
+    Process an uploaded audio file for a queued job
+    """
+    return audio_processor.process_file(
+        job.data,
+        analyze=job.payload.get("analyze", True),
+        transcribe=job.payload.get("transcribe", False)
+    )
+
+job_queue.register("generate", run_generate_job)
+job_queue.register("process", run_process_job)
 
 @app.post("/process", response_class=JSONResponse)
 async def process_audio(
@@ -48,22 +100,114 @@ async def process_audio(
 async def generate_audio(request: AudioGenerationRequest):
     """
     Generate audio based on a text prompt
+    
+    Audio is streamed to the client as it is produced. Once the stream has
+    completed, the generated file is saved and can be fetched again from
+    /audio/{X-Audio-Filename}; a stream closed early is not saved.
     """
     try:
-        audio_data = audio_processor.generate_audio(
+        filename = audio_processor.generated_filename()
+        audio_stream = audio_processor.stream_audio(
             request.prompt, 
-            request.options
+            request.options,
+            filename=filename,
+            use_cache=request.use_cache
         )
         
-        # Return the audio data as a streaming response
+        # Pull the first chunk before responding, so upstream errors are
+        # still reported as a 500 rather than a truncated 200
+        first_chunk = await asyncio.to_thread(next, audio_stream, b"")
+        
         return StreamingResponse(
-            io.BytesIO(audio_data),
-            media_type="audio/wav"
+            itertools.chain([first_chunk], audio_stream),
+            media_type="audio/wav",
+            headers={"X-Audio-Filename": filename}
         )
     except Exception as e:
         logger.error(f"Error generating audio: {e}")
         raise HTTPException(status_code=500, detail=f"Error generating audio: {str(e)}")
 
+@app.post("/jobs/process", status_code=202)
+async def submit_process_job(
+    file: UploadFile = File(...),
+    analyze: bool = Form(True),
+    transcribe: bool = Form(False),
+    priority: int = Form(0),
+    user: JobUser = Depends(get_job_user)
+):
+    """
+    Queue an uploaded audio file for processing
+    
+    Returns a job ID; follow the job at /jobs/{job_id} or /jobs/{job_id}/ws.
+    """
+    check_priority(priority, user)
+    try:
+        audio_data = await file.read()
+        
+        job = job_queue.submit(
+            "process",
+            {"analyze": analyze, "transcribe": transcribe, "file_name": file.filename},
+            user_id=user.id,
+            priority=priority,
+            data=audio_data
+        )
+        
+        return job.to_dict()
+    except Exception as e:
+        logger.error(f"Error queueing audio processing: {e}")
+        raise HTTPException(status_code=500, detail=f"Error queueing audio processing: {str(e)}")
+
+@app.post("/jobs/generate", status_code=202)
+async def submit_generate_job(
+    request: AudioGenerationJobRequest,
+    user: JobUser = Depends(get_job_user)
+):
+    """
+    Queue audio generation for a text prompt
+    
+    Returns a job ID; the result holds the storage URLs of the saved audio.
+    """
+    check_priority(request.priority, user)
+    try:
+        job = job_queue.submit(
+            "generate",
+            {"prompt": request.prompt, "options": request.options, "use_cache": request.use_cache},
+            user_id=user.id,
+            priority=request.priority
+        )
+        
+        return job.to_dict()
+    except Exception as e:
+        logger.error(f"Error queueing audio generation: {e}")
+        raise HTTPException(status_code=500, detail=f"Error queueing audio generation: {str(e)}")
+
+@app.get("/audio/{filename}", response_class=StreamingResponse)
+async def get_audio(filename: str, range: Optional[str] = Header(None)):
+    """
+    Stream a stored audio file, honouring HTTP Range requests
+    """
+    try:
+        status_code, headers, body = await asyncio.to_thread(
+            audio_processor.storage.stream_audio_file,
+            filename,
+            range
+        )
+        
+        return StreamingResponse(
+            body,
+            status_code=status_code,
+            media_type=headers.pop("Content-Type", "audio/wav"),
+            headers=headers
+        )
+    except requests.exceptions.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            raise HTTPException(status_code=404, detail="Audio file not found")
+        logger.error(f"Error retrieving audio: {e}")
+        raise HTTPException(status_code=500, detail=f"Error retrieving audio: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error retrieving audio: {e}")
+        raise HTTPException(status_code=500, detail=f"Error retrieving audio: {str(e)}")
+
 @app.get("/health")
 async def health_check():
     """
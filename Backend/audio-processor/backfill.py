@@ -0,0 +1,452 @@
+"""
+Catalog Backfill for Audio Processor
+
+This module runs AudioFeaturePipeline over an existing catalog, either a
+bucket prefix in Supabase Storage or a local directory, and writes the
+features in bulk. Tracks stream through the pipelined batch analysis
+(AudioFeaturePipeline.process_many), so listing, downloading, decoding,
+feature extraction and model inference overlap.
+
+Progress is checkpointed in a SQLite database. A track is marked done only
+after its features have been flushed to the output, so after a crash the
+backfill resumes where it stopped and never loses a track; at worst the
+last unflushed batch is analyzed again. The checkpoint records which
+feature groups each track was analyzed for, so a later run asking for more
+groups analyzes those tracks again.
+
+Run from the service directory:
+
+    python -m backfill --local-dir ./catalog --output features.jsonl
+    python -m backfill --supabase-prefix catalog --mongo-url mongodb://localhost:27017
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from src.ml.audio_feature_pipeline import AudioFeatureConfig, AudioFeaturePipeline, FEATURE_GROUPS
+
+logger = logging.getLogger(__name__)
+
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.flac', '.aac', '.ogg')
+
+STATUS_DONE = "done"
+STATUS_ERROR = "error"
+
+def iter_local_sources(directory: str,
+                       extensions: Sequence[str] = AUDIO_EXTENSIONS) -> Iterator[Tuple[str, str]]:
+    """
+    List audio files under a directory in a stable order
+
+    Yields:
+        (path relative to the directory, absolute path) pairs
+    """
+    directory = os.path.abspath(directory)
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(tuple(extensions)):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, directory).replace(os.sep, "/"), path
+
+def iter_storage_sources(storage, prefix: str = "",
+                         extensions: Sequence[str] = AUDIO_EXTENSIONS) -> Iterator[Tuple[str, Callable[[], bytes]]]:
+    """
+    List audio files in Supabase Storage
+
+    Files are downloaded by the pipeline's decode workers when they reach
+    them, not while listing.
+
+    Yields:
+        (object name, download callable) pairs
+    """
+    for entry in storage.list_audio_files(prefix):
+        name = entry["name"]
+        if name.lower().endswith(tuple(extensions)):
+            yield name, lambda name=name: storage.get_audio_file(name)
+
+def _resolve_groups(feature_groups: Optional[Sequence[str]]) -> Set[str]:
+    """Groups a run extracts: the requested ones (default: all), always with basic"""
+    return set(feature_groups or FEATURE_GROUPS) | {"basic"}
+
+def _json_default(value: Any) -> Any:
+    """Serialize NumPy values left in feature dictionaries"""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class BackfillCheckpoint:
+    """Per-track backfill progress in a SQLite database"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS backfill_progress (
+                source_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                audio_id TEXT,
+                error TEXT,
+                updated_at REAL NOT NULL,
+                feature_groups TEXT
+            )
+        """)
+
+    def finished(self, include_errors: bool = True,
+                 feature_groups: Optional[Sequence[str]] = None) -> Set[str]:
+        """
+        Source IDs that need no further work
+
+        Args:
+            include_errors: Whether tracks that failed count as finished
+            feature_groups: Groups the run extracts (default: all); tracks
+                recorded for fewer groups, or with no groups recorded, are
+                not finished
+        """
+        statuses = (STATUS_DONE, STATUS_ERROR) if include_errors else (STATUS_DONE,)
+        wanted = _resolve_groups(feature_groups)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT source_id, feature_groups FROM backfill_progress "
+                f"WHERE status IN ({', '.join('?' * len(statuses))})",
+                statuses
+            ).fetchall()
+        return {source_id for source_id, groups in rows if groups and wanted <= set(groups.split(","))}
+
+    def record(self, entries: Sequence[Tuple[str, str, Optional[str], Optional[str]]],
+               feature_groups: Optional[Sequence[str]] = None) -> None:
+        """
+        Record the outcome of tracks in one transaction
+
+        Args:
+            entries: (source ID, status, audio ID, error) tuples
+            feature_groups: Groups the tracks were analyzed for (default: all)
+        """
+        now = time.time()
+        groups = ",".join(sorted(_resolve_groups(feature_groups)))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO backfill_progress "
+                    "(source_id, status, audio_id, error, updated_at, feature_groups) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(source_id, status, audio_id, error, now, groups)
+                     for source_id, status, audio_id, error in entries]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def counts(self) -> Dict[str, int]:
+        """Number of recorded tracks per status"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM backfill_progress GROUP BY status").fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class FeatureSink(ABC):
+    """Destination for backfilled features"""
+
+    @abstractmethod
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        """Durably store a batch of feature records, each with its source_id"""
+
+    def close(self) -> None:
+        pass
+
+class JsonLinesFeatureSink(FeatureSink):
+    """
+    Appends one JSON document per track to a file
+
+    A crash between writing a batch and checkpointing it leaves those
+    tracks in the file twice after resuming; readers should keep the last
+    line per source_id.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        self._file.write("".join(json.dumps(record, default=_json_default) + "\n" for record in records))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+class MongoFeatureSink(FeatureSink):
+    """
+    Upserts features into the recommendation engine's audio_features
+    collection, keyed by its unique audioId and stamped with updated_at so
+    catalog feeds pick up the change
+    """
+
+    def __init__(self, url: str, database: str = "soundscape-recommendations",
+                 collection: str = "audio_features"):
+        from pymongo import MongoClient
+
+        self.client = MongoClient(url)
+        self.collection = self.client[database][collection]
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        from pymongo import UpdateOne
+
+        # Round-trip through JSON to turn NumPy values into BSON-friendly types
+        documents = json.loads(json.dumps(records, default=_json_default))
+        now = datetime.now(timezone.utc)
+        for doc in documents:
+            doc["audioId"] = doc["audio_id"]
+            doc["updated_at"] = now
+        self.collection.bulk_write(
+            [UpdateOne({"audioId": doc["audioId"]}, {"$set": doc}, upsert=True) for doc in documents],
+            ordered=False
+        )
+
+    def close(self) -> None:
+        self.client.close()
+
+class _BackfillWriter:
+    """
+    Buffers pipeline results, flushing them to the sink and then the
+    checkpoint in batches, and logs throughput along the way
+    """
+
+    def __init__(self, sink: FeatureSink, checkpoint: BackfillCheckpoint,
+                 flush_size: int, flush_interval: float, report_interval: float,
+                 feature_groups: Optional[Sequence[str]] = None):
+        self.sink = sink
+        self.checkpoint = checkpoint
+        self.feature_groups = feature_groups
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.report_interval = report_interval
+
+        self._lock = threading.Lock()
+        self._records: List[Dict[str, Any]] = []
+        self._entries: List[Tuple[str, str, Optional[str], Optional[str]]] = []
+        self._start_time = time.time()
+        self._last_flush = self._start_time
+        self._last_report = (self._start_time, 0)
+        self.done = 0
+        self.errors = 0
+
+    def add(self, source_id: str, features: Dict[str, Any]) -> None:
+        with self._lock:
+            if "error" in features:
+                self._entries.append((source_id, STATUS_ERROR, features.get("audio_id"), str(features["error"])))
+                self.errors += 1
+            else:
+                self._records.append({"source_id": source_id, **features})
+                self._entries.append((source_id, STATUS_DONE, features.get("audio_id"), None))
+                self.done += 1
+
+            if (len(self._entries) >= self.flush_size
+                    or time.time() - self._last_flush >= self.flush_interval):
+                self._flush()
+            self._report()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._entries:
+            return
+
+        # Features must be stored before the tracks are marked done
+        if self._records:
+            self.sink.write(self._records)
+        self.checkpoint.record(self._entries, self.feature_groups)
+        self._records, self._entries = [], []
+        self._last_flush = time.time()
+
+    def _report(self) -> None:
+        now = time.time()
+        last_time, last_count = self._last_report
+        if now - last_time < self.report_interval:
+            return
+
+        count = self.done + self.errors
+        logger.info(
+            f"Backfilled {count} tracks ({self.errors} errors): "
+            f"{(count - last_count) / (now - last_time):.2f} tracks/s now, "
+            f"{count / (now - self._start_time):.2f} tracks/s overall"
+        )
+        self._last_report = (now, count)
+
+def _skip_finished(sources: Iterable[Tuple[str, Any]], finished: Set[str],
+                   limit: Optional[int], skipped: List[int]) -> Iterator[Tuple[str, Any]]:
+    """Yield the sources not yet backfilled, up to limit"""
+    count = 0
+    for source_id, source in sources:
+        if source_id in finished:
+            skipped[0] += 1
+            continue
+        if limit is not None and count >= limit:
+            return
+        count += 1
+        yield source_id, source
+
+def run_backfill(pipeline: AudioFeaturePipeline,
+                 sources: Iterable[Tuple[str, Any]],
+                 sink: FeatureSink,
+                 checkpoint: BackfillCheckpoint,
+                 feature_groups: Optional[Sequence[str]] = None,
+                 retry_errors: bool = False,
+                 limit: Optional[int] = None,
+                 decode_workers: Optional[int] = None,
+                 feature_workers: Optional[int] = None,
+                 batch_size: Optional[int] = None,
+                 queue_size: Optional[int] = None,
+                 flush_size: int = 256,
+                 flush_interval: float = 30.0,
+                 report_interval: float = 10.0) -> Dict[str, Any]:
+    """
+    Analyze every source not yet checkpointed for the feature groups and store the features
+
+    Args:
+        pipeline: Feature pipeline to run
+        sources: (source ID, audio) pairs, as for process_many
+        sink: Where features are written
+        checkpoint: Progress of earlier runs, updated as tracks finish
+        feature_groups: Feature groups to extract (default: all)
+        retry_errors: Whether to analyze tracks that failed before again
+        limit: Maximum number of tracks to analyze in this run
+        decode_workers: Decode threads
+        feature_workers: Feature worker processes
+        batch_size: Tracks per model call
+        queue_size: Capacity of each pipeline stage queue
+        flush_size: Tracks buffered before writing to the sink
+        flush_interval: Maximum seconds between writes
+        report_interval: Seconds between progress log lines
+
+    Returns:
+        Summary with counts, tracks/sec and per-stage pipeline metrics
+    """
+    finished = checkpoint.finished(include_errors=not retry_errors, feature_groups=feature_groups)
+    skipped = [0]
+    writer = _BackfillWriter(sink, checkpoint, flush_size, flush_interval, report_interval, feature_groups)
+
+    start_time = time.time()
+    try:
+        batch = asyncio.run(pipeline.process_many(
+            _skip_finished(sources, finished, limit, skipped),
+            on_result=writer.add,
+            feature_groups=feature_groups,
+            decode_workers=decode_workers,
+            feature_workers=feature_workers,
+            batch_size=batch_size,
+            queue_size=queue_size
+        ))
+    finally:
+        writer.flush()
+    elapsed = time.time() - start_time
+
+    summary = {
+        "processed": writer.done + writer.errors,
+        "succeeded": writer.done,
+        "failed": writer.errors,
+        "skipped": skipped[0],
+        "elapsed": elapsed,
+        "tracks_per_second": (writer.done + writer.errors) / max(elapsed, 1e-9),
+        "checkpoint": checkpoint.counts(),
+        "pipeline": batch["metrics"]
+    }
+    logger.info(
+        f"Backfill finished: {summary['processed']} tracks in {elapsed:.1f}s "
+        f"({summary['tracks_per_second']:.2f} tracks/s), {summary['failed']} failed, "
+        f"{summary['skipped']} already done"
+    )
+    return summary
+
+def _parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m backfill",
+        description="Extract audio features for an existing catalog"
+    )
+
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--local-dir", help="Analyze the audio files under this directory")
+    source.add_argument("--supabase-prefix", help="Analyze the audio bucket under this prefix ('' for all)")
+
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--output", default="features.jsonl", help="JSON Lines file to append features to")
+    output.add_argument("--mongo-url", help="Upsert features into MongoDB instead")
+    parser.add_argument("--mongo-db", default="soundscape-recommendations")
+    parser.add_argument("--mongo-collection", default="audio_features")
+
+    parser.add_argument("--checkpoint", default="backfill_checkpoint.db", help="SQLite progress database")
+    parser.add_argument("--retry-errors", action="store_true", help="Analyze tracks that failed in earlier runs again")
+    parser.add_argument("--limit", type=int, help="Maximum number of tracks to analyze in this run")
+    parser.add_argument("--feature-groups", nargs="+", choices=FEATURE_GROUPS, help="Feature groups to extract (default: all)")
+
+    parser.add_argument("--decode-workers", type=int, help="Decode threads (default: half the CPUs)")
+    parser.add_argument("--feature-workers", type=int, help="Feature worker processes (default: one per CPU)")
+    parser.add_argument("--batch-size", type=int, help="Tracks per model call")
+    parser.add_argument("--queue-size", type=int, help="Capacity of each pipeline stage queue")
+    parser.add_argument("--flush-size", type=int, default=256, help="Tracks buffered before each write")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="Seconds between progress lines")
+    parser.add_argument("--use-cache", action="store_true", help="Read and fill the pipeline's feature cache")
+
+    return parser.parse_args(argv)
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    args = _parse_args(argv)
+
+    if args.local_dir is not None:
+        if not os.path.isdir(args.local_dir):
+            raise SystemExit(f"Not a directory: {args.local_dir}")
+        sources = iter_local_sources(args.local_dir)
+    else:
+        # Imported only when needed: the storage client requires credentials
+        from supabase_storage import supabase_storage
+        sources = iter_storage_sources(supabase_storage, args.supabase_prefix.strip("/"))
+
+    if args.mongo_url:
+        sink = MongoFeatureSink(args.mongo_url, args.mongo_db, args.mongo_collection)
+    else:
+        sink = JsonLinesFeatureSink(args.output)
+
+    checkpoint = BackfillCheckpoint(args.checkpoint)
+    pipeline = AudioFeaturePipeline(AudioFeatureConfig(cache_features=args.use_cache))
+
+    try:
+        summary = run_backfill(
+            pipeline,
+            sources,
+            sink,
+            checkpoint,
+            feature_groups=args.feature_groups,
+            retry_errors=args.retry_errors,
+            limit=args.limit,
+            decode_workers=args.decode_workers,
+            feature_workers=args.feature_workers,
+            batch_size=args.batch_size,
+            queue_size=args.queue_size,
+            flush_size=args.flush_size,
+            report_interval=args.report_interval
+        )
+    finally:
+        sink.close()
+        checkpoint.close()
+
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
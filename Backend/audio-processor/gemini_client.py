@@ -1,17 +1,17 @@
 import requests
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional
 import json
 import sys
 import os
 import base64
-import numpy as np
-import wave
-from io import BytesIO
 
 # Add the parent directory to sys.path to import from config
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from config.api_key_manager import api_key_manager
+from response_cache import response_cache
+from synth_engine import BlockSynth, get_preset
+from wav_io import wav_header
 
 logger = logging.getLogger(__name__)
 
@@ -24,13 +24,15 @@ class GeminiClient:
         self.api_base_url = "https://generativelanguage.googleapis.com/v1"
         self.model = "gemini-1.5-pro"
 
-    def generate_text(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def generate_text(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                      use_cache: bool = True) -> Dict[str, Any]:
         """
         Generate text using Gemini API
 
         Args:
             prompt: Text prompt for generation
             options: Additional options for generation
+            use_cache: Whether a cached response for the same request may be returned
 
         Returns:
             JSON response from the Gemini API
@@ -54,20 +56,26 @@ class GeminiClient:
             for key, value in options.items():
                 payload[key] = value
 
-        try:
+        def request() -> Dict[str, Any]:
             response = requests.post(
                 endpoint,
                 json=payload
             )
             response.raise_for_status()
             return response.json()
+
+        cache_key = response_cache.make_key("gemini", self.model, "generateContent", prompt, options)
+
+        try:
+            return response_cache.cached_json(cache_key, request, use_cache=use_cache)
         except requests.exceptions.RequestException as e:
             logger.error(f"Error calling Gemini API: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 logger.error(f"Response content: {e.response.text}")
             raise
 
-    def analyze_audio(self, audio_data: bytes, prompt: str = "Analyze this audio", options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def analyze_audio(self, audio_data: bytes, prompt: str = "Analyze this audio", options: Optional[Dict[str, Any]] = None,
+                      use_cache: bool = True) -> Dict[str, Any]:
         """
         Analyze audio data using Gemini multimodal capabilities
 
@@ -75,6 +83,7 @@ class GeminiClient:
             audio_data: Binary audio data
             prompt: Text prompt for analysis
             options: Additional options for analysis
+            use_cache: Whether a cached response for the same audio and request may be returned
 
         Returns:
             JSON response from the Gemini API
@@ -107,26 +116,33 @@ class GeminiClient:
             for key, value in options.items():
                 payload[key] = value
 
-        try:
+        def request() -> Dict[str, Any]:
             response = requests.post(
                 endpoint,
                 json=payload
             )
             response.raise_for_status()
             return response.json()
+
+        cache_key = response_cache.make_key("gemini", self.model, "analyzeAudio", prompt, options, audio_data)
+
+        try:
+            return response_cache.cached_json(cache_key, request, use_cache=use_cache)
         except requests.exceptions.RequestException as e:
             logger.error(f"Error calling Gemini API for audio analysis: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 logger.error(f"Response content: {e.response.text}")
             raise
 
-    def generate_audio_description(self, audio_data: bytes, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def generate_audio_description(self, audio_data: bytes, options: Optional[Dict[str, Any]] = None,
+                                   use_cache: bool = True) -> Dict[str, Any]:
         """
         Generate a detailed description of audio content
 
         Args:
             audio_data: Binary audio data
             options: Additional options for generation
+            use_cache: Whether a cached result for the same audio may be returned
 
         Returns:
             Description of the audio content
@@ -140,15 +156,17 @@ class GeminiClient:
         5. Any other notable audio features
         """
 
-        return self.analyze_audio(audio_data, prompt, options)
+        return self.analyze_audio(audio_data, prompt, options, use_cache=use_cache)
 
-    def suggest_audio_enhancements(self, audio_data: bytes, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def suggest_audio_enhancements(self, audio_data: bytes, options: Optional[Dict[str, Any]] = None,
+                                   use_cache: bool = True) -> Dict[str, Any]:
         """
         Suggest enhancements for audio quality
 
         Args:
             audio_data: Binary audio data
             options: Additional options
+            use_cache: Whether a cached result for the same audio may be returned
 
         Returns:
             Suggestions for audio enhancement
@@ -162,25 +180,87 @@ class GeminiClient:
         5. Any specific issues that should be addressed
         """
 
-        return self.analyze_audio(audio_data, prompt, options)
+        return self.analyze_audio(audio_data, prompt, options, use_cache=use_cache)
 
-    def generate_audio(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> bytes:
+    def generate_audio(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                       use_cache: bool = True) -> bytes:
         """
         Generate audio based on a text prompt
 
         Args:
             prompt: Text description for audio generation
             options: Additional options for generation
+            use_cache: Whether a cached specification for the same request may be used
 
         Returns:
             Binary audio data
         """
+        wav_data = b"".join(self.stream_audio(prompt, options, use_cache=use_cache))
+        logger.info(f"Generated audio data size: {len(wav_data)} bytes")
+        return wav_data
+
+    def stream_audio(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                     block_frames: int = 8192, use_cache: bool = True) -> Iterator[bytes]:
+        """
+        Generate audio based on a text prompt, yielding WAV data as it is synthesized
+
+        The specification is requested before anything is yielded, so an
+        upstream error surfaces on the first chunk. The WAV header follows,
+        then samples in blocks of block_frames.
+
+        Args:
+            prompt: Text description for audio generation
+            options: Additional options for generation
+            block_frames: Number of frames synthesized per chunk
+            use_cache: Whether a cached specification for the same request may be used
+
+        Yields:
+            WAV header, then 16-bit PCM blocks
+        """
         logger.info(f"Generating audio with Gemini model: {prompt}")
 
-        # Since Gemini doesn't directly support audio generation yet,
-        # we'll use a text-to-audio approach by generating a detailed description
-        # and then converting it to audio parameters for synthesis
+        # Create a simple WAV stream with parameters based on the options
+        sample_rate = 44100
+        duration = options.get("duration", 30) if options else 30
+        n_frames = int(sample_rate * duration)
+
+        try:
+            # Since Gemini doesn't directly support audio generation yet,
+            # we'll use a text-to-audio approach by generating a detailed description
+            # and then converting it to audio parameters for synthesis
+            generated_text = self._generate_audio_specification(prompt, options, use_cache=use_cache)
+            logger.info(f"Generated audio description: {generated_text[:100]}...")
+
+            yield wav_header(sample_rate, n_channels=1, sample_width=2, n_frames=n_frames)
+
+            # In a real implementation, this would use the description to synthesize audio
+            # For now, we'll generate a simple audio signal based on the options
+
+            # Use the synth preset for the mood if specified
+            mood = options.get("mood", "relaxed") if options else "relaxed"
+            synth = BlockSynth(get_preset(mood), sample_rate=sample_rate, block_frames=block_frames)
+
+            # Render 16-bit PCM block by block, so memory use does not grow
+            # with the requested duration
+            yield from synth.pcm16_blocks(n_frames)
 
+        except Exception as e:
+            logger.error(f"Error generating audio with Gemini: {str(e)}")
+            raise
+
+    def _generate_audio_specification(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                                      use_cache: bool = True) -> str:
+        """
+        Ask Gemini for a detailed audio generation specification
+
+        Args:
+            prompt: Text description for audio generation
+            options: Additional options for generation
+            use_cache: Whether a cached response for the same request may be returned
+
+        Returns:
+            Generated specification text
+        """
         # Default options for audio generation
         default_options = {
             "temperature": 0.7,
@@ -209,88 +289,22 @@ class GeminiClient:
         - Rhythmic elements
         """
 
-        try:
-            # Generate the detailed audio description
-            response = self.generate_text(enhanced_prompt, generation_options)
-
-            # Extract the generated text
-            generated_text = ""
-            if "candidates" in response and len(response["candidates"]) > 0:
-                if "content" in response["candidates"][0] and "parts" in response["candidates"][0]["content"]:
-                    for part in response["candidates"][0]["content"]["parts"]:
-                        if "text" in part:
-                            generated_text += part["text"]
-
-            if not generated_text:
-                logger.error("Failed to generate audio description")
-                raise Exception("Failed to generate audio description")
-
-            logger.info(f"Generated audio description: {generated_text[:100]}...")
-
-            # In a real implementation, this would use the description to synthesize audio
-            # For now, we'll generate a simple audio file based on the options
-
-            # Create a simple WAV file with parameters based on the options
-            sample_rate = 44100
-            duration = options.get("duration", 30) if options else 30
+        # Generate the detailed audio description
+        response = self.generate_text(enhanced_prompt, generation_options, use_cache=use_cache)
 
-            # Generate a simple sine wave with varying frequency
-            t = np.linspace(0, duration, int(sample_rate * duration), endpoint=False)
+        # Extract the generated text
+        generated_text = ""
+        if "candidates" in response and len(response["candidates"]) > 0:
+            if "content" in response["candidates"][0] and "parts" in response["candidates"][0]["content"]:
+                for part in response["candidates"][0]["content"]["parts"]:
+                    if "text" in part:
+                        generated_text += part["text"]
 
-            # Base frequency and modulation
-            base_freq = 440  # A4 note
+        if not generated_text:
+            logger.error("Failed to generate audio description")
+            raise Exception("Failed to generate audio description")
 
-            # Use different parameters based on the mood if specified
-            mood = options.get("mood", "relaxed") if options else "relaxed"
-
-            if mood == "relaxed" or mood == "peaceful":
-                frequencies = [base_freq, base_freq * 1.5, base_freq * 2]
-                amplitudes = [0.5, 0.3, 0.2]
-                mod_freq = 0.1
-            elif mood == "energetic" or mood == "happy":
-                frequencies = [base_freq * 1.2, base_freq * 1.8, base_freq * 2.5]
-                amplitudes = [0.4, 0.4, 0.2]
-                mod_freq = 0.3
-            elif mood == "melancholic" or mood == "sad":
-                frequencies = [base_freq * 0.8, base_freq * 1.2, base_freq * 1.6]
-                amplitudes = [0.6, 0.3, 0.1]
-                mod_freq = 0.05
-            else:
-                frequencies = [base_freq, base_freq * 1.5, base_freq * 2]
-                amplitudes = [0.5, 0.3, 0.2]
-                mod_freq = 0.1
-
-            # Generate the audio signal
-            audio_signal = np.zeros_like(t)
-            for freq, amp in zip(frequencies, amplitudes):
-                audio_signal += amp * np.sin(2 * np.pi * freq * t + 0.3 * np.sin(2 * np.pi * mod_freq * t))
-
-            # Normalize
-            audio_signal = audio_signal / np.max(np.abs(audio_signal))
-
-            # Convert to 16-bit PCM
-            audio_signal = (audio_signal * 32767).astype(np.int16)
-
-            # Create a BytesIO object to hold the WAV file
-            buffer = BytesIO()
-
-            # Write the WAV file
-            with wave.open(buffer, 'wb') as wf:
-                wf.setnchannels(1)
-                wf.setsampwidth(2)  # 2 bytes for 16-bit audio
-                wf.setframerate(sample_rate)
-                wf.writeframes(audio_signal.tobytes())
-
-            # Get the WAV data
-            buffer.seek(0)
-            wav_data = buffer.read()
-
-            logger.info(f"Generated audio data size: {len(wav_data)} bytes")
-            return wav_data
-
-        except Exception as e:
-            logger.error(f"Error generating audio with Gemini: {str(e)}")
-            raise
+        return generated_text
 
 # Create a singleton instance
 gemini_client = GeminiClient()
@@ -1,6 +1,6 @@
 import requests
 import logging
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional
 import json
 import sys
 import os
@@ -8,6 +8,7 @@ import os
 # Add the parent directory to sys.path to import from config
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from config.api_key_manager import api_key_manager
+from response_cache import response_cache
 
 logger = logging.getLogger(__name__)
 
@@ -59,19 +60,135 @@ class GrokClient:
                 logger.error(f"Response content: {e.response.text}")
             raise
 
-    def generate_audio(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> bytes:
+    def generate_audio(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                       use_cache: bool = True) -> bytes:
         """
         Generate audio based on a text prompt
 
         Args:
             prompt: Text description for audio generation
             options: Additional options for generation
+            use_cache: Whether previously generated audio for the same request may be returned
 
         Returns:
             Binary audio data
         """
         endpoint = f"{self.api_base_url}/audio/generate"
+        payload = self._build_audio_payload(prompt, options)
 
+        logger.info(f"Generating audio with prompt: {prompt}")
+        logger.info(f"Options: {payload}")
+
+        def request() -> bytes:
+            response = requests.post(
+                endpoint,
+                headers=self.headers,
+                json=payload
+            )
+            response.raise_for_status()
+            logger.info(f"Successfully generated audio, size: {len(response.content)} bytes")
+            return response.content
+
+        try:
+            return response_cache.cached_bytes(self._cache_key(payload), request, use_cache=use_cache)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error calling Grok API: {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                logger.error(f"Response content: {e.response.text}")
+            raise
+
+    def stream_audio(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                     chunk_size: int = 64 * 1024, use_cache: bool = True) -> Iterator[bytes]:
+        """
+        Generate audio based on a text prompt, yielding the upstream body as it arrives
+
+        A cached result is replayed in chunks of the same size. Otherwise the
+        streamed body is cached once it has been received completely.
+
+        Args:
+            prompt: Text description for audio generation
+            options: Additional options for generation
+            chunk_size: Maximum size of each yielded chunk in bytes
+            use_cache: Whether previously generated audio for the same request may be returned
+
+        Yields:
+            Chunks of binary audio data
+        """
+        endpoint = f"{self.api_base_url}/audio/generate"
+        payload = self._build_audio_payload(prompt, options)
+        cache_key = self._cache_key(payload)
+
+        if use_cache:
+            cached = response_cache.get_bytes(cache_key)
+            if cached is not None:
+                logger.info(f"Streaming cached audio for prompt: {prompt}")
+                for start in range(0, len(cached), chunk_size):
+                    yield cached[start:start + chunk_size]
+                return
+
+        logger.info(f"Streaming audio with prompt: {prompt}")
+        logger.info(f"Options: {payload}")
+
+        try:
+            with requests.post(
+                endpoint,
+                headers=self.headers,
+                json=payload,
+                stream=True
+            ) as response:
+                response.raise_for_status()
+
+                chunks = []
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        chunks.append(chunk)
+                        yield chunk
+
+            audio_data = b"".join(chunks)
+            response_cache.set_bytes(cache_key, audio_data)
+            logger.info(f"Successfully streamed audio, size: {len(audio_data)} bytes")
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error calling Grok API: {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                logger.error(f"Response content: {e.response.text}")
+            raise
+
+    def _cache_key(self, payload: Dict[str, Any]) -> str:
+        """
+        Build the response cache key for an audio generation payload
+
+        Option strings are case-folded and the instrument list is sorted,
+        so preset requests built in a different order share an entry.
+
+        Args:
+            payload: Payload from _build_audio_payload
+
+        Returns:
+            Cache key
+        """
+        options = {}
+        for key, value in payload.items():
+            if key == "prompt":
+                continue
+            if isinstance(value, str):
+                value = value.casefold()
+            elif key == "instruments" and isinstance(value, list):
+                value = sorted(str(item).casefold() for item in value)
+            options[key] = value
+
+        return response_cache.make_key("grok", "default", "audio/generate", payload["prompt"], options)
+
+    def _build_audio_payload(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Build the request payload for audio generation
+
+        Args:
+            prompt: Text description for audio generation
+            options: Additional options for generation
+
+        Returns:
+            Payload with defaults applied
+        """
         # Default options for audio generation
         default_options = {
             "duration": 30,  # Default duration in seconds
@@ -92,35 +209,49 @@ class GrokClient:
         if options:
             payload.update(options)
 
-        logger.info(f"Generating audio with prompt: {prompt}")
-        logger.info(f"Options: {payload}")
+        return payload
 
-        try:
-            response = requests.post(
-                endpoint,
-                headers=self.headers,
-                json=payload
-            )
-            response.raise_for_status()
-            logger.info(f"Successfully generated audio, size: {len(response.content)} bytes")
-            return response.content
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error calling Grok API: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                logger.error(f"Response content: {e.response.text}")
-            raise
-
-    def generate_music(self, prompt: str, options: Optional[Dict[str, Any]] = None) -> bytes:
+    def generate_music(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                       use_cache: bool = True) -> bytes:
         """
         Generate music based on a text prompt with more music-specific options
 
         Args:
             prompt: Text description for music generation
             options: Additional options for generation
+            use_cache: Whether previously generated music for the same request may be returned
 
         Returns:
             Binary audio data
         """
+        # Call the general audio generation method with music-specific options
+        return self.generate_audio(prompt, self._music_options(options), use_cache=use_cache)
+
+    def stream_music(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                     use_cache: bool = True) -> Iterator[bytes]:
+        """
+        Generate music based on a text prompt, yielding audio data as it arrives
+
+        Args:
+            prompt: Text description for music generation
+            options: Additional options for generation
+            use_cache: Whether previously generated music for the same request may be returned
+
+        Yields:
+            Chunks of binary audio data
+        """
+        return self.stream_audio(prompt, self._music_options(options), use_cache=use_cache)
+
+    def _music_options(self, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Apply music-specific defaults to generation options
+
+        Args:
+            options: Additional options for generation
+
+        Returns:
+            Options with music defaults applied
+        """
         # Default music-specific options
         music_options = {
             "type": "music",
@@ -139,8 +270,7 @@ class GrokClient:
         if options:
             music_options.update(options)
 
-        # Call the general audio generation method with music-specific options
-        return self.generate_audio(prompt, music_options)
+        return music_options
 
     def transcribe_audio(self, audio_data: bytes, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
@@ -0,0 +1,840 @@
+"""
+Job Queue for Audio Processor
+
+This module runs long generation and analysis requests as background jobs.
+Submitting a job returns its ID straight away; a pool of worker threads
+claims jobs from a broker and stores their results there for polling.
+
+Jobs are claimed by priority first, clamped to a small range on
+submission. Among users with jobs at the same priority, the user with the
+fewest running jobs goes first, then the one served least recently, so a
+burst from one user cannot starve the others.
+
+A claimed job holds a lease that its worker process renews while the job
+runs. If the process dies, the lease lapses and the next claim queues the
+job again; a job that has lost its worker MAX_ATTEMPTS times fails instead.
+
+The broker is selected with environment variables:
+
+    SOUNDSCAPE_JOB_BROKER      sqlite (default) or redis
+    SOUNDSCAPE_JOB_DB          SQLite database path (default: in-process)
+    SOUNDSCAPE_JOB_REDIS_URL   Redis URL (default: REDIS_URL or localhost)
+    SOUNDSCAPE_JOB_WORKERS     Number of worker threads
+    SOUNDSCAPE_JOB_RESULT_TTL  Seconds finished jobs are kept
+    SOUNDSCAPE_JOB_LEASE       Seconds a running job's lease lasts unrenewed
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+FINISHED_STATUSES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+DEFAULT_USER = "anonymous"
+
+# Submitted priorities are clamped to -MAX_PRIORITY..MAX_PRIORITY
+MAX_PRIORITY = 10
+
+# Claims of a job whose lease lapsed before it is failed rather than queued again
+MAX_ATTEMPTS = 3
+LOST_WORKER_ERROR = "The worker running this job stopped responding"
+
+class JobCancelled(Exception):
+    """Raised inside a handler when its job has been cancelled"""
+
+@dataclass
+class Job:
+    """A unit of background work and its outcome"""
+    id: str
+    kind: str
+    user_id: str = DEFAULT_USER
+    priority: int = 0
+    status: str = JOB_QUEUED
+    payload: Dict[str, Any] = field(default_factory=dict)
+    data: Optional[bytes] = None  # Binary input, e.g. an uploaded file
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    progress: Optional[float] = None
+    attempts: int = 0
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        """Whether the job has reached a final status"""
+        return self.status in FINISHED_STATUSES
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Describe the job for API responses
+
+        Returns:
+            Dictionary without the binary input
+        """
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "user_id": self.user_id,
+            "priority": self.priority,
+            "status": self.status,
+            "progress": self.progress,
+            "attempts": self.attempts,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+class JobBroker(ABC):
+    """Interface for job storage and claiming"""
+
+    @abstractmethod
+    def enqueue(self, job: Job) -> None:
+        """Store a new queued job"""
+
+    @abstractmethod
+    def claim(self, kinds: Sequence[str], lease: float) -> Optional[Job]:
+        """
+        Atomically take the next queued job of one of the given kinds and
+        mark it running, leased for lease seconds
+
+        Running jobs whose lease has lapsed are queued again first, or
+        failed once they have been claimed MAX_ATTEMPTS times.
+        """
+
+    @abstractmethod
+    def renew(self, job_ids: Sequence[str], lease: float) -> None:
+        """Extend the leases of running jobs to lease seconds from now"""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Job]:
+        """Get a job by ID"""
+
+    def get_status(self, job_id: str) -> Optional[str]:
+        """Get only the status of a job"""
+        job = self.get(job_id)
+        return job.status if job else None
+
+    @abstractmethod
+    def finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None) -> bool:
+        """Record the outcome of a running job; returns False if it is no longer running"""
+
+    @abstractmethod
+    def set_progress(self, job_id: str, progress: float) -> None:
+        """Record progress (0 to 1) of a running job"""
+
+    @abstractmethod
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued or running job; returns the job, or None if unknown"""
+
+    @abstractmethod
+    def list_jobs(self, user_id: str, limit: int = 50) -> List[Job]:
+        """List a user's most recent jobs"""
+
+    @abstractmethod
+    def purge(self, finished_before: float) -> int:
+        """Delete jobs that finished before the given time; returns the number removed"""
+
+class SQLiteJobBroker(JobBroker):
+    """
+    Broker backed by SQLite
+
+    With the default in-memory database the queue lives inside one process,
+    which is enough for local development. A database file can be shared
+    by several processes on one host.
+    """
+
+    _COLUMNS = ("id, kind, user_id, priority, status, payload, data, result, error, progress, attempts, "
+                "created_at, started_at, finished_at")
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT UNIQUE NOT NULL,
+                kind TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                data BLOB,
+                result TEXT,
+                error TEXT,
+                progress REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_until REAL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, kind, priority);
+            CREATE INDEX IF NOT EXISTS jobs_user ON jobs (user_id, status);
+            CREATE INDEX IF NOT EXISTS jobs_lease ON jobs (status, lease_until);
+            CREATE TABLE IF NOT EXISTS job_users (
+                user_id TEXT PRIMARY KEY,
+                last_served INTEGER NOT NULL
+            );
+        """)
+
+    def _row_to_job(self, row: Optional[tuple]) -> Optional[Job]:
+        if row is None:
+            return None
+
+        (job_id, kind, user_id, priority, status, payload, data, result, error, progress, attempts,
+         created_at, started_at, finished_at) = row
+        return Job(
+            id=job_id,
+            kind=kind,
+            user_id=user_id,
+            priority=priority,
+            status=status,
+            payload=json.loads(payload),
+            data=bytes(data) if data is not None else None,
+            result=json.loads(result) if result is not None else None,
+            error=error,
+            progress=progress,
+            attempts=attempts,
+            created_at=created_at,
+            started_at=started_at,
+            finished_at=finished_at
+        )
+
+    def enqueue(self, job: Job) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, user_id, priority, status, payload, data, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job.id, job.kind, job.user_id, job.priority, JOB_QUEUED,
+                 json.dumps(job.payload), job.data, job.created_at)
+            )
+
+    def _requeue_expired(self, now: float) -> None:
+        """Fail or queue again the running jobs whose lease has lapsed"""
+        failed = self._conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ?, data = NULL, lease_until = NULL "
+            "WHERE status = ? AND lease_until < ? AND attempts >= ?",
+            (JOB_FAILED, LOST_WORKER_ERROR, now, JOB_RUNNING, now, MAX_ATTEMPTS)
+        ).rowcount
+        requeued = self._conn.execute(
+            "UPDATE jobs SET status = ?, started_at = NULL, progress = NULL, lease_until = NULL "
+            "WHERE status = ? AND lease_until < ?",
+            (JOB_QUEUED, JOB_RUNNING, now)
+        ).rowcount
+        if failed or requeued:
+            logger.warning(f"Jobs whose worker stopped responding: {requeued} queued again, {failed} failed")
+
+    def claim(self, kinds: Sequence[str], lease: float) -> Optional[Job]:
+        if not kinds:
+            return None
+
+        placeholders = ",".join("?" * len(kinds))
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so processes sharing
+            # the database file cannot claim the same job
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                self._requeue_expired(now)
+
+                row = self._conn.execute(
+                    f"""
+                    SELECT j.seq, j.user_id FROM jobs j
+                    LEFT JOIN job_users u ON u.user_id = j.user_id
+                    WHERE j.status = ? AND j.kind IN ({placeholders})
+                    ORDER BY j.priority DESC,
+                             (SELECT COUNT(*) FROM jobs r
+                              WHERE r.user_id = j.user_id AND r.status = ?) ASC,
+                             COALESCE(u.last_served, 0) ASC,
+                             j.seq ASC
+                    LIMIT 1
+                    """,
+                    (JOB_QUEUED, *kinds, JOB_RUNNING)
+                ).fetchone()
+
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+
+                seq, user_id = row
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, started_at = ?, lease_until = ?, attempts = attempts + 1 "
+                    "WHERE seq = ?",
+                    (JOB_RUNNING, now, now + lease, seq)
+                )
+                self._conn.execute(
+                    "INSERT INTO job_users (user_id, last_served) "
+                    "VALUES (?, (SELECT COALESCE(MAX(last_served), 0) + 1 FROM job_users)) "
+                    "ON CONFLICT(user_id) DO UPDATE SET last_served = excluded.last_served",
+                    (user_id,)
+                )
+                job_row = self._conn.execute(
+                    f"SELECT {self._COLUMNS} FROM jobs WHERE seq = ?", (seq,)
+                ).fetchone()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        return self._row_to_job(job_row)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {self._COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row)
+
+    def get_status(self, job_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, data = NULL, "
+                "lease_until = NULL WHERE id = ? AND status = ?",
+                (status, json.dumps(result) if result is not None else None, error,
+                 time.time(), job_id, JOB_RUNNING)
+            )
+        return cursor.rowcount > 0
+
+    def renew(self, job_ids: Sequence[str], lease: float) -> None:
+        if not job_ids:
+            return
+
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET lease_until = ? WHERE status = ? AND id IN ({','.join('?' * len(job_ids))})",
+                (time.time() + lease, JOB_RUNNING, *job_ids)
+            )
+
+    def set_progress(self, job_id: str, progress: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET progress = ? WHERE id = ? AND status = ?",
+                (progress, job_id, JOB_RUNNING)
+            )
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, data = NULL, lease_until = NULL "
+                "WHERE id = ? AND status IN (?, ?)",
+                (JOB_CANCELLED, time.time(), job_id, JOB_QUEUED, JOB_RUNNING)
+            )
+            row = self._conn.execute(
+                f"SELECT {self._COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row)
+
+    def list_jobs(self, user_id: str, limit: int = 50) -> List[Job]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {self._COLUMNS} FROM jobs WHERE user_id = ? ORDER BY seq DESC LIMIT ?",
+                (user_id, limit)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def purge(self, finished_before: float) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?",
+                (finished_before,)
+            )
+        return cursor.rowcount
+
+class RedisJobBroker(JobBroker):
+    """
+    Broker backed by Redis, for queues shared by several services
+
+    Each job is a hash. Queued job IDs live in one sorted set per kind and
+    user, ordered by priority then submission order; a second sorted set
+    per kind records when each user was last served, and a third holds the
+    lease expiry of each running job. Claiming runs as a Lua script so it
+    is atomic across workers.
+    """
+
+    # Scores order jobs by priority (higher first), then submission order
+    _PRIORITY_SCALE = 1e12
+
+    _CLAIM_SCRIPT = """
+    local prefix = ARGV[1]
+    local now = ARGV[2]
+    local best_key, best_id, best_user, best_kind
+    local best_priority, best_running, best_served
+
+    -- Jobs whose worker stopped renewing the lease
+    local leases_key = prefix .. 'leases'
+    for _, job_id in ipairs(redis.call('ZRANGEBYSCORE', leases_key, '-inf', now)) do
+        redis.call('ZREM', leases_key, job_id)
+        local job_key = prefix .. 'job:' .. job_id
+        if redis.call('HGET', job_key, 'status') == 'running' then
+            local user = redis.call('HGET', job_key, 'user_id')
+            local kind = redis.call('HGET', job_key, 'kind')
+            redis.call('HINCRBY', prefix .. 'running', user, -1)
+            if (tonumber(redis.call('HGET', job_key, 'attempts')) or 0) >= tonumber(ARGV[4]) then
+                redis.call('HSET', job_key, 'status', 'failed', 'error', ARGV[5], 'finished_at', now)
+                redis.call('HDEL', job_key, 'data')
+                redis.call('EXPIRE', job_key, ARGV[6])
+            else
+                redis.call('HSET', job_key, 'status', 'queued')
+                redis.call('HDEL', job_key, 'started_at', 'progress')
+                local score = redis.call('HGET', job_key, 'score') or 0
+                redis.call('ZADD', prefix .. 'queue:' .. kind .. ':' .. user, score, job_id)
+                redis.call('ZADD', prefix .. 'users:' .. kind, 'NX', 0, user)
+            end
+        end
+    end
+
+    for i = 7, #ARGV do
+        local kind = ARGV[i]
+        local users_key = prefix .. 'users:' .. kind
+        local users = redis.call('ZRANGE', users_key, 0, -1, 'WITHSCORES')
+        for j = 1, #users, 2 do
+            local user = users[j]
+            local served = tonumber(users[j + 1])
+            local queue_key = prefix .. 'queue:' .. kind .. ':' .. user
+            local top = redis.call('ZRANGE', queue_key, 0, 0)
+            if #top == 0 then
+                redis.call('ZREM', users_key, user)
+            else
+                local priority = tonumber(redis.call('HGET', prefix .. 'job:' .. top[1], 'priority')) or 0
+                local running = tonumber(redis.call('HGET', prefix .. 'running', user)) or 0
+                local better = best_id == nil
+                    or priority > best_priority
+                    or (priority == best_priority and running < best_running)
+                    or (priority == best_priority and running == best_running and served < best_served)
+                if better then
+                    best_key, best_id, best_user, best_kind = queue_key, top[1], user, kind
+                    best_priority, best_running, best_served = priority, running, served
+                end
+            end
+        end
+    end
+
+    if best_id == nil then
+        return nil
+    end
+
+    redis.call('ZREM', best_key, best_id)
+    redis.call('HSET', prefix .. 'job:' .. best_id, 'status', 'running', 'started_at', now)
+    redis.call('HINCRBY', prefix .. 'job:' .. best_id, 'attempts', 1)
+    redis.call('ZADD', leases_key, tonumber(now) + tonumber(ARGV[3]), best_id)
+    redis.call('HINCRBY', prefix .. 'running', best_user, 1)
+    local counter = redis.call('INCR', prefix .. 'served')
+    redis.call('ZADD', prefix .. 'users:' .. best_kind, counter, best_user)
+    return best_id
+    """
+
+    # Moves a job out of the running state; only the first caller succeeds
+    _FINISH_SCRIPT = """
+    local job_key = KEYS[1]
+    local status = redis.call('HGET', job_key, 'status')
+    if status ~= 'running' and not (ARGV[6] == '1' and status == 'queued') then
+        return 0
+    end
+
+    local user = redis.call('HGET', job_key, 'user_id')
+    if status == 'running' then
+        redis.call('HINCRBY', KEYS[2], user, -1)
+    else
+        local kind = redis.call('HGET', job_key, 'kind')
+        redis.call('ZREM', ARGV[7] .. 'queue:' .. kind .. ':' .. user, ARGV[8])
+    end
+
+    redis.call('HSET', job_key, 'status', ARGV[1], 'result', ARGV[2], 'error', ARGV[3], 'finished_at', ARGV[4])
+    redis.call('HDEL', job_key, 'data')
+    redis.call('ZREM', ARGV[7] .. 'leases', ARGV[8])
+    redis.call('EXPIRE', job_key, ARGV[5])
+    return 1
+    """
+
+    def __init__(self, url: str, prefix: str = "jobs:", result_ttl: int = 24 * 3600):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.client.ping()
+        self.prefix = prefix
+        self.result_ttl = result_ttl
+        self._claim = self.client.register_script(self._CLAIM_SCRIPT)
+        self._finish = self.client.register_script(self._FINISH_SCRIPT)
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.prefix}job:{job_id}"
+
+    def _hash_to_job(self, job_id: str, values: Dict[bytes, bytes]) -> Optional[Job]:
+        if not values:
+            return None
+
+        def text(name: str) -> Optional[str]:
+            value = values.get(name.encode())
+            return value.decode() if value else None
+
+        def number(name: str) -> Optional[float]:
+            value = text(name)
+            return float(value) if value else None
+
+        result = text("result")
+        return Job(
+            id=job_id,
+            kind=text("kind"),
+            user_id=text("user_id"),
+            priority=int(text("priority") or 0),
+            status=text("status"),
+            payload=json.loads(text("payload") or "{}"),
+            data=values.get(b"data"),
+            result=json.loads(result) if result else None,
+            error=text("error"),
+            progress=number("progress"),
+            attempts=int(text("attempts") or 0),
+            created_at=number("created_at"),
+            started_at=number("started_at"),
+            finished_at=number("finished_at")
+        )
+
+    def enqueue(self, job: Job) -> None:
+        seq = self.client.incr(f"{self.prefix}seq")
+        score = seq - job.priority * self._PRIORITY_SCALE
+        mapping = {
+            "kind": job.kind,
+            "user_id": job.user_id,
+            "priority": job.priority,
+            "score": score,  # Queue position, kept for requeueing after a lapsed lease
+            "status": JOB_QUEUED,
+            "payload": json.dumps(job.payload),
+            "created_at": job.created_at
+        }
+        if job.data is not None:
+            mapping["data"] = job.data
+
+        pipe = self.client.pipeline()
+        pipe.hset(self._job_key(job.id), mapping=mapping)
+        pipe.zadd(f"{self.prefix}queue:{job.kind}:{job.user_id}", {job.id: score})
+        # New users start as least recently served
+        pipe.zadd(f"{self.prefix}users:{job.kind}", {job.user_id: 0}, nx=True)
+        pipe.lpush(f"{self.prefix}user:{job.user_id}", job.id)
+        pipe.ltrim(f"{self.prefix}user:{job.user_id}", 0, 999)
+        pipe.execute()
+
+    def claim(self, kinds: Sequence[str], lease: float) -> Optional[Job]:
+        if not kinds:
+            return None
+
+        job_id = self._claim(args=[self.prefix, time.time(), lease, MAX_ATTEMPTS, LOST_WORKER_ERROR,
+                                   self.result_ttl, *kinds])
+        if job_id is None:
+            return None
+        return self.get(job_id.decode())
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._hash_to_job(job_id, self.client.hgetall(self._job_key(job_id)))
+
+    def get_status(self, job_id: str) -> Optional[str]:
+        status = self.client.hget(self._job_key(job_id), "status")
+        return status.decode() if status else None
+
+    def _transition(self, job_id: str, status: str, result: Any, error: Optional[str],
+                    allow_queued: bool) -> bool:
+        return bool(self._finish(
+            keys=[self._job_key(job_id), f"{self.prefix}running"],
+            args=[status, json.dumps(result) if result is not None else "", error or "",
+                  time.time(), self.result_ttl, "1" if allow_queued else "0", self.prefix, job_id]
+        ))
+
+    def finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None) -> bool:
+        return self._transition(job_id, status, result, error, allow_queued=False)
+
+    def renew(self, job_ids: Sequence[str], lease: float) -> None:
+        if job_ids:
+            expiry = time.time() + lease
+            self.client.zadd(f"{self.prefix}leases", {job_id: expiry for job_id in job_ids}, xx=True)
+
+    def set_progress(self, job_id: str, progress: float) -> None:
+        self.client.hset(self._job_key(job_id), "progress", progress)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        self._transition(job_id, JOB_CANCELLED, None, None, allow_queued=True)
+        return self.get(job_id)
+
+    def list_jobs(self, user_id: str, limit: int = 50) -> List[Job]:
+        job_ids = self.client.lrange(f"{self.prefix}user:{user_id}", 0, limit - 1)
+        jobs = []
+        for job_id in job_ids:
+            job = self.get(job_id.decode())
+            if job:
+                jobs.append(job)
+        return jobs
+
+    def purge(self, finished_before: float) -> int:
+        # Finished jobs expire on their own
+        return 0
+
+class JobContext:
+    """Handle passed to job handlers for progress and cancellation"""
+
+    def __init__(self, job: Job, broker: JobBroker):
+        self.job = job
+        self._broker = broker
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the job has been cancelled"""
+        return self._broker.get_status(self.job.id) == JOB_CANCELLED
+
+    def raise_if_cancelled(self) -> None:
+        """
+        Stop the handler if its job has been cancelled
+
+        Raises:
+            JobCancelled: If the job has been cancelled
+        """
+        if self.cancelled:
+            raise JobCancelled(self.job.id)
+
+    def set_progress(self, progress: float) -> None:
+        """
+        Report progress
+
+        Args:
+            progress: Fraction completed, from 0 to 1
+        """
+        self._broker.set_progress(self.job.id, progress)
+
+JobHandler = Callable[[Job, JobContext], Any]
+
+class JobQueue:
+    """
+    Worker pool that runs jobs from a broker
+
+    Handlers are registered per job kind and return a JSON-serializable
+    result. Workers only claim kinds this process has handlers for, so
+    several services can share one broker.
+    """
+
+    def __init__(self, broker: JobBroker, workers: int = 4, poll_interval: float = 0.5,
+                 result_ttl: int = 24 * 3600, lease: float = 60.0):
+        self.broker = broker
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self.lease = lease
+
+        self._handlers: Dict[str, JobHandler] = {}
+        self._threads: List[threading.Thread] = []
+        self._active: Set[str] = set()  # Jobs running in this process, whose leases are renewed
+        self._active_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        self._last_purge = 0.0
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        """
+        Register the handler for a job kind
+
+        Args:
+            kind: Job kind (e.g., "generate")
+            handler: Function called with the job and its context
+        """
+        self._handlers[kind] = handler
+
+    def submit(self, kind: str, payload: Optional[Dict[str, Any]] = None,
+               user_id: Optional[str] = None, priority: int = 0,
+               data: Optional[bytes] = None) -> Job:
+        """
+        Queue a job
+
+        Args:
+            kind: Job kind; a handler must be registered for it
+            payload: JSON-serializable job arguments
+            user_id: Submitting user, used for fair scheduling
+            priority: Higher values run first; clamped to
+                -MAX_PRIORITY..MAX_PRIORITY
+            data: Optional binary input
+
+        Returns:
+            The queued job
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind: {kind}")
+
+        priority = max(-MAX_PRIORITY, min(int(priority), MAX_PRIORITY))
+        job = Job(
+            id=str(uuid.uuid4()),
+            kind=kind,
+            user_id=user_id or DEFAULT_USER,
+            priority=priority,
+            payload=payload or {},
+            data=data
+        )
+        self.broker.enqueue(job)
+        logger.info(f"Queued {kind} job {job.id} for {job.user_id} (priority {priority})")
+
+        self.start()
+        self._wakeup.set()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Get a job by ID"""
+        return self.broker.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancel a job
+
+        Queued jobs never run. Running jobs are marked cancelled at once and
+        their result is discarded; handlers that check their context stop
+        early.
+
+        Args:
+            job_id: Job ID
+
+        Returns:
+            The job after cancellation, or None if unknown
+        """
+        return self.broker.cancel(job_id)
+
+    def list_jobs(self, user_id: str, limit: int = 50) -> List[Job]:
+        """List a user's most recent jobs"""
+        return self.broker.list_jobs(user_id, limit)
+
+    def start(self) -> None:
+        """Start the worker threads and the lease renewal thread if they are not running"""
+        with self._start_lock:
+            if self._threads:
+                return
+
+            self._stopping.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._renew_loop, name="job-leases", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the worker threads after their current jobs"""
+        with self._start_lock:
+            self._stopping.set()
+            self._wakeup.set()
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+
+    def _worker_loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                job = self.broker.claim(list(self._handlers), self.lease)
+            except Exception as e:
+                logger.error(f"Error claiming job: {e}")
+                job = None
+
+            if job is None:
+                self._purge_expired()
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            with self._active_lock:
+                self._active.add(job.id)
+            try:
+                self._run(job)
+            finally:
+                with self._active_lock:
+                    self._active.discard(job.id)
+
+    def _renew_loop(self) -> None:
+        while not self._stopping.wait(self.lease / 3):
+            with self._active_lock:
+                job_ids = list(self._active)
+            if not job_ids:
+                continue
+            try:
+                self.broker.renew(job_ids, self.lease)
+            except Exception as e:
+                logger.error(f"Error renewing job leases: {e}")
+
+    def _run(self, job: Job) -> None:
+        logger.info(f"Running {job.kind} job {job.id}")
+        context = JobContext(job, self.broker)
+
+        try:
+            result = self._handlers[job.kind](job, context)
+            finished = self.broker.finish(job.id, JOB_COMPLETED, result=result)
+        except JobCancelled:
+            finished = False
+        except Exception as e:
+            logger.error(f"Error in {job.kind} job {job.id}: {e}")
+            finished = self.broker.finish(job.id, JOB_FAILED, error=str(e))
+
+        if not finished:
+            logger.info(f"{job.kind} job {job.id} was cancelled")
+
+    def _purge_expired(self) -> None:
+        now = time.time()
+        if now - self._last_purge < 60:
+            return
+
+        self._last_purge = now
+        try:
+            removed = self.broker.purge(now - self.result_ttl)
+            if removed:
+                logger.info(f"Purged {removed} finished jobs")
+        except Exception as e:
+            logger.error(f"Error purging finished jobs: {e}")
+
+def create_job_queue() -> JobQueue:
+    """
+    Create the job queue configured by environment variables
+
+    Falls back to an in-process SQLite broker if Redis is not available.
+
+    Returns:
+        JobQueue instance
+    """
+    broker_name = os.environ.get("SOUNDSCAPE_JOB_BROKER", "sqlite").lower()
+    workers = int(os.environ.get("SOUNDSCAPE_JOB_WORKERS", 4))
+    result_ttl = int(os.environ.get("SOUNDSCAPE_JOB_RESULT_TTL", 24 * 3600))
+    lease = float(os.environ.get("SOUNDSCAPE_JOB_LEASE", 60))
+
+    broker: JobBroker
+    try:
+        if broker_name == "redis":
+            url = os.environ.get("SOUNDSCAPE_JOB_REDIS_URL", os.environ.get("REDIS_URL", "redis://localhost:6379/0"))
+            broker = RedisJobBroker(url, result_ttl=result_ttl)
+        else:
+            broker = SQLiteJobBroker(os.environ.get("SOUNDSCAPE_JOB_DB", ":memory:"))
+    except Exception as e:
+        logger.warning(f"Job broker '{broker_name}' not available, using in-process SQLite: {e}")
+        broker = SQLiteJobBroker()
+
+    logger.info(f"Job queue using {type(broker).__name__} with {workers} workers")
+    return JobQueue(broker, workers=workers, result_ttl=result_ttl, lease=lease)
+
+# Create a singleton instance
+job_queue = create_job_queue()
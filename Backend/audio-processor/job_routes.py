@@ -0,0 +1,187 @@
+"""
+Job Status Routes for Audio Processor
+
+Shared FastAPI routes for following background jobs from the job queue,
+by polling or over a websocket. Services that submit jobs include this
+router in their app, which also starts the queue's workers with the app.
+
+Callers are identified by the access token the API gateway forwards
+(Authorization: Bearer, or a token query parameter for websockets),
+verified with JWT_SECRET. Users only see and cancel their own jobs, and
+only admins may submit jobs with a priority above 0. Without JWT_SECRET
+every request is refused, unless SOUNDSCAPE_JOBS_ALLOW_ANONYMOUS is set
+for local development, in which case every caller is the anonymous user.
+"""
+
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import jwt
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, WebSocket, WebSocketDisconnect
+
+from job_queue import DEFAULT_USER, Job, job_queue
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+# Seconds between status checks for websocket subscribers
+WEBSOCKET_POLL_INTERVAL = 0.5
+
+# Seconds the workers get to finish their current jobs on shutdown; jobs
+# still running are queued again once their lease lapses
+SHUTDOWN_TIMEOUT = 5.0
+
+# Treat every caller as the anonymous user when JWT_SECRET is unset
+ALLOW_ANONYMOUS = os.environ.get("SOUNDSCAPE_JOBS_ALLOW_ANONYMOUS", "false").lower() == "true"
+
+@dataclass(frozen=True)
+class JobUser:
+    """The authenticated caller of a job route"""
+    id: str
+    admin: bool = False
+
+def authenticate(token: Optional[str]) -> JobUser:
+    """
+    Identify the caller from an access token
+
+    Raises:
+        HTTPException: 401 if the token is missing or invalid, 503 if
+            JWT_SECRET is unset and anonymous jobs are not allowed
+    """
+    secret = os.environ.get("JWT_SECRET")
+    if not secret:
+        if ALLOW_ANONYMOUS:
+            return JobUser(DEFAULT_USER)
+        logger.error("JWT_SECRET is not set; rejecting job request "
+                     "(set SOUNDSCAPE_JOBS_ALLOW_ANONYMOUS=true for local development)")
+        raise HTTPException(status_code=503, detail="Job authentication is not configured")
+    if not token:
+        raise HTTPException(status_code=401, detail="Authentication required")
+
+    try:
+        claims = jwt.decode(token, secret, algorithms=["HS256"])
+    except jwt.InvalidTokenError as e:
+        raise HTTPException(status_code=401, detail=f"Invalid token: {e}")
+
+    user_id = claims.get("userId", claims.get("sub"))
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Token does not name a user")
+    return JobUser(str(user_id), admin=claims.get("role") == "admin")
+
+def get_job_user(authorization: Optional[str] = Header(None)) -> JobUser:
+    """FastAPI dependency for the authenticated caller"""
+    token = None
+    if authorization and authorization.startswith("Bearer "):
+        token = authorization[len("Bearer "):]
+    return authenticate(token)
+
+def check_priority(priority: int, user: JobUser) -> int:
+    """
+    Priority the caller may submit with
+
+    Raises:
+        HTTPException: 403 if a non-admin asks for a priority above 0
+    """
+    if priority > 0 and not user.admin:
+        raise HTTPException(status_code=403, detail="Only admins can submit jobs with a priority above 0")
+    return priority
+
+def _owned(job: Optional[Job], user: JobUser) -> bool:
+    return job is not None and (user.admin or job.user_id == user.id)
+
+@router.on_event("startup")
+def start_workers():
+    if not os.environ.get("JWT_SECRET"):
+        if ALLOW_ANONYMOUS:
+            logger.warning("JWT_SECRET is not set: every job caller is the anonymous user")
+        else:
+            logger.error("JWT_SECRET is not set: job requests will be refused")
+    job_queue.start()
+
+@router.on_event("shutdown")
+def stop_workers():
+    job_queue.stop(SHUTDOWN_TIMEOUT)
+
+@router.get("")
+async def list_jobs(
+    user: JobUser = Depends(get_job_user),
+    limit: int = Query(50, ge=1, le=200)
+):
+    """
+    List the calling user's most recent jobs
+    """
+    jobs = await asyncio.to_thread(job_queue.list_jobs, user.id, limit)
+    return {"jobs": [job.to_dict() for job in jobs]}
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, user: JobUser = Depends(get_job_user)):
+    """
+    Get the status, progress and result of one of the caller's jobs
+    """
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if not _owned(job, user):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return job.to_dict()
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str, user: JobUser = Depends(get_job_user)):
+    """
+    Cancel one of the caller's queued or running jobs
+    """
+    if not _owned(await asyncio.to_thread(job_queue.get, job_id), user):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    job = await asyncio.to_thread(job_queue.cancel, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return job.to_dict()
+
+@router.websocket("/{job_id}/ws")
+async def job_updates(websocket: WebSocket, job_id: str, token: Optional[str] = Query(None)):
+    """
+    Send the job's status whenever it changes, closing once it has finished
+
+    Browsers cannot set headers on websockets, so the access token may be
+    passed as the token query parameter instead.
+    """
+    authorization = websocket.headers.get("authorization", "")
+    if token is None and authorization.startswith("Bearer "):
+        token = authorization[len("Bearer "):]
+    try:
+        user = authenticate(token)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+
+    await websocket.accept()
+
+    last_state = None
+    try:
+        while True:
+            job = await asyncio.to_thread(job_queue.get, job_id)
+            if not _owned(job, user):
+                await websocket.send_json({"job_id": job_id, "error": "Job not found"})
+                break
+
+            state = (job.status, job.progress)
+            if state != last_state:
+                await websocket.send_json(job.to_dict())
+                last_state = state
+
+            if job.finished:
+                break
+
+            await asyncio.sleep(WEBSOCKET_POLL_INTERVAL)
+
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Error sending updates for job {job_id}: {e}")
+        await websocket.close(code=1011, reason=str(e))
@@ -1,15 +1,16 @@
 import os
 import logging
-import tempfile
-import wave
-import numpy as np
+import threading
 import uuid
-import matplotlib.pyplot as plt
-from io import BytesIO
-from typing import Dict, Any, Optional, BinaryIO, Union, List
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, Optional, BinaryIO, Union, List, Tuple
 
 from grok_client import grok_client
 from gemini_client import gemini_client
+from supabase_storage import supabase_storage
+from wav_io import parse_wav
+from waveform_renderer import waveform_renderer
 
 logger = logging.getLogger(__name__)
 
@@ -18,9 +19,19 @@ class MusicProcessor:
     Service for generating music using the Grok and Gemini AI APIs
     with Supabase storage integration
     """
+    # Number of waveform job statuses kept for polling
+    MAX_WAVEFORM_JOBS = 1000
+    
     def __init__(self):
         self.grok_client = grok_client
         self.gemini_client = gemini_client
+        self.storage = supabase_storage
+        
+        # Waveform images are rendered and uploaded in the background so
+        # generation requests only wait on the audio itself
+        self._waveform_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="waveform")
+        self._waveform_jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._waveform_lock = threading.Lock()
     
     async def generate_music(self, 
                            prompt: str, 
@@ -31,7 +42,8 @@ class MusicProcessor:
                            instruments: Optional[List[str]] = None,
                            duration: Optional[int] = None,
                            save_to_library: bool = True,
-                           filename: Optional[str] = None) -> Dict[str, Any]:
+                           filename: Optional[str] = None,
+                           use_cache: bool = True) -> Dict[str, Any]:
         """
         Generate music based on a text prompt and additional parameters
         
@@ -45,6 +57,7 @@ class MusicProcessor:
             duration: Duration in seconds
             save_to_library: Whether to save the generated music to the user's library
             filename: Optional filename for the saved music
+            use_cache: Whether previously generated music for the same request may be returned
             
         Returns:
             Dictionary with generated music data and metadata
@@ -53,25 +66,15 @@ class MusicProcessor:
             logger.info(f"Generating music with {model} model: {prompt}")
             
             # Prepare options based on provided parameters
-            options = {}
-            if genre:
-                options["genre"] = genre
-            if mood:
-                options["mood"] = mood
-            if tempo:
-                options["tempo"] = tempo
-            if instruments:
-                options["instruments"] = instruments
-            if duration:
-                options["duration"] = duration
+            options = self._build_options(genre, mood, tempo, instruments, duration)
             
             # Generate music using the appropriate model
             if model.lower() == "grok":
-                audio_data = self.grok_client.generate_music(prompt, options)
+                audio_data = self.grok_client.generate_music(prompt, options, use_cache=use_cache)
             else:
                 # For Gemini, we'd use a different approach
                 # This is a placeholder as Gemini might have a different API
-                audio_data = self.gemini_client.generate_audio(prompt, options)
+                audio_data = self.gemini_client.generate_audio(prompt, options, use_cache=use_cache)
             
             # Create response with metadata
             response = {
@@ -91,18 +94,16 @@ class MusicProcessor:
             # Generate a unique filename if not provided
             if save_to_library:
                 if not filename:
-                    file_uuid = str(uuid.uuid4())
-                    sanitized_prompt = prompt.replace(" ", "_")[:30]  # Use part of prompt in filename
-                    filename = f"{sanitized_prompt}_{file_uuid}.wav"
+                    filename = self._library_filename(prompt)
                 
                 # In a real implementation, this would save to Supabase or another storage service
                 # For now, we'll just include the filename in the response
                 response["filename"] = filename
                 
-                # Generate and save waveform visualization
-                waveform_image = self.generate_waveform_image(audio_data)
+                # Render and upload the waveform visualization in the background
                 waveform_filename = f"{os.path.splitext(filename)[0]}_waveform.png"
                 response["waveform_filename"] = waveform_filename
+                response["waveform"] = self.schedule_waveform(audio_data, waveform_filename)
             
             # Include the audio data in the response
             response["audio_data"] = audio_data
@@ -113,66 +114,220 @@ class MusicProcessor:
             logger.error(f"Error generating music: {str(e)}")
             raise
     
-    def generate_waveform_image(self, audio_data: bytes) -> bytes:
+    def stream_music(self,
+                     prompt: str,
+                     model: str = "grok",
+                     genre: Optional[str] = None,
+                     mood: Optional[str] = None,
+                     tempo: Optional[int] = None,
+                     instruments: Optional[List[str]] = None,
+                     duration: Optional[int] = None,
+                     save_to_library: bool = True,
+                     filename: Optional[str] = None,
+                     use_cache: bool = True) -> Tuple[Dict[str, Any], Iterator[bytes]]:
         """
-        Generate a waveform visualization image from audio data
+        Generate music based on a text prompt, streaming audio as it is produced
+        
+        Metadata that is known before generation is returned straight away.
+        When saving to the library, the waveform job is registered as pending
+        immediately; once the last chunk has been yielded the audio is
+        uploaded under the returned filename and the waveform rendered. A
+        stream that fails or is closed early marks the waveform job failed.
         
         Args:
-            audio_data: Binary audio data
+            prompt: Text description of the music to generate
+            model: AI model to use ("grok" or "gemini")
+            genre: Music genre (e.g., "ambient", "electronic", "classical")
+            mood: Emotional mood (e.g., "relaxed", "energetic", "melancholic")
+            tempo: Beats per minute
+            instruments: List of instruments to include
+            duration: Duration in seconds
+            save_to_library: Whether to save the generated music to the user's library
+            filename: Optional filename for the saved music
+            use_cache: Whether previously generated music for the same request may be returned
             
         Returns:
-            PNG image data as bytes
+            Tuple of (metadata dictionary, iterator over WAV data chunks)
         """
-        try:
-            # Create a temporary file to write the audio data
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
-                temp_file.write(audio_data)
-                temp_file_path = temp_file.name
-            
-            # Read the audio file
-            with wave.open(temp_file_path, 'rb') as wav_file:
-                # Get audio parameters
-                n_channels = wav_file.getnchannels()
-                sample_width = wav_file.getsampwidth()
-                framerate = wav_file.getframerate()
-                n_frames = wav_file.getnframes()
-                
-                # Read all frames
-                frames = wav_file.readframes(n_frames)
-            
-            # Convert to numpy array
-            if sample_width == 1:
-                dtype = np.uint8
-            elif sample_width == 2:
-                dtype = np.int16
+        logger.info(f"Streaming music with {model} model: {prompt}")
+        
+        options = self._build_options(genre, mood, tempo, instruments, duration)
+        
+        metadata = {
+            "format": "wav",
+            "duration": duration or 60,  # Default to 60 seconds if not specified
+            "model": model,
+            "prompt": prompt,
+            "parameters": {
+                "genre": genre,
+                "mood": mood,
+                "tempo": tempo,
+                "instruments": instruments
+            }
+        }
+        
+        waveform_filename = None
+        if save_to_library:
+            filename = filename or self._library_filename(prompt)
+            waveform_filename = f"{os.path.splitext(filename)[0]}_waveform.png"
+            metadata["filename"] = filename
+            metadata["waveform_filename"] = waveform_filename
+            metadata["waveform"] = self._register_waveform_job(waveform_filename)
+        
+        def stream() -> Iterator[bytes]:
+            if model.lower() == "grok":
+                chunks_source = self.grok_client.stream_music(prompt, options, use_cache=use_cache)
             else:
-                dtype = np.int32
-                
-            audio_array = np.frombuffer(frames, dtype=dtype)
+                chunks_source = self.gemini_client.stream_audio(prompt, options, use_cache=use_cache)
             
-            # If stereo, take the average of both channels
-            if n_channels == 2:
-                audio_array = audio_array.reshape(-1, 2).mean(axis=1)
+            chunks = []
+            try:
+                for chunk in chunks_source:
+                    if waveform_filename:
+                        chunks.append(chunk)
+                    yield chunk
+            except GeneratorExit:
+                # The client went away before the last chunk
+                chunks_source.close()
+                if waveform_filename:
+                    self._update_waveform_job(waveform_filename, {
+                        "status": "failed",
+                        "error": "Stream closed before the audio was complete"
+                    })
+                raise
+            except Exception as e:
+                logger.error(f"Error streaming music: {str(e)}")
+                if waveform_filename:
+                    self._update_waveform_job(waveform_filename, {"status": "failed", "error": str(e)})
+                raise
             
-            # Normalize
-            audio_array = audio_array / np.max(np.abs(audio_array))
+            if waveform_filename:
+                self._waveform_executor.submit(self._run_library_job, b"".join(chunks), filename, waveform_filename)
+        
+        return metadata, stream()
+    
+    def _build_options(self, genre: Optional[str], mood: Optional[str], tempo: Optional[int],
+                       instruments: Optional[List[str]], duration: Optional[int]) -> Dict[str, Any]:
+        """Collect the generation options that were provided"""
+        options = {}
+        if genre:
+            options["genre"] = genre
+        if mood:
+            options["mood"] = mood
+        if tempo:
+            options["tempo"] = tempo
+        if instruments:
+            options["instruments"] = instruments
+        if duration:
+            options["duration"] = duration
+        return options
+    
+    def _library_filename(self, prompt: str) -> str:
+        """Create a unique library filename that includes part of the prompt"""
+        file_uuid = str(uuid.uuid4())
+        sanitized_prompt = prompt.replace(" ", "_")[:30]  # Use part of prompt in filename
+        return f"{sanitized_prompt}_{file_uuid}.wav"
+    
+    def schedule_waveform(self, audio_data: bytes, waveform_filename: str) -> Dict[str, Any]:
+        """
+        Queue a background job that renders and uploads a waveform image
+        
+        Args:
+            audio_data: Binary audio data
+            waveform_filename: Filename for the uploaded image
             
-            # Create the plot
-            plt.figure(figsize=(10, 3))
-            plt.plot(np.linspace(0, len(audio_array) / framerate, len(audio_array)), audio_array, color='#4f46e5')
-            plt.axis('off')
-            plt.tight_layout()
+        Returns:
+            Initial job status, including the URL the image will be served from
+        """
+        status = self._register_waveform_job(waveform_filename)
+        self._waveform_executor.submit(self._run_waveform_job, audio_data, waveform_filename)
+        return status
+    
+    def _register_waveform_job(self, waveform_filename: str) -> Dict[str, Any]:
+        """Record a pending waveform job and return its initial status"""
+        status = {
+            "status": "pending",
+            "filename": waveform_filename,
+            "url": self.storage.get_waveform_url(waveform_filename)
+        }
+        
+        with self._waveform_lock:
+            self._waveform_jobs[waveform_filename] = status
+            while len(self._waveform_jobs) > self.MAX_WAVEFORM_JOBS:
+                self._waveform_jobs.popitem(last=False)
+        
+        return dict(status)
+    
+    def _update_waveform_job(self, waveform_filename: str, update: Dict[str, Any]) -> None:
+        """Merge an update into a known waveform job's status"""
+        with self._waveform_lock:
+            if waveform_filename in self._waveform_jobs:
+                self._waveform_jobs[waveform_filename].update(update)
+    
+    def get_waveform_status(self, waveform_filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the status of a background waveform job
+        
+        Args:
+            waveform_filename: Filename the image is uploaded under
             
-            # Save to BytesIO
-            buf = BytesIO()
-            plt.savefig(buf, format='png', dpi=100, bbox_inches='tight', pad_inches=0)
-            plt.close()
-            buf.seek(0)
+        Returns:
+            Job status ("pending", "completed" or "failed"), or None if unknown
+        """
+        with self._waveform_lock:
+            status = self._waveform_jobs.get(waveform_filename)
+            return dict(status) if status else None
+    
+    def _run_library_job(self, audio_data: bytes, filename: str, waveform_filename: str) -> None:
+        """Upload streamed audio to the library, then render its waveform"""
+        try:
+            self.storage.upload_audio(audio_data, filename)
+        except Exception as e:
+            logger.error(f"Error saving {filename} to the library: {str(e)}")
+            self._update_waveform_job(waveform_filename, {"status": "failed", "error": str(e)})
+            return
+        
+        self._run_waveform_job(audio_data, waveform_filename)
+    
+    def _run_waveform_job(self, audio_data: bytes, waveform_filename: str) -> None:
+        """Render and upload a waveform image, recording the outcome"""
+        try:
+            waveform_image = self.generate_waveform_image(audio_data)
+            upload_result = self.storage.upload_waveform(waveform_image, waveform_filename)
+            update = {"status": "completed", "url": upload_result["public_url"]}
+        except Exception as e:
+            logger.error(f"Error in waveform job for {waveform_filename}: {str(e)}")
+            update = {"status": "failed", "error": str(e)}
+        
+        self._update_waveform_job(waveform_filename, update)
+    
+    def generate_waveform_image(self, audio_data: bytes, width: int = 1000, height: int = 300,
+                                color: str = '#4f46e5', background: str = 'transparent') -> bytes:
+        """
+        Generate a waveform visualization image from audio data
+        
+        Args:
+            audio_data: Binary audio data
+            width: Image width in pixels
+            height: Image height in pixels
+            color: Waveform color (hex code)
+            background: Background color (hex code or 'transparent')
             
-            # Clean up the temporary file
-            os.unlink(temp_file_path)
+        Returns:
+            PNG image data as bytes
+        """
+        try:
+            # Parse the WAV header and view the samples in place
+            wav = parse_wav(audio_data)
             
-            return buf.getvalue()
+            # Render the waveform (normalized to the peak amplitude)
+            return waveform_renderer.render(
+                wav.samples,
+                width=width,
+                height=height,
+                color=color,
+                background=background
+            )
             
         except Exception as e:
             logger.error(f"Error generating waveform image: {str(e)}")
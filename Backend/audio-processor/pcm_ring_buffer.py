@@ -0,0 +1,180 @@
+"""
+PCM Ring Buffer for Audio Processor
+
+This module buffers streamed audio in a fixed-size float32 ring. Samples
+are read as overlapping analysis frames that advance by a hop, and each
+frame is a zero-copy view into the ring: the first frame_length - 1
+samples are mirrored past the end, so a frame that wraps around is still
+contiguous in memory.
+
+The buffer is meant for one producer and one consumer on the same event
+loop or thread. Data under the current read position is never
+overwritten; when the ring is full, writes accept only what fits and the
+caller decides whether to wait or drop the rest.
+"""
+
+import logging
+from typing import Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PCM16_SCALE = 1.0 / 32768.0
+
+class PCMRingBuffer:
+    """Fixed-capacity float32 ring buffer read as overlapping frames"""
+
+    def __init__(self, capacity: int, frame_length: int = 2048, hop_length: int = 512):
+        """
+        Args:
+            capacity: Maximum number of buffered samples
+            frame_length: Samples per analysis frame
+            hop_length: Samples the read position advances per frame
+        """
+        if frame_length < 1 or not 0 < hop_length <= frame_length:
+            raise ValueError("hop_length must be between 1 and frame_length")
+        if capacity < frame_length:
+            raise ValueError("capacity must be at least frame_length")
+
+        self.capacity = capacity
+        self.frame_length = frame_length
+        self.hop_length = hop_length
+
+        self._buffer = np.zeros(capacity + frame_length - 1, dtype=np.float32)
+        self._read = 0  # Total samples consumed
+        self._write = 0  # Total samples written
+        self._partial = b""  # Trailing byte of an incomplete 16-bit sample
+
+    @property
+    def available(self) -> int:
+        """Number of buffered samples not yet consumed"""
+        return self._write - self._read
+
+    @property
+    def free(self) -> int:
+        """Number of samples that can be written without waiting"""
+        return self.capacity - self.available
+
+    @property
+    def frames_ready(self) -> int:
+        """Number of complete frames that can be read"""
+        if self.available < self.frame_length:
+            return 0
+        return (self.available - self.frame_length) // self.hop_length + 1
+
+    @property
+    def position(self) -> int:
+        """Stream offset, in samples, of the next frame"""
+        return self._read
+
+    def write(self, samples: np.ndarray, scale: float = 1.0) -> int:
+        """
+        Append samples, converting them to float32
+
+        Args:
+            samples: 1-D array of samples
+            scale: Factor applied while copying (e.g., PCM16_SCALE)
+
+        Returns:
+            Number of samples written, which is less than len(samples) if
+            the buffer filled up
+        """
+        n = min(len(samples), self.free)
+        start = self._write % self.capacity
+        first = min(n, self.capacity - start)
+
+        self._copy_in(start, samples[:first], scale)
+        self._copy_in(0, samples[first:n], scale)
+
+        self._write += n
+        return n
+
+    def _copy_in(self, start: int, samples: np.ndarray, scale: float) -> None:
+        if not len(samples):
+            return
+
+        end = start + len(samples)
+        np.multiply(samples, scale, out=self._buffer[start:end], casting='unsafe')
+
+        # Mirror the head of the ring past its end, so frames that wrap
+        # around can be returned as one contiguous view
+        mirror_end = min(end, self.frame_length - 1)
+        if start < mirror_end:
+            self._buffer[self.capacity + start:self.capacity + mirror_end] = self._buffer[start:mirror_end]
+
+    def write_pcm16(self, data: Union[bytes, bytearray, memoryview]) -> int:
+        """
+        Append little-endian 16-bit PCM bytes
+
+        A trailing odd byte is held until the next call, so messages do not
+        need to be aligned to sample boundaries.
+
+        Args:
+            data: PCM bytes
+
+        Returns:
+            Number of bytes of data consumed
+        """
+        consumed = 0
+        if self._partial and len(data):
+            if self.free < 1:
+                return 0
+            joined = self._partial + bytes(data[:1])
+            self.write(np.frombuffer(joined, dtype='<i2'), PCM16_SCALE)
+            self._partial = b""
+            consumed = 1
+
+        body = memoryview(data)[consumed:]
+        n_samples = len(body) // 2
+        written = self.write(np.frombuffer(body, dtype='<i2', count=n_samples), PCM16_SCALE)
+        consumed += written * 2
+
+        # Keep a trailing odd byte only once everything before it fit
+        if written == n_samples and len(body) % 2:
+            self._partial = bytes(body[-1:])
+            consumed += 1
+
+        return consumed
+
+    def peek_frame(self, index: int = 0) -> np.ndarray:
+        """
+        Get a buffered frame without consuming it
+
+        The result is a read-only view into the ring. It stays valid until
+        the samples are consumed with advance().
+
+        Args:
+            index: Frame number relative to the read position, each frame
+                starting hop_length samples after the previous one
+
+        Returns:
+            float32 array of frame_length samples
+
+        Raises:
+            ValueError: If the frame is not completely buffered
+        """
+        if not 0 <= index < self.frames_ready:
+            raise ValueError("Not enough buffered samples for the frame")
+
+        start = (self._read + index * self.hop_length) % self.capacity
+        frame = self._buffer[start:start + self.frame_length]
+        frame.flags.writeable = False
+        return frame
+
+    def advance(self, n: int = None) -> None:
+        """
+        Consume samples, making room for new writes
+
+        Args:
+            n: Number of samples to consume (default: hop_length)
+        """
+        n = self.hop_length if n is None else n
+        if not 0 <= n <= self.available:
+            raise ValueError("Cannot advance past the buffered samples")
+        self._read += n
+
+    def clear(self) -> None:
+        """Discard all buffered samples"""
+        self._read = self._write
+        self._partial = b""
@@ -1,15 +1,13 @@
 import os
 import logging
-import tempfile
-import wave
-import numpy as np
 import uuid
-import matplotlib.pyplot as plt
-from io import BytesIO
-from typing import Dict, Any, Optional, BinaryIO, Union
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, Optional, BinaryIO, Union
 
 from grok_client import grok_client
 from supabase_storage import supabase_storage
+from wav_io import parse_wav
+from waveform_renderer import waveform_renderer
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +20,10 @@ class AudioProcessor:
         self.grok_client = grok_client
         self.storage = supabase_storage
         
+        # Streamed generations are saved once the stream has finished,
+        # without holding the response open
+        self._save_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="audio-save")
+        
     def process_file(self, audio_file: Union[str, BinaryIO, bytes], 
                     analyze: bool = True, 
                     transcribe: bool = False,
@@ -86,7 +88,8 @@ class AudioProcessor:
         return results
     
     def generate_audio(self, prompt: str, options: Optional[Dict[str, Any]] = None,
-                     save_to_supabase: bool = True, filename: Optional[str] = None) -> Dict[str, Any]:
+                     save_to_supabase: bool = True, filename: Optional[str] = None,
+                     use_cache: bool = True) -> Dict[str, Any]:
         """
         Generate audio based on a text prompt and optionally save to Supabase
         
@@ -95,13 +98,14 @@ class AudioProcessor:
             options: Additional options for generation
             save_to_supabase: Whether to save the file to Supabase storage
             filename: Custom filename (default is a UUID)
+            use_cache: Whether previously generated audio for the same request may be returned
             
         Returns:
             Dictionary with generated audio data and storage info
         """
         try:
             # Generate the audio
-            audio_data = self.grok_client.generate_audio(prompt, options)
+            audio_data = self.grok_client.generate_audio(prompt, options, use_cache=use_cache)
             
             results = {
                 'size': len(audio_data)
@@ -109,19 +113,7 @@ class AudioProcessor:
             
             # Save to Supabase if requested
             if save_to_supabase:
-                # Generate a unique filename if not provided
-                if not filename:
-                    file_uuid = str(uuid.uuid4())
-                    filename = f"generated_{file_uuid}.wav"
-                
-                upload_result = self.storage.upload_audio(audio_data, filename)
-                results['storage'] = upload_result
-                
-                # Generate and save waveform image
-                waveform_image = self.generate_waveform_image(audio_data)
-                waveform_filename = f"{os.path.splitext(filename)[0]}_waveform.png"
-                waveform_result = self.storage.upload_waveform(waveform_image, waveform_filename)
-                results['waveform'] = waveform_result
+                results.update(self.save_generated_audio(audio_data, filename or self.generated_filename()))
             
             # Include the raw audio data in the results
             results['audio_data'] = audio_data
@@ -131,6 +123,80 @@ class AudioProcessor:
             logger.error(f"Error during audio generation: {e}")
             raise
     
+    def stream_audio(self, prompt: str, options: Optional[Dict[str, Any]] = None,
+                     save_to_supabase: bool = True, filename: Optional[str] = None,
+                     use_cache: bool = True) -> Iterator[bytes]:
+        """
+        Generate audio based on a text prompt, yielding chunks as they arrive
+        
+        When saving is requested, the chunks are collected and the complete
+        audio is uploaded in the background after the last chunk.
+        
+        Args:
+            prompt: Text description for audio generation
+            options: Additional options for generation
+            save_to_supabase: Whether to save the file to Supabase storage
+            filename: Custom filename (default is a UUID)
+            use_cache: Whether previously generated audio for the same request may be returned
+            
+        Yields:
+            Chunks of binary audio data
+        """
+        chunks = []
+        
+        try:
+            for chunk in self.grok_client.stream_audio(prompt, options, use_cache=use_cache):
+                if save_to_supabase:
+                    chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            logger.error(f"Error during audio streaming: {e}")
+            raise
+        
+        if save_to_supabase:
+            self._save_executor.submit(
+                self.save_generated_audio,
+                b"".join(chunks),
+                filename or self.generated_filename()
+            )
+    
+    def generated_filename(self) -> str:
+        """
+        Create a unique filename for generated audio
+        
+        Returns:
+            Filename string
+        """
+        return f"generated_{uuid.uuid4()}.wav"
+    
+    def save_generated_audio(self, audio_data: bytes, filename: str) -> Dict[str, Any]:
+        """
+        Upload generated audio and its waveform image to Supabase
+        
+        Args:
+            audio_data: Binary audio data
+            filename: Filename to store the audio under
+            
+        Returns:
+            Dictionary with storage and waveform upload info
+        """
+        try:
+            results = {}
+            
+            upload_result = self.storage.upload_audio(audio_data, filename)
+            results['storage'] = upload_result
+            
+            # Generate and save waveform image
+            waveform_image = self.generate_waveform_image(audio_data)
+            waveform_filename = f"{os.path.splitext(filename)[0]}_waveform.png"
+            waveform_result = self.storage.upload_waveform(waveform_image, waveform_filename)
+            results['waveform'] = waveform_result
+            
+            return results
+        except Exception as e:
+            logger.error(f"Error saving generated audio {filename}: {e}")
+            raise
+    
     def _load_audio_data(self, audio_source: Union[str, BinaryIO, bytes]) -> bytes:
         """
         Load audio data from various sources
@@ -153,59 +219,32 @@ class AudioProcessor:
         # Otherwise, assume file-like object
         return audio_source.read()
 
-    def generate_waveform_image(self, audio_data: bytes) -> bytes:
+    def generate_waveform_image(self, audio_data: bytes, width: int = 1000, height: int = 300,
+                                color: str = '#3498db', background: str = 'transparent') -> bytes:
         """
         Generate a waveform visualization image from audio data
         
         Args:
             audio_data: Binary audio data
+            width: Image width in pixels
+            height: Image height in pixels
+            color: Waveform color (hex code)
+            background: Background color (hex code or 'transparent')
             
         Returns:
             PNG image data as bytes
         """
         try:
-            # Create a temporary file to read the wave data
-            with tempfile.NamedTemporaryFile(suffix='.wav', delete=True) as temp_file:
-                temp_file.write(audio_data)
-                temp_file.flush()
-                
-                with wave.open(temp_file.name, 'rb') as wav_file:
-                    # Get basic audio information
-                    n_channels = wav_file.getnchannels()
-                    sample_width = wav_file.getsampwidth()
-                    frame_rate = wav_file.getframerate()
-                    n_frames = wav_file.getnframes()
-                    
-                    # Read all frames
-                    frames = wav_file.readframes(n_frames)
-                    
-                    # Convert to numpy array
-                    if sample_width == 1:
-                        dtype = np.uint8
-                    elif sample_width == 2:
-                        dtype = np.int16
-                    else:
-                        dtype = np.int32
-                    
-                    audio_array = np.frombuffer(frames, dtype=dtype)
-                    
-                    # If stereo, take the average of both channels
-                    if n_channels == 2:
-                        audio_array = audio_array.reshape(-1, 2).mean(axis=1)
-                    
-                    # Generate the waveform plot
-                    plt.figure(figsize=(10, 3))
-                    plt.plot(np.linspace(0, n_frames / frame_rate, num=len(audio_array)), audio_array, color='#3498db')
-                    plt.axis('off')
-                    plt.tight_layout(pad=0)
-                    
-                    # Save the plot to a bytes buffer
-                    buf = BytesIO()
-                    plt.savefig(buf, format='png', dpi=100, bbox_inches='tight', pad_inches=0)
-                    plt.close()
-                    buf.seek(0)
-                    
-                    return buf.read()
+            # Parse the WAV header and view the samples in place
+            wav = parse_wav(audio_data)
+            
+            return waveform_renderer.render(
+                wav.samples,
+                width=width,
+                height=height,
+                color=color,
+                background=background
+            )
         except Exception as e:
             logger.error(f"Error generating waveform image: {e}")
             # Return a placeholder image if waveform generation fails
@@ -218,16 +257,7 @@ class AudioProcessor:
         Returns:
             PNG image data as bytes
         """
-        plt.figure(figsize=(10, 3))
-        plt.text(0.5, 0.5, 'Waveform unavailable', horizontalalignment='center', verticalalignment='center')
-        plt.axis('off')
-        
-        buf = BytesIO()
-        plt.savefig(buf, format='png', dpi=100)
-        plt.close()
-        buf.seek(0)
-        
-        return buf.read()
+        return waveform_renderer.render_placeholder('Waveform unavailable')
     
     def convert_audio_format(self, audio_data: bytes, target_format: str = 'wav',
                             sample_rate: int = 44100, channels: int = 2) -> bytes:
@@ -0,0 +1,338 @@
+"""
+Response Cache for Audio Processor
+
+This module caches the results of upstream AI calls by content. Keys are
+derived from the client, model, endpoint, normalized prompt, options and,
+where relevant, a hash of the audio sent, so repeated requests for the
+same prompt are served without paying upstream latency or cost.
+
+The backend is selected with environment variables:
+
+    SOUNDSCAPE_CACHE_BACKEND  memory (default), redis, disk or none
+    SOUNDSCAPE_CACHE_URL      Redis URL (default: REDIS_URL or localhost)
+    SOUNDSCAPE_CACHE_DIR      Directory for the disk backend
+    SOUNDSCAPE_CACHE_TTL      Default time to live in seconds
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class CacheBackend(ABC):
+    """Interface for response cache storage"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the stored value, or None if missing or expired"""
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        """Store a value for ttl seconds"""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove a value if present"""
+
+class NullCacheBackend(CacheBackend):
+    """Backend that stores nothing, used when caching is disabled"""
+
+    def get(self, key: str) -> Optional[bytes]:
+        return None
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        pass
+
+    def delete(self, key: str) -> None:
+        pass
+
+class MemoryCacheBackend(CacheBackend):
+    """In-process LRU cache bounded by the total size of stored values"""
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if time.monotonic() >= expires_at:
+                self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        if len(value) > self.max_bytes:
+            return
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._size += len(value)
+
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[0])
+
+class RedisCacheBackend(CacheBackend):
+    """Cache shared between processes through Redis"""
+
+    def __init__(self, url: str, prefix: str = "responsecache:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.client.ping()
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        self.client.setex(self.prefix + key, ttl, value)
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+class DiskCacheBackend(CacheBackend):
+    """
+    Cache stored as one file per key in a local directory
+
+    Each file starts with its expiry time as a big-endian double, followed
+    by the value. Files are written atomically via a rename.
+    """
+
+    _EXPIRY = struct.Struct('>d')
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        if len(data) < self._EXPIRY.size or time.time() >= self._EXPIRY.unpack_from(data)[0]:
+            self.delete(key)
+            return None
+
+        return data[self._EXPIRY.size:]
+
+    def set(self, key: str, value: bytes, ttl: int) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self._EXPIRY.pack(time.time() + ttl))
+                f.write(value)
+            os.replace(temp_path, path)
+        except Exception:
+            os.unlink(temp_path)
+            raise
+
+    def delete(self, key: str) -> None:
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalize a prompt so trivially different spellings share a cache entry
+
+    Applies Unicode NFKC normalization, case folding and whitespace
+    collapsing.
+
+    Args:
+        prompt: Prompt text
+
+    Returns:
+        Normalized prompt
+    """
+    prompt = unicodedata.normalize('NFKC', prompt).casefold()
+    return re.sub(r'\s+', ' ', prompt).strip()
+
+class ResponseCache:
+    """Content-addressed cache for upstream AI responses"""
+
+    def __init__(self, backend: CacheBackend, default_ttl: int = 24 * 3600):
+        self.backend = backend
+        self.default_ttl = default_ttl
+
+    @staticmethod
+    def make_key(client: str, model: str, endpoint: str, prompt: str,
+                 options: Optional[Dict[str, Any]] = None,
+                 audio_data: Optional[bytes] = None) -> str:
+        """
+        Build a cache key for an upstream request
+
+        Args:
+            client: Client name (e.g., "gemini", "grok")
+            model: Model name
+            endpoint: Endpoint or operation name
+            prompt: Prompt text, normalized before hashing
+            options: Request options, hashed in canonical JSON form
+            audio_data: Audio sent with the request, if any
+
+        Returns:
+            Hex digest key
+        """
+        material = {
+            "client": client,
+            "model": model,
+            "endpoint": endpoint,
+            "prompt": normalize_prompt(prompt),
+            "options": options or {},
+            "audio": hashlib.sha256(audio_data).hexdigest() if audio_data is not None else None
+        }
+        canonical = json.dumps(material, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        """Get a cached binary value"""
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            logger.error(f"Response cache read error: {e}")
+            return None
+
+    def set_bytes(self, key: str, value: bytes, ttl: Optional[int] = None) -> None:
+        """Cache a binary value"""
+        try:
+            self.backend.set(key, value, ttl or self.default_ttl)
+        except Exception as e:
+            logger.error(f"Response cache write error: {e}")
+
+    def get_json(self, key: str) -> Optional[Any]:
+        """Get a cached JSON value"""
+        data = self.get_bytes(key)
+        return json.loads(data) if data is not None else None
+
+    def set_json(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
+        """Cache a JSON-serializable value"""
+        self.set_bytes(key, json.dumps(value).encode('utf-8'), ttl)
+
+    def cached_json(self, key: str, compute: Callable[[], Any],
+                    use_cache: bool = True, ttl: Optional[int] = None) -> Any:
+        """
+        Return the cached JSON value for key, computing and storing it on a miss
+
+        With use_cache=False the cache is not read, but the fresh result
+        still replaces the stored entry.
+
+        Args:
+            key: Cache key from make_key
+            compute: Function producing the value
+            use_cache: Whether a cached value may be returned
+            ttl: Time to live in seconds (default_ttl if not given)
+
+        Returns:
+            Cached or freshly computed value
+        """
+        if use_cache:
+            cached = self.get_json(key)
+            if cached is not None:
+                logger.info(f"Response cache hit: {key[:12]}")
+                return cached
+
+        value = compute()
+        self.set_json(key, value, ttl)
+        return value
+
+    def cached_bytes(self, key: str, compute: Callable[[], bytes],
+                     use_cache: bool = True, ttl: Optional[int] = None) -> bytes:
+        """
+        Return the cached binary value for key, computing and storing it on a miss
+
+        Args:
+            key: Cache key from make_key
+            compute: Function producing the value
+            use_cache: Whether a cached value may be returned
+            ttl: Time to live in seconds (default_ttl if not given)
+
+        Returns:
+            Cached or freshly computed value
+        """
+        if use_cache:
+            cached = self.get_bytes(key)
+            if cached is not None:
+                logger.info(f"Response cache hit: {key[:12]}")
+                return cached
+
+        value = compute()
+        self.set_bytes(key, value, ttl)
+        return value
+
+def create_response_cache() -> ResponseCache:
+    """
+    Create the response cache configured by environment variables
+
+    Falls back to the in-memory backend if the configured one is not
+    available.
+
+    Returns:
+        ResponseCache instance
+    """
+    backend_name = os.environ.get("SOUNDSCAPE_CACHE_BACKEND", "memory").lower()
+    default_ttl = int(os.environ.get("SOUNDSCAPE_CACHE_TTL", 24 * 3600))
+
+    backend: CacheBackend
+    try:
+        if backend_name == "none":
+            backend = NullCacheBackend()
+        elif backend_name == "redis":
+            url = os.environ.get("SOUNDSCAPE_CACHE_URL", os.environ.get("REDIS_URL", "redis://localhost:6379/0"))
+            backend = RedisCacheBackend(url)
+        elif backend_name == "disk":
+            directory = os.environ.get(
+                "SOUNDSCAPE_CACHE_DIR",
+                os.path.join(tempfile.gettempdir(), "soundscape-response-cache")
+            )
+            backend = DiskCacheBackend(directory)
+        else:
+            backend = MemoryCacheBackend()
+    except Exception as e:
+        logger.warning(f"Response cache backend '{backend_name}' not available, using memory cache: {e}")
+        backend = MemoryCacheBackend()
+
+    logger.info(f"Response cache using {type(backend).__name__}")
+    return ResponseCache(backend, default_ttl=default_ttl)
+
+# Create a singleton instance
+response_cache = create_response_cache()
@@ -1,18 +1,31 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, BackgroundTasks, Query
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, BackgroundTasks, Query, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from typing import List, Optional, Dict, Any
 import uuid
+import io
 import os
 import json
 import asyncio
 from datetime import datetime
 
+import librosa
+import numpy as np
+
 from ..processors.audio_analyzer import AudioAnalyzer
 from ..processors.audio_converter import AudioConverter
-from ..processors.waveform_generator import WaveformGenerator
 from ..services.storage_service import StorageService
 from ..services.auth_service import get_current_user, User
 from ..services.db_service import AudioDatabase
+from ..ml.audio_feature_pipeline import AudioFeatureConfig, AudioFeaturePipeline
+from ..ml.streaming_features import StreamingFeatureExtractor
+from job_queue import job_queue, Job, JobContext
+from job_routes import router as job_router, JobUser, check_priority
+from pcm_ring_buffer import PCMRingBuffer
+from wav_io import parse_wav
+from waveform_peaks import MIN_PEAKS, PeaksPyramid
+from waveform_renderer import waveform_renderer
 
 app = FastAPI(
     title="SoundScape-AI Audio Processor",
@@ -29,12 +42,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.include_router(job_router)
+
 # Initialize services
 audio_analyzer = AudioAnalyzer()
 audio_converter = AudioConverter()
-waveform_generator = WaveformGenerator()
 storage_service = StorageService()
 db = AudioDatabase()
+feature_pipeline = AudioFeaturePipeline()
+
+# Streamed audio is analyzed with the pipeline's STFT parameters, with up
+# to five seconds buffered while analysis catches up
+stream_feature_config = AudioFeatureConfig()
+STREAM_BUFFER_SECONDS = 5
+STREAM_POLICIES = ("block", "drop")
 
 @app.get("/health")
 async def health_check():
@@ -86,6 +107,116 @@ async def analyze_audio(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+def run_analysis_job(job: Job, context: JobContext) -> Dict[str, Any]:
+    """
+    Analyze an uploaded file for a queued job and optionally store the results
+    """
+    analysis_result = audio_analyzer.process_file(job.data)
+    context.raise_if_cancelled()
+    
+    analysis_result["file_name"] = job.payload["file_name"]
+    analysis_result["user_id"] = job.user_id
+    analysis_result["analysis_id"] = job.id
+    analysis_result["created_at"] = datetime.now().isoformat()
+    
+    if job.payload.get("store_results", True):
+        asyncio.run(db.store_analysis(job.id, job.user_id, analysis_result))
+    
+    return jsonable_encoder(analysis_result)
+
+job_queue.register("analyze", run_analysis_job)
+
+@app.post("/jobs/analyze", status_code=202)
+async def submit_analysis_job(
+    file: UploadFile = File(...),
+    user: User = Depends(get_current_user),
+    store_results: bool = Query(True, description="Whether to store analysis results in database"),
+    priority: int = Query(0, description="Job priority; higher runs first (above 0 for admins only)")
+):
+    """
+    Queue an audio file for analysis
+    
+    Returns a job ID, which is also the analysis ID once stored. Follow the
+    job at /jobs/{job_id} or /jobs/{job_id}/ws.
+    """
+    if not file.filename.lower().endswith(('.mp3', '.wav', '.flac', '.aac', '.ogg')):
+        raise HTTPException(status_code=400, detail="Unsupported file format")
+    check_priority(priority, JobUser(user.id, admin=getattr(user, "role", None) == "admin"))
+    
+    try:
+        contents = await file.read()
+        
+        job = job_queue.submit(
+            "analyze",
+            {"file_name": file.filename, "store_results": store_results},
+            user_id=user.id,
+            priority=priority,
+            data=contents
+        )
+        
+        return job.to_dict()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to queue analysis: {str(e)}")
+
+@app.post("/analyze-batch")
+async def analyze_batch(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    user: User = Depends(get_current_user),
+    feature_groups: Optional[List[str]] = Query(None, description="Feature groups to extract (default: all)"),
+    store_results: bool = Query(True, description="Whether to store analysis results in database")
+):
+    """
+    Analyze many audio files in one request
+    
+    - Decodes, extracts features and runs the models as pipelined stages
+    - Batches model inference across files
+    - Returns per-file results and per-stage throughput metrics
+    """
+    unsupported = [
+        file.filename for file in files
+        if not file.filename.lower().endswith(('.mp3', '.wav', '.flac', '.aac', '.ogg'))
+    ]
+    if unsupported:
+        raise HTTPException(status_code=400, detail=f"Unsupported file format: {', '.join(unsupported)}")
+    
+    try:
+        contents = await asyncio.gather(*(file.read() for file in files))
+        
+        # Files are identified by name, made unique if names repeat
+        audio_files = {}
+        for index, (file, data) in enumerate(zip(files, contents)):
+            file_id = file.filename if file.filename not in audio_files else f"{file.filename}#{index}"
+            audio_files[file_id] = data
+        
+        batch = await feature_pipeline.process_many(audio_files, feature_groups=feature_groups)
+        
+        analyses = []
+        for file_id, features in batch["results"].items():
+            analysis_id = str(uuid.uuid4())
+            analysis_result = {
+                **features,
+                "file_name": file_id,
+                "user_id": user.id,
+                "analysis_id": analysis_id,
+                "created_at": datetime.now().isoformat()
+            }
+            
+            if store_results and "error" not in features:
+                background_tasks.add_task(db.store_analysis, analysis_id, user.id, analysis_result)
+            
+            analyses.append(analysis_result)
+        
+        return jsonable_encoder({
+            "results": analyses,
+            "metrics": batch["metrics"]
+        })
+    
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch analysis failed: {str(e)}")
+
 @app.post("/convert")
 async def convert_audio(
     file: UploadFile = File(...),
@@ -156,7 +287,8 @@ async def generate_waveform(
     
     - Creates visual representation of audio amplitude over time
     - Customizable width, height, and colors
-    - Returns URL to the generated image
+    - Stores a multi-resolution peaks file next to the image for zooming
+    - Returns URL to the generated image and the RMS of each image column
     """
     if not file.filename.lower().endswith(('.mp3', '.wav', '.flac', '.aac', '.ogg')):
         raise HTTPException(status_code=400, detail="Unsupported file format")
@@ -165,18 +297,42 @@ async def generate_waveform(
         # Read file
         contents = await file.read()
         
-        # Generate waveform
-        waveform_image = await waveform_generator.generate(
-            audio_data=contents,
-            width=width,
+        # Decode once; the peaks pyramid is built from the decoded samples
+        # and the image columns from the pyramid. WAV payloads are read in
+        # place instead of going through librosa
+        if file.filename.lower().endswith('.wav'):
+            wav = parse_wav(contents)
+            samples, sample_rate = wav.to_float32(), wav.sample_rate
+        else:
+            samples, sample_rate = await asyncio.to_thread(
+                librosa.load,
+                io.BytesIO(contents),
+                sr=None,
+                mono=True
+            )
+        # At least one level 0 peak per column, so short clips render at
+        # full detail
+        peaks = await asyncio.to_thread(
+            PeaksPyramid.from_samples, samples, sample_rate, min_peaks=max(width, MIN_PEAKS)
+        )
+        
+        # Generate waveform, with the RMS band
+        mins, maxs, rms = peaks.columns(width)
+        waveform_image = await asyncio.to_thread(
+            waveform_renderer.render_columns,
+            mins,
+            maxs,
+            rms,
             height=height,
             color=color,
             background=background
         )
         
-        # Generate filename
+        # Generate filenames
         filename_base = os.path.splitext(file.filename)[0]
-        image_filename = f"{filename_base}_waveform_{datetime.now().strftime('%Y%m%d%H%M%S')}.png"
+        timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+        image_filename = f"{filename_base}_waveform_{timestamp}.png"
+        peaks_filename = f"{filename_base}_waveform_{timestamp}.dat"
         
         # Upload to storage
         image_url = await storage_service.upload_file(
@@ -184,17 +340,24 @@ async def generate_waveform(
             filename=f"waveforms/{user.id}/{image_filename}",
             content_type="image/png"
         )
-        
-        # Generate waveform data for JSON response
-        waveform_data = await waveform_generator.generate_data_points(
-            audio_data=contents,
-            num_points=width
+        await storage_service.upload_file(
+            file_data=peaks.to_bytes(),
+            filename=f"waveforms/{user.id}/{peaks_filename}",
+            content_type="application/octet-stream"
         )
         
+        # Coarsest level with at least 100 points as preview
+        preview_level = len(peaks.levels) - 1
+        while preview_level > 0 and len(peaks.levels[preview_level]) < 100:
+            preview_level -= 1
+        
         return {
             "waveform_image_url": image_url,
-            "waveform_data": waveform_data[:100],  # Return first 100 points as preview
-            "waveform_data_url": f"/api/audio/waveform-data/{os.path.basename(image_url)}",
+            "waveform_data": peaks.to_dict(level=preview_level),
+            "waveform_rms": np.round(rms, 4).tolist(),
+            "waveform_data_url": f"/api/audio/waveform-data/{peaks_filename}",
+            "duration": peaks.duration,
+            "zoom_levels": len(peaks.levels),
             "width": width,
             "height": height
         }
@@ -202,6 +365,61 @@ async def generate_waveform(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Waveform generation failed: {str(e)}")
 
+@app.get("/waveform-data/{peaks_filename}")
+async def get_waveform_data(
+    peaks_filename: str,
+    user: User = Depends(get_current_user),
+    zoom: Optional[int] = Query(None, description="Zoom level (0 is the most detailed)"),
+    samples_per_pixel: Optional[int] = Query(None, description="Requested resolution, used when zoom is not given"),
+    start: float = Query(0.0, description="Start time in seconds"),
+    end: Optional[float] = Query(None, description="End time in seconds"),
+    format: str = Query("json", description="Response format (json or binary)")
+):
+    """
+    Get stored waveform peaks by zoom level and time range
+    
+    - JSON returns interleaved min/max values with placement metadata
+    - Binary returns raw little-endian int16 min/max pairs, with the
+      metadata in X-Peaks-* headers
+    """
+    if format not in ["json", "binary"]:
+        raise HTTPException(status_code=400, detail="Unsupported format")
+    
+    try:
+        peaks_data = await storage_service.download_file(
+            filename=f"waveforms/{user.id}/{os.path.basename(peaks_filename)}"
+        )
+        if not peaks_data:
+            raise HTTPException(status_code=404, detail="Waveform data not found")
+        
+        peaks = PeaksPyramid.from_bytes(peaks_data)
+        
+        if zoom is None:
+            zoom = peaks.level_for_resolution(samples_per_pixel) if samples_per_pixel else 0
+        if not 0 <= zoom < len(peaks.levels):
+            raise HTTPException(status_code=400, detail=f"Zoom level must be between 0 and {len(peaks.levels) - 1}")
+        
+        if format == "json":
+            return peaks.to_dict(level=zoom, start=start, end=end)
+        
+        offset, level_peaks = peaks.get_range(zoom, start, end)
+        return Response(
+            content=level_peaks.astype('<i2', copy=False).tobytes(),
+            media_type="application/octet-stream",
+            headers={
+                "X-Peaks-Sample-Rate": str(peaks.sample_rate),
+                "X-Peaks-Samples-Per-Pixel": str(peaks.samples_per_pixel_at(zoom)),
+                "X-Peaks-Level": str(zoom),
+                "X-Peaks-Offset": str(offset),
+                "X-Peaks-Length": str(len(level_peaks))
+            }
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve waveform data: {str(e)}")
+
 @app.post("/compare")
 async def compare_audio(
     file1: UploadFile = File(...),
@@ -217,12 +435,13 @@ async def compare_audio(
     """
     try:
         # Read files
-        contents1 = await file1.read()
-        contents2 = await file2.read()
+        contents1, contents2 = await asyncio.gather(file1.read(), file2.read())
         
-        # Process files to get audio time series
-        audio1 = await audio_converter.to_mono_pcm(contents1)
-        audio2 = await audio_converter.to_mono_pcm(contents2)
+        # Decode both files to audio time series concurrently
+        audio1, audio2 = await asyncio.gather(
+            audio_converter.to_mono_pcm(contents1),
+            audio_converter.to_mono_pcm(contents2)
+        )
         
         # Compare tracks
         comparison_results = audio_analyzer.compare_tracks(audio1, audio2)
@@ -236,6 +455,50 @@ async def compare_audio(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Comparison failed: {str(e)}")
 
+@app.post("/compare-many")
+async def compare_many(
+    files: List[UploadFile] = File(...),
+    threshold: float = Query(0.9, ge=0.0, le=1.0, description="Overall similarity at which files are near-duplicates"),
+    metrics: Optional[List[str]] = Query(None, description="Similarity metrics to use (default: all)"),
+    include_matrix: bool = Query(False, description="Whether to return the full similarity matrix"),
+    user: User = Depends(get_current_user)
+):
+    """
+    Compare every uploaded file with every other one
+    
+    - Extracts features once per file
+    - Computes the weighted similarity matrix in vectorized form
+    - Returns clusters of near-duplicates above the threshold
+    """
+    if len(files) < 2:
+        raise HTTPException(status_code=400, detail="At least two files are required")
+    
+    try:
+        contents = await asyncio.gather(*(file.read() for file in files))
+        
+        # Files are identified by name, made unique if names repeat
+        audio_files = {}
+        for index, (file, data) in enumerate(zip(files, contents)):
+            file_id = file.filename if file.filename not in audio_files else f"{file.filename}#{index}"
+            audio_files[file_id] = data
+        
+        result = await feature_pipeline.compare_many(
+            audio_files,
+            threshold=threshold,
+            metrics=metrics,
+            include_matrix=include_matrix
+        )
+        
+        if "error" in result:
+            raise HTTPException(status_code=400, detail=result["error"])
+        
+        return result
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Comparison failed: {str(e)}")
+
 @app.get("/analysis/{analysis_id}")
 async def get_analysis(
     analysis_id: str,
@@ -306,44 +569,98 @@ async def delete_analysis(
         raise HTTPException(status_code=500, detail=f"Failed to delete analysis: {str(e)}")
 
 @app.websocket("/stream")
-async def websocket_endpoint(websocket):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    sample_rate: int = Query(44100, description="Sample rate of the streamed 16-bit mono PCM"),
+    policy: str = Query("block", description="What to do when the buffer is full: block or drop"),
+    update_interval: float = Query(0.5, gt=0, description="Seconds between feature updates")
+):
     """
     Real-time audio streaming and analysis endpoint
     
-    Allows clients to stream audio data for real-time analysis
+    Allows clients to stream audio data for real-time analysis. Running
+    RMS, spectral centroid, onsets, tempo and chroma are sent every
+    update_interval seconds of audio. Audio is buffered in a fixed-size
+    ring. When analysis falls behind, the "block" policy stops reading
+    from the socket until there is room again, and the "drop" policy
+    discards incoming audio and reports how much.
     """
     await websocket.accept()
     
-    try:
-        # Initialize buffer for incoming audio data
-        audio_buffer = bytearray()
-        
+    if policy not in STREAM_POLICIES:
+        await websocket.close(code=1008, reason=f"Unknown policy: {policy}")
+        return
+    
+    extractor = StreamingFeatureExtractor(
+        sample_rate,
+        config=stream_feature_config,
+        update_interval=update_interval
+    )
+    ring = PCMRingBuffer(
+        capacity=max(int(sample_rate * STREAM_BUFFER_SECONDS), 2 * extractor.n_fft),
+        frame_length=extractor.n_fft,
+        hop_length=extractor.hop_length
+    )
+    frames_available = asyncio.Event()
+    space_available = asyncio.Event()
+    dropped_samples = 0
+    
+    async def receive_audio():
+        nonlocal dropped_samples
         while True:
-            # Receive chunk of audio data
-            data = await websocket.receive_bytes()
-            
-            # Add to buffer
-            audio_buffer.extend(data)
+            data = memoryview(await websocket.receive_bytes())
             
-            # Process if buffer is large enough
-            if len(audio_buffer) > 4096:  # Process in ~4KB chunks
-                # Extract features from buffer
-                chunk = bytes(audio_buffer[:4096])
-                audio_buffer = audio_buffer[4096:]
+            while data:
+                consumed = ring.write_pcm16(data)
+                data = data[consumed:]
+                if ring.frames_ready:
+                    frames_available.set()
                 
-                # Process chunk
+                if data:
+                    if policy == "drop":
+                        dropped_samples += len(data) // 2
+                        break
+                    
+                    # Wait for the analyzer to free space before reading more
+                    space_available.clear()
+                    await space_available.wait()
+    
+    async def analyze_audio_frames():
+        while True:
+            await frames_available.wait()
+            frames_available.clear()
+            
+            while ring.frames_ready:
+                # Frames are views into the ring; they are not overwritten
+                # until advance() releases them
+                n_frames = ring.frames_ready
+                frames = [ring.peek_frame(i) for i in range(n_frames)]
                 try:
-                    # This would be a simplified version of the analysis
-                    # that works with streaming audio chunks
-                    features = await asyncio.to_thread(
-                        audio_analyzer.process_streaming_chunk, 
-                        chunk
-                    )
+                    updates = await asyncio.to_thread(extractor.process_frames, frames)
                     
                     # Send processed data back to client
-                    await websocket.send_json(features)
+                    for features in updates:
+                        if dropped_samples:
+                            features["dropped_samples"] = dropped_samples
+                        await websocket.send_json(features)
+                except WebSocketDisconnect:
+                    raise
                 except Exception as e:
                     await websocket.send_json({"error": str(e)})
+                finally:
+                    ring.advance(n_frames * ring.hop_length)
+                    space_available.set()
+    
+    tasks = [asyncio.create_task(receive_audio()), asyncio.create_task(analyze_audio_frames())]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            task.result()
     
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
-        await websocket.close(code=1001, reason=f"Error: {str(e)}")
\ No newline at end of file
+        await websocket.close(code=1001, reason=f"Error: {str(e)}")
+    finally:
+        for task in tasks:
+            task.cancel()
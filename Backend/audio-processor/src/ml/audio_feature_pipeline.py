@@ -8,7 +8,7 @@ from transformers import AutoFeatureExtractor, AutoModelForAudioClassification
 import joblib
 import json
 import os
-from typing import Dict, List, Tuple, Any, Optional
+from typing import Dict, List, Tuple, Any, Optional, Sequence, Callable, Iterable, Mapping, Union
 import logging
 from dataclasses import dataclass
 from concurrent.futures import ThreadPoolExecutor
@@ -20,6 +20,14 @@ import hashlib
 import redis
 import pickle
 
+from .feature_extractors import (
+    extract_basic_features,
+    extract_advanced_features,
+    extract_peak_fingerprint,
+    normalized_mel_spectrogram
+)
+from .similarity_matrix import near_duplicate_report
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -40,6 +48,35 @@ class AudioFeatureConfig:
     cache_ttl: int = 3600  # 1 hour
     redis_url: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 
+# Feature groups process_audio can extract; "basic" is always included
+FEATURE_GROUPS = ("basic", "advanced", "genre", "emotion", "fingerprint", "embedding")
+
+# Cache namespace of batch results. Batched models see spectrograms padded
+# to the longest track in the batch, so their outputs differ from
+# process_audio's and are kept apart from its cache entries
+BATCH_CACHE_NAMESPACE = "batch"
+
+# Weights of each similarity metric in the overall score
+SIMILARITY_WEIGHTS = {
+    "timbre_similarity": 0.25,
+    "tonal_similarity": 0.2,
+    "tempo_similarity": 0.15,
+    "embedding_similarity": 0.3,
+    "fingerprint_similarity": 0.1
+}
+
+# Feature group each similarity metric is computed from
+SIMILARITY_FEATURE_GROUPS = {
+    "timbre_similarity": "basic",
+    "tonal_similarity": "basic",
+    "tempo_similarity": "basic",
+    "embedding_similarity": "embedding",
+    "fingerprint_similarity": "fingerprint"
+}
+
+# Output classes of the emotion model
+EMOTION_LABELS = ["angry", "happy", "relaxed", "sad", "fearful", "surprised"]
+
 class AudioFeaturePipeline:
     """
     Advanced audio processing pipeline with ML model integration for feature extraction,
@@ -129,13 +166,16 @@ class AudioFeaturePipeline:
             self.embedding_model = None
             self.feature_scaler = None
     
-    async def process_audio(self, audio_data: bytes, extract_all: bool = True) -> Dict[str, Any]:
+    async def process_audio(self, audio_data: bytes, extract_all: bool = True,
+                            feature_groups: Optional[Sequence[str]] = None) -> Dict[str, Any]:
         """
         Process audio data and extract features
         
         Args:
             audio_data: Raw audio file bytes
             extract_all: Whether to extract all features or just basic ones
+            feature_groups: Feature groups to extract (see FEATURE_GROUPS);
+                overrides extract_all. Basic features are always included.
             
         Returns:
             Dictionary containing extracted features
@@ -145,9 +185,13 @@ class AudioFeaturePipeline:
         # Generate a unique ID for this audio
         audio_hash = hashlib.md5(audio_data).hexdigest()
         
-        # Check cache first
+        groups = self._resolve_feature_groups(extract_all, feature_groups)
+        
+        # Check cache first; only the groups it lacks need computing
         cached_features = await self._get_from_cache(audio_hash)
-        if cached_features:
+        cached_groups = self.cached_feature_groups(cached_features)
+        missing_groups = [group for group in groups if group not in cached_groups]
+        if cached_features and not missing_groups:
             logger.info(f"Returning cached features for {audio_hash} ({time.time() - start_time:.2f}s)")
             return cached_features
         
@@ -159,34 +203,15 @@ class AudioFeaturePipeline:
                 sr=self.config.sample_rate
             )
             
-            # Extract basic features (always done)
-            basic_features = await self._extract_basic_features(y, sr)
-            
-            result = {
-                "audio_id": audio_hash,
-                "duration": basic_features["duration"],
-                "sample_rate": sr,
-                **basic_features
-            }
+            result = await self.extract_features(y, sr, missing_groups)
+            if cached_features:
+                result = {**cached_features, **result}
             
-            # If extract_all, run advanced feature extraction
-            if extract_all:
-                # These operations can run in parallel
-                feature_tasks = [
-                    self._extract_advanced_features(y, sr),
-                    self._classify_genre(y, sr),
-                    self._detect_emotion(y, sr),
-                    self._generate_fingerprint(y, sr),
-                    self._generate_embedding(y, sr)
-                ]
-                
-                # Wait for all tasks to complete
-                advanced_results = await asyncio.gather(*feature_tasks, return_exceptions=True)
-                
-                # Process results, skipping any that had exceptions
-                for res in advanced_results:
-                    if not isinstance(res, Exception) and res:
-                        result.update(res)
+            result["audio_id"] = audio_hash
+            result["feature_groups"] = [
+                group for group in FEATURE_GROUPS
+                if group in cached_groups or group in missing_groups
+            ]
             
             # Calculate processing time
             processing_time = time.time() - start_time
@@ -206,51 +231,142 @@ class AudioFeaturePipeline:
                 "processing_time": time.time() - start_time
             }
     
+    async def process_many(self, sources: Union[Mapping[str, Any], Iterable[Tuple[str, Any]]],
+                           on_result: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                           extract_all: bool = True,
+                           feature_groups: Optional[Sequence[str]] = None,
+                           decode_workers: Optional[int] = None,
+                           feature_workers: Optional[int] = None,
+                           batch_size: Optional[int] = None,
+                           queue_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Process many audio files through a pipelined batch analysis
+        
+        Decoding, CPU feature extraction, batched model inference and result
+        writing run as concurrent stages (see BatchAnalysisPipeline), so all
+        cores stay busy on large backfills. CPU-only feature groups match
+        process_audio's; emotion, embedding and fingerprint outputs come from
+        padded batches (see infer_batch) and can differ slightly, so results
+        are cached apart from process_audio's.
+        
+        Args:
+            sources: Audio keyed by source ID, or (source ID, audio) pairs;
+                audio is file bytes, a file path, or a callable returning bytes
+            on_result: Called with each source ID and its features from a
+                writer thread; if omitted, results are returned instead
+            extract_all: Whether to extract all features or just basic ones
+            feature_groups: Feature groups to extract; overrides extract_all
+            decode_workers: Decode threads
+            feature_workers: Feature worker processes
+            batch_size: Tracks per model call (default: config.batch_size)
+            queue_size: Capacity of each stage queue
+            
+        Returns:
+            Dictionary with run metrics and, without on_result, the results
+            keyed by source ID
+        """
+        # Imported here because batch analysis builds on this module
+        from .batch_analysis import BatchAnalysisPipeline
+        
+        batch = BatchAnalysisPipeline(
+            self,
+            feature_groups=self._resolve_feature_groups(extract_all, feature_groups),
+            decode_workers=decode_workers,
+            feature_workers=feature_workers,
+            batch_size=batch_size,
+            queue_size=queue_size
+        )
+        
+        results = {}
+        collect_results = on_result is None
+        if collect_results:
+            def on_result(source_id: str, features: Dict[str, Any]) -> None:
+                results[source_id] = features
+        
+        if isinstance(sources, Mapping):
+            sources = sources.items()
+        
+        metrics = await asyncio.to_thread(batch.run, sources, on_result)
+        logger.info(f"Processed {metrics['count']} audio files at {metrics['tracks_per_second']:.2f}/s")
+        
+        response = {"metrics": metrics}
+        if collect_results:
+            response["results"] = results
+        return response
+    
+    async def extract_features(self, y: np.ndarray, sr: int, feature_groups: Sequence[str]) -> Dict[str, Any]:
+        """
+        Extract feature groups from decoded audio
+        
+        Args:
+            y: Mono audio samples
+            sr: Sample rate
+            feature_groups: Feature groups to extract
+            
+        Returns:
+            Dictionary containing the extracted features
+        """
+        result = {}
+        
+        if "basic" in feature_groups:
+            basic_features = await self._extract_basic_features(y, sr)
+            result.update({
+                "duration": basic_features["duration"],
+                "sample_rate": sr,
+                **basic_features
+            })
+        
+        extractors = {
+            "advanced": self._extract_advanced_features,
+            "genre": self._classify_genre,
+            "emotion": self._detect_emotion,
+            "fingerprint": self._generate_fingerprint,
+            "embedding": self._generate_embedding
+        }
+        
+        # These operations can run in parallel
+        feature_tasks = [
+            extractors[group](y, sr)
+            for group in feature_groups if group in extractors
+        ]
+        
+        # Wait for all tasks to complete
+        advanced_results = await asyncio.gather(*feature_tasks, return_exceptions=True)
+        
+        # Process results, skipping any that had exceptions
+        for res in advanced_results:
+            if not isinstance(res, Exception) and res:
+                result.update(res)
+        
+        return result
+    
+    def _resolve_feature_groups(self, extract_all: bool, feature_groups: Optional[Sequence[str]]) -> List[str]:
+        """Work out which feature groups a request needs, always including basic features"""
+        if feature_groups is None:
+            return list(FEATURE_GROUPS) if extract_all else ["basic"]
+        
+        unknown = set(feature_groups) - set(FEATURE_GROUPS)
+        if unknown:
+            raise ValueError(f"Unknown feature groups: {', '.join(sorted(unknown))}")
+        
+        return [group for group in FEATURE_GROUPS if group == "basic" or group in feature_groups]
+    
+    def cached_feature_groups(self, cached_features: Optional[Dict[str, Any]]) -> List[str]:
+        """Feature groups present in a cached result"""
+        if not cached_features:
+            return []
+        if "feature_groups" in cached_features:
+            return cached_features["feature_groups"]
+        
+        # Entries cached before groups were recorded hold either everything
+        # or only the basic features
+        return list(FEATURE_GROUPS) if "advanced_features" in cached_features else ["basic"]
+    
     async def _extract_basic_features(self, y: np.ndarray, sr: int) -> Dict[str, Any]:
         """Extract basic audio features using librosa"""
         try:
             # Run CPU-bound operations in thread pool
-            def extract():
-                # Duration
-                duration = librosa.get_duration(y=y, sr=sr)
-                
-                # RMS energy
-                rms = np.mean(librosa.feature.rms(y=y))
-                
-                # Zero crossing rate
-                zcr = np.mean(librosa.feature.zero_crossing_rate(y=y))
-                
-                # Spectral features
-                spectral_centroid = np.mean(librosa.feature.spectral_centroid(y=y, sr=sr))
-                spectral_bandwidth = np.mean(librosa.feature.spectral_bandwidth(y=y, sr=sr))
-                spectral_rolloff = np.mean(librosa.feature.spectral_rolloff(y=y, sr=sr))
-                
-                # Tempo and beats
-                tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
-                
-                # MFCC features
-                mfccs = np.mean(librosa.feature.mfcc(
-                    y=y, 
-                    sr=sr, 
-                    n_mfcc=self.config.n_mfcc
-                ), axis=1)
-                
-                # Chroma features
-                chroma = np.mean(librosa.feature.chroma_stft(y=y, sr=sr), axis=1)
-                
-                return {
-                    "duration": float(duration),
-                    "rms_energy": float(rms),
-                    "zero_crossing_rate": float(zcr),
-                    "spectral_centroid": float(spectral_centroid),
-                    "spectral_bandwidth": float(spectral_bandwidth),
-                    "spectral_rolloff": float(spectral_rolloff),
-                    "tempo": float(tempo),
-                    "mfccs": mfccs.tolist(),
-                    "chroma_features": chroma.tolist()
-                }
-            
-            return await asyncio.to_thread(extract)
+            return await asyncio.to_thread(extract_basic_features, y, sr, self.config.n_mfcc)
         
         except Exception as e:
             logger.error(f"Error extracting basic features: {str(e)}")
@@ -262,59 +378,7 @@ class AudioFeaturePipeline:
     async def _extract_advanced_features(self, y: np.ndarray, sr: int) -> Dict[str, Any]:
         """Extract advanced audio features"""
         try:
-            def extract():
-                # Harmonic-percussive source separation
-                y_harmonic, y_percussive = librosa.effects.hpss(y)
-                
-                # Harmonic features
-                harmonic_rms = np.mean(librosa.feature.rms(y=y_harmonic))
-                
-                # Percussive features
-                percussive_rms = np.mean(librosa.feature.rms(y=y_percussive))
-                
-                # Onset detection
-                onset_env = librosa.onset.onset_strength(y=y, sr=sr)
-                onsets = librosa.onset.onset_detect(
-                    onset_envelope=onset_env, 
-                    sr=sr, 
-                    units='time'
-                )
-                
-                # Pitch and harmonics
-                pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
-                pitch_mean = np.mean(pitches[pitches > 0]) if np.any(pitches > 0) else 0
-                
-                # Spectral contrast
-                contrast = np.mean(librosa.feature.spectral_contrast(y=y, sr=sr), axis=1)
-                
-                # Tonnetz features (tonal centroid features)
-                tonnetz = np.mean(librosa.feature.tonnetz(
-                    y=librosa.effects.harmonic(y), 
-                    sr=sr
-                ), axis=1)
-                
-                # Rhythm features
-                oenv = librosa.onset.onset_strength(y=y, sr=sr)
-                tempo_hist = librosa.feature.tempogram(
-                    onset_envelope=oenv, 
-                    sr=sr
-                )
-                tempo_hist_mean = np.mean(tempo_hist, axis=1)
-                
-                return {
-                    "advanced_features": {
-                        "harmonic_rms": float(harmonic_rms),
-                        "percussive_rms": float(percussive_rms),
-                        "onset_count": len(onsets),
-                        "onset_rate": len(onsets) / (len(y) / sr) if len(y) > 0 else 0,
-                        "pitch_mean": float(pitch_mean),
-                        "spectral_contrast": contrast.tolist(),
-                        "tonnetz": tonnetz.tolist(),
-                        "tempo_histogram": tempo_hist_mean.tolist()
-                    }
-                }
-            
-            return await asyncio.to_thread(extract)
+            return await asyncio.to_thread(extract_advanced_features, y, sr)
         
         except Exception as e:
             logger.error(f"Error extracting advanced features: {str(e)}")
@@ -349,25 +413,7 @@ class AudioFeaturePipeline:
                 
                 # Get predicted genre and confidence
                 probs = predictions[0].cpu().numpy()
-                genres = self.genre_model.config.id2label
-                
-                # Return all genre probabilities
-                genre_probs = {genres[i]: float(probs[i]) for i in range(len(genres))}
-                
-                # Get top 3 genres
-                top_indices = np.argsort(probs)[-3:][::-1]
-                top_genres = [genres[i] for i in top_indices]
-                top_probs = [float(probs[i]) for i in top_indices]
-                
-                return {
-                    "genre_prediction": {
-                        "top_genres": [
-                            {"genre": genre, "confidence": prob} 
-                            for genre, prob in zip(top_genres, top_probs)
-                        ],
-                        "all_genres": genre_probs
-                    }
-                }
+                return {"genre_prediction": self._genre_prediction(probs)}
             
             return await asyncio.to_thread(process)
         
@@ -382,18 +428,14 @@ class AudioFeaturePipeline:
         
         try:
             def process():
-                # Extract mel spectrogram for the emotion model
-                mel_spec = librosa.feature.melspectrogram(
-                    y=y, 
-                    sr=sr, 
+                # Extract mel spectrogram for the emotion model, normalized per track
+                mel_spec_db = normalized_mel_spectrogram(
+                    y, 
+                    sr, 
                     n_mels=self.config.n_mels,
                     n_fft=self.config.n_fft,
                     hop_length=self.config.hop_length
                 )
-                mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
-                
-                # Normalize
-                mel_spec_db = (mel_spec_db - np.mean(mel_spec_db)) / (np.std(mel_spec_db) + 1e-8)
                 
                 # Convert to tensor and add batch dimension
                 mel_tensor = torch.from_numpy(mel_spec_db).float().unsqueeze(0).unsqueeze(0)
@@ -404,26 +446,9 @@ class AudioFeaturePipeline:
                     outputs = self.emotion_model(mel_tensor)
                     predictions = F.softmax(outputs, dim=1)
                 
-                # Define emotion labels
-                emotion_labels = ["angry", "happy", "relaxed", "sad", "fearful", "surprised"]
-                
                 # Convert predictions to dictionary
                 probs = predictions[0].cpu().numpy()
-                emotion_probs = {emotion: float(prob) for emotion, prob in zip(emotion_labels, probs)}
-                
-                # Get top emotion
-                top_emotion = emotion_labels[np.argmax(probs)]
-                top_confidence = float(np.max(probs))
-                
-                return {
-                    "emotion_prediction": {
-                        "dominant_emotion": {
-                            "emotion": top_emotion,
-                            "confidence": top_confidence
-                        },
-                        "emotions": emotion_probs
-                    }
-                }
+                return {"emotion_prediction": self._emotion_prediction(probs)}
             
             return await asyncio.to_thread(process)
         
@@ -439,18 +464,14 @@ class AudioFeaturePipeline:
         
         try:
             def process():
-                # Prepare audio data
-                mel_spec = librosa.feature.melspectrogram(
-                    y=y, 
-                    sr=sr, 
+                # Prepare audio data, normalized per track
+                mel_spec_db = normalized_mel_spectrogram(
+                    y, 
+                    sr, 
                     n_mels=128,
                     n_fft=2048,
                     hop_length=512
                 )
-                mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
-                
-                # Normalize
-                mel_spec_db = (mel_spec_db - np.mean(mel_spec_db)) / (np.std(mel_spec_db) + 1e-8)
                 
                 # Convert to tensor and add batch dimension
                 mel_tensor = torch.from_numpy(mel_spec_db).float().unsqueeze(0).unsqueeze(0)
@@ -479,36 +500,7 @@ class AudioFeaturePipeline:
     async def _generate_basic_fingerprint(self, y: np.ndarray, sr: int) -> Dict[str, Any]:
         """Generate basic audio fingerprint using peak finding algorithm"""
         try:
-            def process():
-                # Extract spectrogram
-                spec = np.abs(librosa.stft(y))
-                
-                # Find peaks in the spectrogram
-                peaks = []
-                for i in range(1, spec.shape[0]-1):
-                    for j in range(1, spec.shape[1]-1):
-                        if (spec[i, j] > spec[i-1, j] and 
-                            spec[i, j] > spec[i+1, j] and 
-                            spec[i, j] > spec[i, j-1] and 
-                            spec[i, j] > spec[i, j+1] and
-                            spec[i, j] > 0.5):  # Threshold to filter weak peaks
-                            peaks.append((i, j, float(spec[i, j])))
-                
-                # Sort by magnitude and take top peaks
-                peaks.sort(key=lambda x: x[2], reverse=True)
-                top_peaks = peaks[:250]  # Use top 250 peaks
-                
-                # Create fingerprint from peak frequencies and times
-                fingerprint = [(int(p[0]), int(p[1])) for p in top_peaks]
-                
-                return {
-                    "audio_fingerprint": {
-                        "peaks": fingerprint,
-                        "method": "peak_finding"
-                    }
-                }
-            
-            return await asyncio.to_thread(process)
+            return await asyncio.to_thread(extract_peak_fingerprint, y, sr)
         
         except Exception as e:
             logger.error(f"Error generating basic fingerprint: {str(e)}")
@@ -521,18 +513,14 @@ class AudioFeaturePipeline:
         
         try:
             def process():
-                # Extract mel spectrogram
-                mel_spec = librosa.feature.melspectrogram(
-                    y=y, 
-                    sr=sr, 
+                # Extract mel spectrogram, normalized per track
+                mel_spec_db = normalized_mel_spectrogram(
+                    y, 
+                    sr, 
                     n_mels=128,
                     n_fft=2048,
                     hop_length=512
                 )
-                mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
-                
-                # Normalize
-                mel_spec_db = (mel_spec_db - np.mean(mel_spec_db)) / (np.std(mel_spec_db) + 1e-8)
                 
                 # Convert to tensor and add batch dimension
                 mel_tensor = torch.from_numpy(mel_spec_db).float().unsqueeze(0).unsqueeze(0)
@@ -557,12 +545,178 @@ class AudioFeaturePipeline:
             logger.error(f"Error generating embedding: {str(e)}")
             return {"audio_embedding": {"error": str(e)}}
     
+    
+    def _genre_prediction(self, probs: np.ndarray) -> Dict[str, Any]:
+        """Format genre model probabilities for one track"""
+        genres = self.genre_model.config.id2label
+        
+        # Return all genre probabilities
+        genre_probs = {genres[i]: float(probs[i]) for i in range(len(genres))}
+        
+        # Get top 3 genres
+        top_indices = np.argsort(probs)[-3:][::-1]
+        top_genres = [genres[i] for i in top_indices]
+        top_probs = [float(probs[i]) for i in top_indices]
+        
+        return {
+            "top_genres": [
+                {"genre": genre, "confidence": prob} 
+                for genre, prob in zip(top_genres, top_probs)
+            ],
+            "all_genres": genre_probs
+        }
+    
+    def _emotion_prediction(self, probs: np.ndarray) -> Dict[str, Any]:
+        """Format emotion model probabilities for one track"""
+        emotion_probs = {emotion: float(prob) for emotion, prob in zip(EMOTION_LABELS, probs)}
+        
+        # Get top emotion
+        top_emotion = EMOTION_LABELS[np.argmax(probs)]
+        top_confidence = float(np.max(probs))
+        
+        return {
+            "dominant_emotion": {
+                "emotion": top_emotion,
+                "confidence": top_confidence
+            },
+            "emotions": emotion_probs
+        }
+    
+    def model_feature_groups(self, feature_groups: Sequence[str]) -> List[str]:
+        """
+        Feature groups that run on a model, and so can be batched with
+        infer_batch; the rest only need extract_cpu_features
+        
+        Without a fingerprint model, fingerprints come from peak finding.
+        """
+        model_groups = ["genre", "emotion", "embedding"]
+        if self.fingerprint_model is not None:
+            model_groups.append("fingerprint")
+        return [group for group in feature_groups if group in model_groups]
+    
+    def infer_batch(self, signals: Sequence[np.ndarray], sr: int,
+                    feature_groups: Sequence[str]) -> List[Dict[str, Any]]:
+        """
+        Run the model-based feature groups on a batch of decoded tracks
+        
+        Each model is called once for the whole batch. Mel spectrograms are
+        computed once per track and shared between models with the same
+        parameters; shorter spectrograms are zero-padded, which after
+        normalization is the track's own mean, up to the longest in the
+        batch.
+        
+        Args:
+            signals: Mono audio samples of each track
+            sr: Sample rate
+            feature_groups: Feature groups to run (see model_feature_groups)
+            
+        Returns:
+            One dictionary of features per track, in order
+        """
+        results = [{} for _ in signals]
+        if not signals:
+            return results
+        
+        mel_batches = {}
+        
+        def mel_batch(n_mels: int, n_fft: int, hop_length: int) -> torch.Tensor:
+            key = (n_mels, n_fft, hop_length)
+            if key not in mel_batches:
+                specs = [
+                    normalized_mel_spectrogram(y, sr, n_mels=n_mels, n_fft=n_fft, hop_length=hop_length)
+                    for y in signals
+                ]
+                batch = np.zeros((len(specs), 1, n_mels, max(spec.shape[1] for spec in specs)), dtype=np.float32)
+                for i, spec in enumerate(specs):
+                    batch[i, 0, :, :spec.shape[1]] = spec
+                mel_batches[key] = torch.from_numpy(batch).to(self.device)
+            return mel_batches[key]
+        
+        def run(key: str, label: str, infer) -> None:
+            try:
+                with torch.no_grad():
+                    outputs = infer()
+                for result, output in zip(results, outputs):
+                    result[key] = output
+            except Exception as e:
+                logger.error(f"Error in batched {label}: {str(e)}")
+                for result in results:
+                    result[key] = {"error": str(e)}
+        
+        if "genre" in feature_groups:
+            if self.genre_model is None or self.genre_extractor is None:
+                for result in results:
+                    result["genre_prediction"] = {"error": "Genre model not available"}
+            else:
+                def infer_genre():
+                    inputs = self.genre_extractor(
+                        list(signals), 
+                        sampling_rate=sr, 
+                        return_tensors="pt", 
+                        padding=True
+                    )
+                    inputs = {k: v.to(self.device) for k, v in inputs.items()}
+                    probs = F.softmax(self.genre_model(**inputs).logits, dim=-1).cpu().numpy()
+                    return [self._genre_prediction(p) for p in probs]
+                
+                run("genre_prediction", "genre classification", infer_genre)
+        
+        if "emotion" in feature_groups:
+            if self.emotion_model is None:
+                for result in results:
+                    result["emotion_prediction"] = {"error": "Emotion model not available"}
+            else:
+                def infer_emotion():
+                    mels = mel_batch(self.config.n_mels, self.config.n_fft, self.config.hop_length)
+                    probs = F.softmax(self.emotion_model(mels), dim=1).cpu().numpy()
+                    return [self._emotion_prediction(p) for p in probs]
+                
+                run("emotion_prediction", "emotion detection", infer_emotion)
+        
+        if "embedding" in feature_groups:
+            if self.embedding_model is None:
+                for result in results:
+                    result["audio_embedding"] = {"error": "Embedding model not available"}
+            else:
+                def infer_embedding():
+                    embeddings = self.embedding_model(mel_batch(128, 2048, 512)).cpu().numpy()
+                    embeddings = embeddings.reshape(len(signals), -1)
+                    return [{"vector": e.tolist(), "dimension": len(e)} for e in embeddings]
+                
+                run("audio_embedding", "embedding", infer_embedding)
+        
+        if "fingerprint" in feature_groups and self.fingerprint_model is not None:
+            try:
+                with torch.no_grad():
+                    fingerprints = self.fingerprint_model(mel_batch(128, 2048, 512)).cpu().numpy()
+                fingerprints = fingerprints.reshape(len(signals), -1)
+                for result, fingerprint in zip(results, fingerprints):
+                    result["audio_fingerprint"] = {"vector": fingerprint.tolist(), "method": "neural_network"}
+            except Exception as e:
+                # Fall back to basic fingerprinting on error, as for single tracks
+                logger.error(f"Error in batched fingerprinting: {str(e)}")
+                for result, y in zip(results, signals):
+                    try:
+                        result.update(extract_peak_fingerprint(y, sr))
+                    except Exception as fallback_error:
+                        result["audio_fingerprint"] = {"error": str(fallback_error)}
+        
+        return results
+    
     async def _get_from_cache(self, audio_hash: str) -> Optional[Dict[str, Any]]:
         """Get cached features from Redis or memory"""
+        return self.get_cached_features(audio_hash)
+    
+    async def _save_to_cache(self, audio_hash: str, features: Dict[str, Any]) -> None:
+        """Save features to Redis or memory cache"""
+        self.save_cached_features(audio_hash, features)
+    
+    def get_cached_features(self, audio_hash: str, namespace: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Get cached features from Redis or memory; safe to call from worker threads"""
         if not self.config.cache_features:
             return None
         
-        cache_key = f"audiofeatures:{audio_hash}"
+        cache_key = self._cache_key(audio_hash, namespace)
         
         if self.cache_available:
             try:
@@ -576,12 +730,13 @@ class AudioFeaturePipeline:
         
         return None
     
-    async def _save_to_cache(self, audio_hash: str, features: Dict[str, Any]) -> None:
-        """Save features to Redis or memory cache"""
+    def save_cached_features(self, audio_hash: str, features: Dict[str, Any],
+                             namespace: Optional[str] = None) -> None:
+        """Save features to Redis or memory cache; safe to call from worker threads"""
         if not self.config.cache_features:
             return
         
-        cache_key = f"audiofeatures:{audio_hash}"
+        cache_key = self._cache_key(audio_hash, namespace)
         
         if self.cache_available:
             try:
@@ -595,21 +750,42 @@ class AudioFeaturePipeline:
         elif hasattr(self, 'memory_cache'):
             self.memory_cache[cache_key] = features
     
-    async def compare_audio(self, audio_data1: bytes, audio_data2: bytes) -> Dict[str, Any]:
+    @staticmethod
+    def _cache_key(audio_hash: str, namespace: Optional[str]) -> str:
+        if namespace:
+            return f"audiofeatures:{namespace}:{audio_hash}"
+        return f"audiofeatures:{audio_hash}"
+    
+    async def compare_audio(self, audio_data1: bytes, audio_data2: bytes,
+                            metrics: Optional[Sequence[str]] = None) -> Dict[str, Any]:
         """
         Compare two audio files and calculate similarity scores
         
+        Both files are processed concurrently, extracting only the feature
+        groups the requested metrics depend on.
+        
         Args:
             audio_data1: First audio file bytes
             audio_data2: Second audio file bytes
+            metrics: Similarity metrics to compute (default: all of
+                SIMILARITY_WEIGHTS)
             
         Returns:
             Dictionary with similarity metrics
         """
         try:
+            metrics = list(metrics or SIMILARITY_WEIGHTS)
+            unknown = set(metrics) - set(SIMILARITY_WEIGHTS)
+            if unknown:
+                return {"error": f"Unknown similarity metrics: {', '.join(sorted(unknown))}"}
+            
+            feature_groups = {SIMILARITY_FEATURE_GROUPS[metric] for metric in metrics}
+            
             # Process both audio files
-            features1 = await self.process_audio(audio_data1)
-            features2 = await self.process_audio(audio_data2)
+            features1, features2 = await asyncio.gather(
+                self.process_audio(audio_data1, feature_groups=feature_groups),
+                self.process_audio(audio_data2, feature_groups=feature_groups)
+            )
             
             # Check for errors
             if "error" in features1 or "error" in features2:
@@ -622,105 +798,14 @@ class AudioFeaturePipeline:
                 }
             
             # Calculate similarities
-            similarities = {}
-            
-            # Basic feature similarity
-            if "mfccs" in features1 and "mfccs" in features2:
-                mfcc_sim = self._cosine_similarity(
-                    features1["mfccs"], 
-                    features2["mfccs"]
-                )
-                similarities["timbre_similarity"] = float(mfcc_sim)
-            
-            if "chroma_features" in features1 and "chroma_features" in features2:
-                chroma_sim = self._cosine_similarity(
-                    features1["chroma_features"], 
-                    features2["chroma_features"]
-                )
-                similarities["tonal_similarity"] = float(chroma_sim)
-            
-            # Tempo similarity
-            if "tempo" in features1 and "tempo" in features2:
-                tempo_diff = abs(features1["tempo"] - features2["tempo"])
-                tempo_max = max(features1["tempo"], features2["tempo"])
-                tempo_sim = 1.0 - (tempo_diff / tempo_max if tempo_max > 0 else 0)
-                similarities["tempo_similarity"] = float(tempo_sim)
-            
-            # Embedding similarity (if available)
-            if ("audio_embedding" in features1 and 
-                "audio_embedding" in features2 and
-                "vector" in features1["audio_embedding"] and
-                "vector" in features2["audio_embedding"]):
-                
-                emb_sim = self._cosine_similarity(
-                    features1["audio_embedding"]["vector"],
-                    features2["audio_embedding"]["vector"]
-                )
-                similarities["embedding_similarity"] = float(emb_sim)
-            
-            # Fingerprint similarity
-            if ("audio_fingerprint" in features1 and 
-                "audio_fingerprint" in features2):
-                
-                if ("vector" in features1["audio_fingerprint"] and
-                    "vector" in features2["audio_fingerprint"]):
-                    # Neural network fingerprints
-                    fp_sim = self._cosine_similarity(
-                        features1["audio_fingerprint"]["vector"],
-                        features2["audio_fingerprint"]["vector"]
-                    )
-                    similarities["fingerprint_similarity"] = float(fp_sim)
-                
-                elif ("peaks" in features1["audio_fingerprint"] and
-                      "peaks" in features2["audio_fingerprint"]):
-                    # Peak fingerprints
-                    peak_sim = self._jaccard_similarity(
-                        features1["audio_fingerprint"]["peaks"],
-                        features2["audio_fingerprint"]["peaks"]
-                    )
-                    similarities["fingerprint_similarity"] = float(peak_sim)
-            
-            # Calculate overall similarity (weighted average)
-            weights = {
-                "timbre_similarity": 0.25,
-                "tonal_similarity": 0.2,
-                "tempo_similarity": 0.15,
-                "embedding_similarity": 0.3,
-                "fingerprint_similarity": 0.1
-            }
-            
-            # Only use available similarities
-            total_weight = 0
-            overall_sim = 0
-            
-            for key, weight in weights.items():
-                if key in similarities:
-                    overall_sim += similarities[key] * weight
-                    total_weight += weight
-            
-            if total_weight > 0:
-                overall_sim = overall_sim / total_weight
-            else:
-                overall_sim = 0
-            
-            similarities["overall_similarity"] = float(overall_sim)
-            
-            # Add interpretation
-            if overall_sim > 0.9:
-                match_type = "identical or nearly identical tracks"
-            elif overall_sim > 0.75:
-                match_type = "same song, possibly different recording"
-            elif overall_sim > 0.6:
-                match_type = "very similar songs"
-            elif overall_sim > 0.4:
-                match_type = "somewhat similar songs"
-            else:
-                match_type = "different songs"
+            similarities = self._pairwise_similarities(features1, features2, metrics)
+            overall_sim = self._overall_similarity(similarities)
+            similarities["overall_similarity"] = overall_sim
             
             return {
                 "comparison_result": {
                     "similarities": similarities,
-                    "match_type": match_type
+                    "match_type": self._match_type(overall_sim)
                 }
             }
         
@@ -728,6 +813,175 @@ class AudioFeaturePipeline:
             logger.error(f"Error comparing audio: {str(e)}")
             return {"error": str(e)}
     
+    async def compare_many(self, audio_files: Dict[str, bytes],
+                           threshold: float = 0.9,
+                           metrics: Optional[Sequence[str]] = None,
+                           include_matrix: bool = False,
+                           max_concurrency: int = 4) -> Dict[str, Any]:
+        """
+        Compare many audio files with each other and find near-duplicates
+        
+        Features are extracted once per file, then the weighted similarity
+        matrix is computed in vectorized blocks (see near_duplicate_report).
+        
+        Args:
+            audio_files: Audio file bytes keyed by file ID
+            threshold: Overall similarity at which files count as near-duplicates
+            metrics: Similarity metrics to use (default: all of SIMILARITY_WEIGHTS)
+            include_matrix: Whether to return the full similarity matrix
+            max_concurrency: Maximum number of files processed at once
+            
+        Returns:
+            Dictionary with near-duplicate clusters, pairs and per-file errors
+        """
+        try:
+            metrics = list(metrics or SIMILARITY_WEIGHTS)
+            unknown = set(metrics) - set(SIMILARITY_WEIGHTS)
+            if unknown:
+                return {"error": f"Unknown similarity metrics: {', '.join(sorted(unknown))}"}
+            
+            feature_groups = {SIMILARITY_FEATURE_GROUPS[metric] for metric in metrics}
+            semaphore = asyncio.Semaphore(max_concurrency)
+            
+            async def process(audio_data: bytes) -> Dict[str, Any]:
+                async with semaphore:
+                    return await self.process_audio(audio_data, feature_groups=feature_groups)
+            
+            file_ids = list(audio_files)
+            all_features = await asyncio.gather(*(process(audio_files[file_id]) for file_id in file_ids))
+            
+            # Files that failed to process are reported and left out
+            errors = {}
+            ids, features = [], []
+            for file_id, file_features in zip(file_ids, all_features):
+                if "error" in file_features:
+                    errors[file_id] = file_features["error"]
+                else:
+                    ids.append(file_id)
+                    features.append(file_features)
+            
+            report = await asyncio.to_thread(
+                near_duplicate_report,
+                ids,
+                features,
+                SIMILARITY_WEIGHTS,
+                metrics=metrics,
+                threshold=threshold,
+                include_matrix=include_matrix
+            )
+            
+            if include_matrix:
+                report["matrix_ids"] = ids
+            report["errors"] = errors
+            return report
+        
+        except Exception as e:
+            logger.error(f"Error comparing audio files: {str(e)}")
+            return {"error": str(e)}
+
+    def _pairwise_similarities(self, features1: Dict[str, Any], features2: Dict[str, Any],
+                               metrics: Sequence[str]) -> Dict[str, float]:
+        """
+        Calculate the requested similarity metrics between two feature sets
+        
+        Metrics whose features are missing from either side are left out.
+        """
+        similarities = {}
+        
+        # Basic feature similarity
+        if ("timbre_similarity" in metrics and
+            "mfccs" in features1 and "mfccs" in features2):
+            mfcc_sim = self._cosine_similarity(
+                features1["mfccs"], 
+                features2["mfccs"]
+            )
+            similarities["timbre_similarity"] = float(mfcc_sim)
+        
+        if ("tonal_similarity" in metrics and
+            "chroma_features" in features1 and "chroma_features" in features2):
+            chroma_sim = self._cosine_similarity(
+                features1["chroma_features"], 
+                features2["chroma_features"]
+            )
+            similarities["tonal_similarity"] = float(chroma_sim)
+        
+        # Tempo similarity
+        if ("tempo_similarity" in metrics and
+            "tempo" in features1 and "tempo" in features2):
+            tempo_diff = abs(features1["tempo"] - features2["tempo"])
+            tempo_max = max(features1["tempo"], features2["tempo"])
+            tempo_sim = 1.0 - (tempo_diff / tempo_max if tempo_max > 0 else 0)
+            similarities["tempo_similarity"] = float(tempo_sim)
+        
+        # Embedding similarity (if available)
+        if ("embedding_similarity" in metrics and
+            "audio_embedding" in features1 and 
+            "audio_embedding" in features2 and
+            "vector" in features1["audio_embedding"] and
+            "vector" in features2["audio_embedding"]):
+            
+            emb_sim = self._cosine_similarity(
+                features1["audio_embedding"]["vector"],
+                features2["audio_embedding"]["vector"]
+            )
+            similarities["embedding_similarity"] = float(emb_sim)
+        
+        # Fingerprint similarity
+        if ("fingerprint_similarity" in metrics and
+            "audio_fingerprint" in features1 and 
+            "audio_fingerprint" in features2):
+            
+            if ("vector" in features1["audio_fingerprint"] and
+                "vector" in features2["audio_fingerprint"]):
+                # Neural network fingerprints
+                fp_sim = self._cosine_similarity(
+                    features1["audio_fingerprint"]["vector"],
+                    features2["audio_fingerprint"]["vector"]
+                )
+                similarities["fingerprint_similarity"] = float(fp_sim)
+            
+            elif ("peaks" in features1["audio_fingerprint"] and
+                  "peaks" in features2["audio_fingerprint"]):
+                # Peak fingerprints
+                peak_sim = self._jaccard_similarity(
+                    features1["audio_fingerprint"]["peaks"],
+                    features2["audio_fingerprint"]["peaks"]
+                )
+                similarities["fingerprint_similarity"] = float(peak_sim)
+        
+        return similarities
+    
+    def _overall_similarity(self, similarities: Dict[str, float]) -> float:
+        """Weighted average of the available similarity metrics"""
+        # Only use available similarities
+        total_weight = 0
+        overall_sim = 0
+        
+        for key, weight in SIMILARITY_WEIGHTS.items():
+            if key in similarities:
+                overall_sim += similarities[key] * weight
+                total_weight += weight
+        
+        if total_weight > 0:
+            overall_sim = overall_sim / total_weight
+        else:
+            overall_sim = 0
+        
+        return float(overall_sim)
+    
+    def _match_type(self, overall_sim: float) -> str:
+        """Describe an overall similarity score"""
+        if overall_sim > 0.9:
+            return "identical or nearly identical tracks"
+        elif overall_sim > 0.75:
+            return "same song, possibly different recording"
+        elif overall_sim > 0.6:
+            return "very similar songs"
+        elif overall_sim > 0.4:
+            return "somewhat similar songs"
+        else:
+            return "different songs"
+    
     def _cosine_similarity(self, a, b) -> float:
         """
         Calculate cosine similarity between two vectors
@@ -0,0 +1,362 @@
+import numpy as np
+import logging
+import hashlib
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional, Callable, Iterable, Tuple, Union
+
+from .audio_feature_pipeline import AudioFeaturePipeline, BATCH_CACHE_NAMESPACE, FEATURE_GROUPS
+from .feature_extractors import decode_audio, extract_cpu_features
+
+logger = logging.getLogger(__name__)
+
+# Audio to analyze: file bytes, a file path, or a callable that downloads
+# the bytes when the decode stage gets to it
+AudioSource = Union[bytes, str, Callable[[], bytes]]
+
+# Marks the end of the input on a stage queue
+_DONE = object()
+
+@dataclass
+class StageMetrics:
+    """Throughput counters for one pipeline stage"""
+    name: str
+    workers: int
+    queue_capacity: int
+    items: int = 0
+    errors: int = 0
+    batches: int = 0
+    busy_seconds: float = 0.0
+    queue_high_water: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, seconds: float, items: int = 1, errors: int = 0) -> None:
+        with self._lock:
+            self.items += items
+            self.errors += errors
+            self.batches += 1
+            self.busy_seconds += seconds
+
+    def observe_queue(self, size: int) -> None:
+        with self._lock:
+            self.queue_high_water = max(self.queue_high_water, size)
+
+    def to_dict(self, elapsed: float) -> Dict[str, Any]:
+        """
+        Args:
+            elapsed: Wall time of the whole run in seconds
+
+        Returns:
+            Counters plus throughput and the share of worker time spent busy
+        """
+        elapsed = max(elapsed, 1e-9)
+        return {
+            "workers": self.workers,
+            "items": self.items,
+            "errors": self.errors,
+            "items_per_second": self.items / elapsed,
+            "busy_seconds": self.busy_seconds,
+            "utilization": min(1.0, self.busy_seconds / (elapsed * self.workers)),
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "queue_capacity": self.queue_capacity,
+            "queue_high_water": self.queue_high_water
+        }
+
+@dataclass
+class _BatchItem:
+    """A track moving through the stages"""
+    source_id: str
+    source: Optional[AudioSource]
+    started: float = field(default_factory=time.time)
+    audio_hash: Optional[str] = None
+    signal: Optional[np.ndarray] = None
+    cached: Optional[Dict[str, Any]] = None
+    cached_groups: List[str] = field(default_factory=list)
+    groups: List[str] = field(default_factory=list)  # Groups still to compute
+    features: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+class BatchAnalysisPipeline:
+    """
+    Pipelined feature extraction for many tracks
+
+    Tracks flow through four stages, each fed by a bounded queue, so a slow
+    stage holds the others back instead of the whole catalog piling up in
+    memory:
+
+    1. decode: threads read and hash each source, skip what is already
+       cached and decode the rest (the decoder and resampler release the GIL)
+    2. features: the CPU-only feature groups, run in a process pool so they
+       use every core
+    3. inference: one thread gathers up to batch_size tracks, waiting at most
+       batch_timeout seconds for a batch to fill, and calls each model once
+       per batch (see AudioFeaturePipeline.infer_batch)
+    4. write: caches the features, apart from process_audio's, and hands
+       each result to on_result
+
+    A track that fails in a stage skips the later ones and is written as an
+    error result, like process_audio's.
+    """
+
+    def __init__(self,
+                 pipeline: AudioFeaturePipeline,
+                 feature_groups: Optional[List[str]] = None,
+                 decode_workers: Optional[int] = None,
+                 feature_workers: Optional[int] = None,
+                 write_workers: int = 1,
+                 batch_size: Optional[int] = None,
+                 batch_timeout: float = 0.05,
+                 queue_size: Optional[int] = None):
+        """
+        Args:
+            pipeline: Pipeline providing models, cache and configuration
+            feature_groups: Feature groups to extract (default: all)
+            decode_workers: Decode threads (default: half the CPUs)
+            feature_workers: Feature worker processes (default: one per CPU)
+            write_workers: Writer threads
+            batch_size: Tracks per model call (default: the pipeline's batch_size)
+            batch_timeout: Seconds to wait for a batch to fill
+            queue_size: Capacity of each stage queue (default: two batches)
+        """
+        cpus = os.cpu_count() or 1
+        self.pipeline = pipeline
+        self.feature_groups = list(feature_groups or FEATURE_GROUPS)
+        self.model_groups = pipeline.model_feature_groups(self.feature_groups)
+        self.decode_workers = decode_workers or max(1, cpus // 2)
+        self.feature_workers = feature_workers or cpus
+        self.write_workers = write_workers
+        self.batch_size = batch_size or pipeline.config.batch_size
+        self.batch_timeout = batch_timeout
+        self.queue_size = queue_size or 2 * self.batch_size
+
+    def run(self, sources: Iterable[Tuple[str, AudioSource]],
+            on_result: Callable[[str, Dict[str, Any]], None]) -> Dict[str, Any]:
+        """
+        Analyze every source, blocking until all results are written
+
+        Sources are consumed lazily, so a generator over a large catalog only
+        holds about queue_size tracks per stage at a time.
+
+        Args:
+            sources: (source ID, audio) pairs
+            on_result: Called with each source ID and its features (or error),
+                from a writer thread
+
+        Returns:
+            Run metrics: counts, overall throughput and per-stage metrics
+        """
+        queues = {stage: queue.Queue(self.queue_size) for stage in ("decode", "features", "inference", "write")}
+        metrics = {
+            "decode": StageMetrics("decode", self.decode_workers, self.queue_size),
+            "features": StageMetrics("features", self.feature_workers, self.queue_size),
+            "inference": StageMetrics("inference", 1, self.queue_size),
+            "write": StageMetrics("write", self.write_workers, self.queue_size)
+        }
+        counts = {"count": 0, "computed": 0, "cached": 0, "errors": 0}
+        counts_lock = threading.Lock()
+
+        def write(item: _BatchItem) -> None:
+            result = self._result(item)
+            with counts_lock:
+                counts["errors" if "error" in result else "computed" if item.groups else "cached"] += 1
+            on_result(item.source_id, result)
+
+        start_time = time.time()
+
+        # Worker processes are spawned rather than forked: this process
+        # already runs threads and may hold a CUDA context
+        with ProcessPoolExecutor(self.feature_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            threads = [
+                *self._stage(self._decode, queues["decode"], queues["features"], metrics["decode"]),
+                *self._stage(lambda item: self._extract(pool, item), queues["features"], queues["inference"], metrics["features"]),
+                threading.Thread(
+                    target=self._infer_loop,
+                    args=(queues["inference"], queues["write"], metrics["inference"]),
+                    name="batch-inference",
+                    daemon=True
+                ),
+                *self._stage(write, queues["write"], None, metrics["write"])
+            ]
+            for thread in threads:
+                thread.start()
+
+            try:
+                for source_id, source in sources:
+                    queues["decode"].put(_BatchItem(source_id, source))
+                    counts["count"] += 1
+            finally:
+                queues["decode"].put(_DONE)
+                for thread in threads:
+                    thread.join()
+
+        elapsed = time.time() - start_time
+        logger.info(f"Batch analysis of {counts['count']} tracks took {elapsed:.2f}s")
+        return {
+            **counts,
+            "elapsed": elapsed,
+            "tracks_per_second": counts["count"] / max(elapsed, 1e-9),
+            "stages": {name: stage.to_dict(elapsed) for name, stage in metrics.items()}
+        }
+
+    def _stage(self, work: Callable[[_BatchItem], None], inbox: queue.Queue,
+               outbox: Optional[queue.Queue], metrics: StageMetrics) -> List[threading.Thread]:
+        """Worker threads applying work to each item from inbox and passing it on"""
+        remaining = [metrics.workers]
+        lock = threading.Lock()
+
+        def loop():
+            while True:
+                item = inbox.get()
+                if item is _DONE:
+                    # Leave the marker for the other workers; the last one
+                    # out closes the next stage
+                    inbox.put(_DONE)
+                    with lock:
+                        remaining[0] -= 1
+                        last = remaining[0] == 0
+                    if last and outbox is not None:
+                        outbox.put(_DONE)
+                    return
+
+                metrics.observe_queue(inbox.qsize() + 1)
+                # Failed tracks go straight through to the writers
+                if item.error is None or outbox is None:
+                    started = time.perf_counter()
+                    try:
+                        work(item)
+                        metrics.record(time.perf_counter() - started)
+                    except Exception as e:
+                        logger.error(f"Batch {metrics.name} failed for {item.source_id}: {str(e)}")
+                        item.error = str(e)
+                        metrics.record(time.perf_counter() - started, errors=1)
+
+                if outbox is not None:
+                    outbox.put(item)
+
+        return [
+            threading.Thread(target=loop, name=f"batch-{metrics.name}-{i}", daemon=True)
+            for i in range(metrics.workers)
+        ]
+
+    def _decode(self, item: _BatchItem) -> None:
+        """Load the source, look it up in the cache and decode it if needed"""
+        source, item.source = item.source, None
+        if callable(source):
+            data = source()
+        elif isinstance(source, str):
+            with open(source, "rb") as f:
+                data = f.read()
+        else:
+            data = source
+
+        item.audio_hash = hashlib.md5(data).hexdigest()
+        item.cached = self.pipeline.get_cached_features(item.audio_hash, BATCH_CACHE_NAMESPACE)
+        item.cached_groups = self.pipeline.cached_feature_groups(item.cached)
+        item.groups = [group for group in self.feature_groups if group not in item.cached_groups]
+
+        if item.groups:
+            # Paths are decoded from the file, letting librosa fall back to
+            # decoders that cannot read from memory
+            item.signal = decode_audio(source if isinstance(source, str) else data, self.pipeline.config.sample_rate)
+
+    def _extract(self, pool: ProcessPoolExecutor, item: _BatchItem) -> None:
+        """Compute the CPU-only feature groups in a worker process"""
+        groups = [group for group in item.groups if group not in self.model_groups]
+        if groups:
+            item.features.update(pool.submit(
+                extract_cpu_features,
+                item.signal,
+                self.pipeline.config.sample_rate,
+                self.pipeline.config.n_mfcc,
+                groups
+            ).result())
+
+    def _infer_loop(self, inbox: queue.Queue, outbox: queue.Queue, metrics: StageMetrics) -> None:
+        """Gather tracks that need models into batches and run them"""
+        pending: List[_BatchItem] = []
+        deadline = 0.0
+
+        while True:
+            try:
+                timeout = max(0.0, deadline - time.monotonic()) if pending else None
+                item = inbox.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is not None and item is not _DONE:
+                metrics.observe_queue(inbox.qsize() + 1)
+                if item.error is None and any(group in self.model_groups for group in item.groups):
+                    if not pending:
+                        deadline = time.monotonic() + self.batch_timeout
+                    pending.append(item)
+                else:
+                    outbox.put(item)
+
+            if pending and (item is None or item is _DONE or len(pending) >= self.batch_size
+                            or time.monotonic() >= deadline):
+                self._infer(pending, metrics)
+                for pending_item in pending:
+                    pending_item.signal = None
+                    outbox.put(pending_item)
+                pending = []
+
+            if item is _DONE:
+                outbox.put(_DONE)
+                return
+
+    def _infer(self, batch: List[_BatchItem], metrics: StageMetrics) -> None:
+        """Run the models on a batch, grouping tracks that need the same models"""
+        started = time.perf_counter()
+        errors = 0
+
+        by_groups: Dict[Tuple[str, ...], List[_BatchItem]] = {}
+        for item in batch:
+            groups = tuple(group for group in item.groups if group in self.model_groups)
+            by_groups.setdefault(groups, []).append(item)
+
+        for groups, items in by_groups.items():
+            try:
+                outputs = self.pipeline.infer_batch(
+                    [item.signal for item in items],
+                    self.pipeline.config.sample_rate,
+                    groups
+                )
+                for item, features in zip(items, outputs):
+                    item.features.update(features)
+            except Exception as e:
+                logger.error(f"Batch inference failed: {str(e)}")
+                for item in items:
+                    item.error = str(e)
+                errors += len(items)
+
+        metrics.record(time.perf_counter() - started, items=len(batch), errors=errors)
+
+    def _result(self, item: _BatchItem) -> Dict[str, Any]:
+        """Build a track's result, caching newly computed features"""
+        item.signal = None
+
+        if item.error is not None:
+            return {
+                "audio_id": item.audio_hash,
+                "error": item.error,
+                "processing_time": time.time() - item.started
+            }
+
+        if not item.groups:
+            return item.cached
+
+        result = {**item.cached, **item.features} if item.cached else dict(item.features)
+        result["audio_id"] = item.audio_hash
+        result["feature_groups"] = [
+            group for group in FEATURE_GROUPS
+            if group in item.cached_groups or group in item.groups
+        ]
+        result["processing_time"] = time.time() - item.started
+
+        self.pipeline.save_cached_features(item.audio_hash, result, BATCH_CACHE_NAMESPACE)
+        return result
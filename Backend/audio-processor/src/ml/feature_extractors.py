@@ -0,0 +1,218 @@
+import numpy as np
+import librosa
+import io
+import logging
+from typing import Dict, Any, Sequence, Union
+
+logger = logging.getLogger(__name__)
+
+# CPU-bound feature extraction used by AudioFeaturePipeline. These are plain
+# module-level functions of the decoded signal, so they can run in a thread
+# for single requests or in worker processes for batch analysis.
+
+def decode_audio(source: Union[bytes, str], sample_rate: int) -> np.ndarray:
+    """
+    Decode an audio file to a mono float32 signal
+    
+    Args:
+        source: Raw audio file bytes or a file path
+        sample_rate: Sample rate to resample to
+        
+    Returns:
+        Mono audio samples
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    y, _ = librosa.load(source, sr=sample_rate)
+    return y
+
+def extract_basic_features(y: np.ndarray, sr: int, n_mfcc: int = 20) -> Dict[str, Any]:
+    """Extract basic audio features using librosa"""
+    # Duration
+    duration = librosa.get_duration(y=y, sr=sr)
+    
+    # RMS energy
+    rms = np.mean(librosa.feature.rms(y=y))
+    
+    # Zero crossing rate
+    zcr = np.mean(librosa.feature.zero_crossing_rate(y=y))
+    
+    # Spectral features
+    spectral_centroid = np.mean(librosa.feature.spectral_centroid(y=y, sr=sr))
+    spectral_bandwidth = np.mean(librosa.feature.spectral_bandwidth(y=y, sr=sr))
+    spectral_rolloff = np.mean(librosa.feature.spectral_rolloff(y=y, sr=sr))
+    
+    # Tempo and beats
+    tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
+    
+    # MFCC features
+    mfccs = np.mean(librosa.feature.mfcc(
+        y=y, 
+        sr=sr, 
+        n_mfcc=n_mfcc
+    ), axis=1)
+    
+    # Chroma features
+    chroma = np.mean(librosa.feature.chroma_stft(y=y, sr=sr), axis=1)
+    
+    return {
+        "duration": float(duration),
+        "rms_energy": float(rms),
+        "zero_crossing_rate": float(zcr),
+        "spectral_centroid": float(spectral_centroid),
+        "spectral_bandwidth": float(spectral_bandwidth),
+        "spectral_rolloff": float(spectral_rolloff),
+        "tempo": float(tempo),
+        "mfccs": mfccs.tolist(),
+        "chroma_features": chroma.tolist()
+    }
+
+def extract_advanced_features(y: np.ndarray, sr: int) -> Dict[str, Any]:
+    """Extract advanced audio features"""
+    # Harmonic-percussive source separation
+    y_harmonic, y_percussive = librosa.effects.hpss(y)
+    
+    # Harmonic features
+    harmonic_rms = np.mean(librosa.feature.rms(y=y_harmonic))
+    
+    # Percussive features
+    percussive_rms = np.mean(librosa.feature.rms(y=y_percussive))
+    
+    # Onset detection
+    onset_env = librosa.onset.onset_strength(y=y, sr=sr)
+    onsets = librosa.onset.onset_detect(
+        onset_envelope=onset_env, 
+        sr=sr, 
+        units='time'
+    )
+    
+    # Pitch and harmonics
+    pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
+    pitch_mean = np.mean(pitches[pitches > 0]) if np.any(pitches > 0) else 0
+    
+    # Spectral contrast
+    contrast = np.mean(librosa.feature.spectral_contrast(y=y, sr=sr), axis=1)
+    
+    # Tonnetz features (tonal centroid features)
+    tonnetz = np.mean(librosa.feature.tonnetz(
+        y=librosa.effects.harmonic(y), 
+        sr=sr
+    ), axis=1)
+    
+    # Rhythm features
+    oenv = librosa.onset.onset_strength(y=y, sr=sr)
+    tempo_hist = librosa.feature.tempogram(
+        onset_envelope=oenv, 
+        sr=sr
+    )
+    tempo_hist_mean = np.mean(tempo_hist, axis=1)
+    
+    return {
+        "advanced_features": {
+            "harmonic_rms": float(harmonic_rms),
+            "percussive_rms": float(percussive_rms),
+            "onset_count": len(onsets),
+            "onset_rate": len(onsets) / (len(y) / sr) if len(y) > 0 else 0,
+            "pitch_mean": float(pitch_mean),
+            "spectral_contrast": contrast.tolist(),
+            "tonnetz": tonnetz.tolist(),
+            "tempo_histogram": tempo_hist_mean.tolist()
+        }
+    }
+
+def extract_peak_fingerprint(y: np.ndarray, sr: int) -> Dict[str, Any]:
+    """Generate basic audio fingerprint using peak finding algorithm"""
+    # Extract spectrogram
+    spec = np.abs(librosa.stft(y))
+    
+    # Find peaks in the spectrogram
+    peaks = []
+    for i in range(1, spec.shape[0]-1):
+        for j in range(1, spec.shape[1]-1):
+            if (spec[i, j] > spec[i-1, j] and 
+                spec[i, j] > spec[i+1, j] and 
+                spec[i, j] > spec[i, j-1] and 
+                spec[i, j] > spec[i, j+1] and
+                spec[i, j] > 0.5):  # Threshold to filter weak peaks
+                peaks.append((i, j, float(spec[i, j])))
+    
+    # Sort by magnitude and take top peaks
+    peaks.sort(key=lambda x: x[2], reverse=True)
+    top_peaks = peaks[:250]  # Use top 250 peaks
+    
+    # Create fingerprint from peak frequencies and times
+    fingerprint = [(int(p[0]), int(p[1])) for p in top_peaks]
+    
+    return {
+        "audio_fingerprint": {
+            "peaks": fingerprint,
+            "method": "peak_finding"
+        }
+    }
+
+def normalized_mel_spectrogram(y: np.ndarray, sr: int, n_mels: int = 128,
+                               n_fft: int = 2048, hop_length: int = 512) -> np.ndarray:
+    """
+    Mel spectrogram in dB, normalized to zero mean and unit variance
+    
+    Returns:
+        (n_mels, frames) float array
+    """
+    mel_spec = librosa.feature.melspectrogram(
+        y=y, 
+        sr=sr, 
+        n_mels=n_mels,
+        n_fft=n_fft,
+        hop_length=hop_length
+    )
+    mel_spec_db = librosa.power_to_db(mel_spec, ref=np.max)
+    
+    # Normalize
+    return (mel_spec_db - np.mean(mel_spec_db)) / (np.std(mel_spec_db) + 1e-8)
+
+def extract_cpu_features(y: np.ndarray, sr: int, n_mfcc: int, feature_groups: Sequence[str]) -> Dict[str, Any]:
+    """
+    Extract the feature groups that need no models
+    
+    Used by batch analysis, which runs it in worker processes. A failing
+    group is reported the same way AudioFeaturePipeline reports it.
+    
+    Args:
+        y: Mono audio samples
+        sr: Sample rate
+        n_mfcc: Number of MFCCs
+        feature_groups: Any of "basic", "advanced" and "fingerprint"
+            (peak fingerprint)
+        
+    Returns:
+        Dictionary containing the extracted features
+    """
+    result = {}
+    
+    if "basic" in feature_groups:
+        try:
+            basic_features = extract_basic_features(y, sr, n_mfcc)
+            result.update({
+                "duration": basic_features["duration"],
+                "sample_rate": sr,
+                **basic_features
+            })
+        except Exception as e:
+            logger.error(f"Error extracting basic features: {str(e)}")
+            result.update({"duration": 0, "error_basic_features": str(e)})
+    
+    if "advanced" in feature_groups:
+        try:
+            result.update(extract_advanced_features(y, sr))
+        except Exception as e:
+            logger.error(f"Error extracting advanced features: {str(e)}")
+            result["advanced_features"] = {"error": str(e)}
+    
+    if "fingerprint" in feature_groups:
+        try:
+            result.update(extract_peak_fingerprint(y, sr))
+        except Exception as e:
+            logger.error(f"Error generating basic fingerprint: {str(e)}")
+            result["audio_fingerprint"] = {"error": str(e)}
+    
+    return result
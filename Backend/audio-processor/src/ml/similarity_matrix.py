@@ -0,0 +1,274 @@
+import numpy as np
+import logging
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple, Any, Optional, Sequence
+
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+logger = logging.getLogger(__name__)
+
+# Rows of the similarity matrix computed at a time, bounding memory to
+# block_size x n floats per metric
+DEFAULT_BLOCK_SIZE = 512
+
+# Peak fingerprints are (frequency bin, frame) pairs; frames are packed
+# below this factor to give each peak a single integer key
+_PEAK_KEY_FACTOR = 1 << 32
+
+@dataclass
+class _MetricMatrix:
+    """Stacked features for one similarity metric"""
+    kind: str  # "cosine", "tempo" or "jaccard"
+    values: Any  # (n, d) unit rows, (n,) tempos, or (n, k) sparse indicator matrix
+    available: np.ndarray  # (n,) whether each file has this feature
+    sizes: Optional[np.ndarray] = None  # Peak counts, for Jaccard
+
+@dataclass
+class FeatureMatrices:
+    """Features of many files stacked per similarity metric"""
+    n: int
+    metrics: Dict[str, List[_MetricMatrix]] = field(default_factory=dict)
+
+def _cosine_matrix(vectors: Sequence[Optional[Sequence[float]]]) -> _MetricMatrix:
+    """Stack vectors as unit-length rows; vectors of an odd dimension count as missing"""
+    n = len(vectors)
+    dims = Counter(len(v) for v in vectors if v is not None and len(v))
+    if not dims:
+        return _MetricMatrix("cosine", np.zeros((n, 0), dtype=np.float32), np.zeros(n, dtype=bool))
+
+    dim = dims.most_common(1)[0][0]
+    matrix = np.zeros((n, dim), dtype=np.float32)
+    available = np.zeros(n, dtype=bool)
+    for i, vector in enumerate(vectors):
+        if vector is not None and len(vector) == dim:
+            matrix[i] = vector
+            available[i] = True
+
+    # Zero vectors stay zero, giving a similarity of 0 like _cosine_similarity
+    norms = np.linalg.norm(matrix, axis=1)
+    nonzero = norms > 0
+    matrix[nonzero] /= norms[nonzero, None]
+    return _MetricMatrix("cosine", matrix, available)
+
+def _peak_matrix(peak_lists: Sequence[Optional[Sequence[Sequence[int]]]]) -> _MetricMatrix:
+    """Stack peak fingerprints as a sparse file x peak indicator matrix"""
+    n = len(peak_lists)
+    rows, keys = [], []
+    sizes = np.zeros(n, dtype=np.float32)
+    available = np.zeros(n, dtype=bool)
+
+    for i, peaks in enumerate(peak_lists):
+        if peaks is None:
+            continue
+        available[i] = True
+        row_keys = {int(f) * _PEAK_KEY_FACTOR + int(t) for f, t in peaks}
+        sizes[i] = len(row_keys)
+        rows.extend([i] * len(row_keys))
+        keys.extend(row_keys)
+
+    # Renumber peak keys to dense column indices
+    unique_keys, columns = np.unique(np.array(keys, dtype=np.int64), return_inverse=True)
+    indicator = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (np.array(rows, dtype=np.int64), columns)),
+        shape=(n, len(unique_keys))
+    )
+    return _MetricMatrix("jaccard", indicator, available, sizes)
+
+def build_feature_matrices(features: Sequence[Dict[str, Any]], metrics: Sequence[str]) -> FeatureMatrices:
+    """
+    Stack per-file features into matrices for the requested metrics
+
+    Args:
+        features: Feature dictionaries from AudioFeaturePipeline.process_audio
+        metrics: Similarity metric names
+
+    Returns:
+        FeatureMatrices
+    """
+    result = FeatureMatrices(n=len(features))
+
+    def vectors(key: str, sub_key: Optional[str] = None) -> List[Optional[Sequence[float]]]:
+        values = []
+        for f in features:
+            value = f.get(key)
+            if sub_key is not None:
+                value = value.get(sub_key) if isinstance(value, dict) else None
+            values.append(value)
+        return values
+
+    if "timbre_similarity" in metrics:
+        result.metrics["timbre_similarity"] = [_cosine_matrix(vectors("mfccs"))]
+
+    if "tonal_similarity" in metrics:
+        result.metrics["tonal_similarity"] = [_cosine_matrix(vectors("chroma_features"))]
+
+    if "tempo_similarity" in metrics:
+        tempos = vectors("tempo")
+        available = np.array([t is not None for t in tempos], dtype=bool)
+        values = np.array([t if t is not None else 0.0 for t in tempos], dtype=np.float32)
+        result.metrics["tempo_similarity"] = [_MetricMatrix("tempo", values, available)]
+
+    if "embedding_similarity" in metrics:
+        result.metrics["embedding_similarity"] = [_cosine_matrix(vectors("audio_embedding", "vector"))]
+
+    if "fingerprint_similarity" in metrics:
+        # Neural and peak fingerprints are only comparable with their own kind
+        result.metrics["fingerprint_similarity"] = [
+            _cosine_matrix(vectors("audio_fingerprint", "vector")),
+            _peak_matrix(vectors("audio_fingerprint", "peaks"))
+        ]
+
+    return result
+
+def _metric_block(matrix: _MetricMatrix, rows: slice) -> Tuple[np.ndarray, np.ndarray]:
+    """Similarities and availability of rows against all files for one metric"""
+    available = matrix.available[rows, None] & matrix.available[None, :]
+
+    if matrix.kind == "cosine":
+        similarity = matrix.values[rows] @ matrix.values.T
+
+    elif matrix.kind == "tempo":
+        tempos = matrix.values
+        diff = np.abs(tempos[rows, None] - tempos[None, :])
+        largest = np.maximum(tempos[rows, None], tempos[None, :])
+        similarity = 1.0 - np.divide(diff, largest, out=np.zeros_like(diff), where=largest > 0)
+
+    else:
+        intersection = (matrix.values[rows] @ matrix.values.T).toarray()
+        union = matrix.sizes[rows, None] + matrix.sizes[None, :] - intersection
+        similarity = np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+    return similarity.astype(np.float32, copy=False), available
+
+def similarity_block(matrices: FeatureMatrices, weights: Dict[str, float],
+                     rows: slice) -> np.ndarray:
+    """
+    Weighted overall similarity of a block of rows against every file
+
+    Like the pairwise comparison, each pair's score averages only the
+    metrics available for both files.
+
+    Args:
+        matrices: Stacked features
+        weights: Weight of each metric
+        rows: Rows of the matrix to compute
+
+    Returns:
+        (rows, n) float32 overall similarities
+    """
+    start, stop, _ = rows.indices(matrices.n)
+    shape = (stop - start, matrices.n)
+    weighted_sum = np.zeros(shape, dtype=np.float32)
+    weight_total = np.zeros(shape, dtype=np.float32)
+
+    for metric, parts in matrices.metrics.items():
+        similarity = np.zeros(shape, dtype=np.float32)
+        available = np.zeros(shape, dtype=bool)
+        for part in parts:
+            part_similarity, part_available = _metric_block(part, rows)
+            np.copyto(similarity, part_similarity, where=part_available)
+            available |= part_available
+
+        weight = weights.get(metric, 0.0)
+        weighted_sum += np.where(available, similarity * weight, 0.0)
+        weight_total += available * weight
+
+    overall = np.divide(weighted_sum, weight_total, out=np.zeros(shape, dtype=np.float32), where=weight_total > 0)
+    np.minimum(overall, 1.0, out=overall)  # Rounding can push identical files just past 1
+    return overall
+
+def near_duplicate_report(ids: Sequence[str],
+                          features: Sequence[Dict[str, Any]],
+                          weights: Dict[str, float],
+                          metrics: Optional[Sequence[str]] = None,
+                          threshold: float = 0.9,
+                          include_matrix: bool = False,
+                          max_pairs: int = 10000,
+                          block_size: int = DEFAULT_BLOCK_SIZE) -> Dict[str, Any]:
+    """
+    Compare every file with every other and group near-duplicates
+
+    The similarity matrix is computed in row blocks, so memory stays
+    bounded for large libraries. Files are clustered by single linkage:
+    two files share a cluster if a chain of pairs at or above the threshold
+    connects them.
+
+    Args:
+        ids: Identifier of each file
+        features: Feature dictionaries, in the same order as ids
+        weights: Weight of each similarity metric
+        metrics: Metrics to use (default: all weighted metrics)
+        threshold: Overall similarity at which two files are near-duplicates
+        include_matrix: Whether to return the full overall similarity matrix
+        max_pairs: Maximum number of near-duplicate pairs listed
+        block_size: Rows computed at a time
+
+    Returns:
+        Dictionary with clusters, the most similar pairs and optionally
+        the matrix
+    """
+    n = len(ids)
+    metrics = list(metrics or weights)
+    matrices = build_feature_matrices(features, metrics)
+
+    pair_rows, pair_cols, pair_scores = [], [], []
+    matrix = np.zeros((n, n), dtype=np.float32) if include_matrix else None
+
+    for start in range(0, n, block_size):
+        rows = slice(start, min(start + block_size, n))
+        overall = similarity_block(matrices, weights, rows)
+        if matrix is not None:
+            matrix[rows] = overall
+
+        # Upper triangle only: each pair once, no self-matches
+        block_rows, block_cols = np.nonzero(overall >= threshold)
+        block_rows += start
+        upper = block_cols > block_rows
+        block_rows, block_cols = block_rows[upper], block_cols[upper]
+        pair_rows.append(block_rows)
+        pair_cols.append(block_cols)
+        pair_scores.append(overall[block_rows - start, block_cols])
+
+    pair_rows = np.concatenate(pair_rows) if pair_rows else np.zeros(0, dtype=np.intp)
+    pair_cols = np.concatenate(pair_cols) if pair_cols else np.zeros(0, dtype=np.intp)
+    pair_scores = np.concatenate(pair_scores) if pair_scores else np.zeros(0, dtype=np.float32)
+
+    # Connected components of the near-duplicate graph
+    graph = sparse.coo_matrix((np.ones(len(pair_rows)), (pair_rows, pair_cols)), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+
+    cluster_scores = {}
+    for row, score in zip(pair_rows, pair_scores):
+        label = labels[row]
+        cluster_scores[label] = max(cluster_scores.get(label, 0.0), float(score))
+
+    members = {}
+    for index, label in enumerate(labels):
+        if label in cluster_scores:
+            members.setdefault(label, []).append(ids[index])
+
+    clusters = sorted(
+        ({"members": members[label], "max_similarity": cluster_scores[label]} for label in members),
+        key=lambda cluster: len(cluster["members"]),
+        reverse=True
+    )
+
+    order = np.argsort(-pair_scores, kind="stable")[:max_pairs]
+    result = {
+        "count": n,
+        "metrics": metrics,
+        "threshold": threshold,
+        "clusters": clusters,
+        "pairs": [
+            {"file1": ids[pair_rows[i]], "file2": ids[pair_cols[i]], "similarity": float(pair_scores[i])}
+            for i in order
+        ],
+        "pair_count": int(len(pair_rows))
+    }
+
+    if matrix is not None:
+        result["matrix"] = matrix.tolist()
+
+    return result
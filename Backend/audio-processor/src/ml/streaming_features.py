@@ -0,0 +1,272 @@
+import numpy as np
+import logging
+import math
+from typing import Dict, List, Any, Optional, Sequence
+
+from .audio_feature_pipeline import AudioFeatureConfig
+from pcm_ring_buffer import PCMRingBuffer
+
+logger = logging.getLogger(__name__)
+
+class StreamingFeatureExtractor:
+    """
+    Incremental feature extractor for live audio streams
+
+    Audio is analyzed in frames of n_fft samples that advance by hop_length,
+    using the same STFT parameters as AudioFeaturePipeline. Each frame costs
+    one FFT plus constant-size bookkeeping: running statistics are kept as
+    accumulators and exponential averages, and the onset envelope used for
+    tempo is a fixed-length circular buffer, so history is never
+    reprocessed.
+
+    Updates are emitted every update_interval seconds and contain the mean
+    RMS and spectral centroid since the previous update, the onsets found
+    in that time, the rolling tempo and a smoothed chroma vector.
+    """
+
+    # Tempo search range and prior (log-normal around 120 BPM, one octave wide)
+    MIN_BPM = 40.0
+    MAX_BPM = 240.0
+    PRIOR_BPM = 120.0
+
+    # Chroma is computed from bins between C2 and this frequency
+    CHROMA_FMIN = 65.4
+    CHROMA_FMAX = 5000.0
+
+    def __init__(self,
+                 sample_rate: int,
+                 config: Optional[AudioFeatureConfig] = None,
+                 update_interval: float = 0.5,
+                 tempo_window: float = 8.0,
+                 onset_sensitivity: float = 2.0,
+                 min_onset_interval: float = 0.05):
+        """
+        Args:
+            sample_rate: Sample rate of the stream
+            config: Pipeline configuration providing n_fft and hop_length
+            update_interval: Seconds between emitted updates
+            tempo_window: Seconds of onset history used for tempo
+            onset_sensitivity: Standard deviations above the running mean
+                the onset envelope must reach to count as an onset
+            min_onset_interval: Minimum seconds between onsets
+        """
+        self.config = config or AudioFeatureConfig()
+        self.sample_rate = sample_rate
+        self.n_fft = self.config.n_fft
+        self.hop_length = self.config.hop_length
+        self.onset_sensitivity = onset_sensitivity
+
+        frame_rate = sample_rate / self.hop_length
+        self.frames_per_update = max(1, int(round(update_interval * frame_rate)))
+        self.min_onset_gap = max(1, int(round(min_onset_interval * frame_rate)))
+
+        # Periodic Hann window, as used by librosa's STFT
+        self._window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(self.n_fft) / self.n_fft)).astype(np.float32)
+        self._freqs = np.fft.rfftfreq(self.n_fft, 1.0 / sample_rate)
+
+        # Pitch class of each FFT bin within the chroma range
+        chroma_range = (self._freqs >= self.CHROMA_FMIN) & (self._freqs <= min(self.CHROMA_FMAX, sample_rate / 2))
+        self._chroma_bins = np.flatnonzero(chroma_range)
+        midi = 12 * np.log2(self._freqs[self._chroma_bins] / 440.0) + 69
+        self._chroma_classes = np.round(midi).astype(np.intp) % 12
+
+        # Onset envelope history for tempo estimation
+        self._onset_env = np.zeros(max(4, int(round(tempo_window * frame_rate))), dtype=np.float32)
+        self._min_lag = max(1, int(math.floor(60.0 * frame_rate / self.MAX_BPM)))
+        self._max_lag = min(len(self._onset_env) // 2, int(math.ceil(60.0 * frame_rate / self.MIN_BPM)))
+        lags = np.arange(self._min_lag, self._max_lag + 1)
+        self._tempo_prior = np.exp(-0.5 * np.log2(60.0 * frame_rate / lags / self.PRIOR_BPM) ** 2)
+
+        # Adapts within about a second
+        self._stats_decay = math.exp(-1.0 / frame_rate)
+        self._chroma_decay = math.exp(-1.0 / (2.0 * frame_rate))
+
+        # Own buffer for callers that push raw samples with process()
+        self._ring: Optional[PCMRingBuffer] = None
+
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget all stream history"""
+        self._frame_index = 0
+        self._prev_log_mag = np.zeros(len(self._freqs), dtype=np.float32)
+        self._flux_mean = 0.0
+        self._flux_var = 0.0
+        self._recent_flux = [0.0, 0.0]  # Envelope values for the two previous frames
+        self._last_onset_frame = -self.min_onset_gap
+        self._onset_env[:] = 0.0
+
+        self._chroma = np.zeros(12, dtype=np.float64)
+        self._rms_sum = 0.0
+        self._centroid_sum = 0.0
+        self._frames_in_update = 0
+        self._onsets: List[float] = []
+
+        if self._ring is not None:
+            self._ring.clear()
+
+    def _frame_time(self, frame_index: int) -> float:
+        """Time in seconds at the center of a frame"""
+        return (frame_index * self.hop_length + self.n_fft / 2) / self.sample_rate
+
+    def process_frame(self, frame: np.ndarray) -> Optional[Dict[str, Any]]:
+        """
+        Analyze the next frame of the stream
+
+        Frames must be consecutive, each starting hop_length samples after
+        the previous one.
+
+        Args:
+            frame: n_fft float32 samples
+
+        Returns:
+            An update if one is due after this frame, otherwise None
+        """
+        mag = np.abs(np.fft.rfft(frame * self._window))
+
+        # RMS and spectral centroid
+        rms = math.sqrt(float(np.dot(frame, frame)) / len(frame))
+        mag_sum = float(mag.sum())
+        centroid = float(np.dot(self._freqs, mag)) / mag_sum if mag_sum > 0 else 0.0
+
+        # Spectral flux of the log magnitude as onset strength
+        log_mag = np.log1p(mag).astype(np.float32)
+        flux = float(np.maximum(log_mag - self._prev_log_mag, 0.0).sum())
+        self._prev_log_mag = log_mag
+        self._onset_env[self._frame_index % len(self._onset_env)] = flux
+        self._detect_onset(flux)
+
+        # Exponentially smoothed chroma
+        power = mag[self._chroma_bins] ** 2
+        self._chroma *= self._chroma_decay
+        self._chroma += np.bincount(self._chroma_classes, weights=power, minlength=12)
+
+        self._rms_sum += rms
+        self._centroid_sum += centroid
+        self._frames_in_update += 1
+        self._frame_index += 1
+
+        if self._frames_in_update >= self.frames_per_update:
+            return self._emit_update()
+        return None
+
+    def _detect_onset(self, flux: float) -> None:
+        """
+        Pick the previous frame as an onset if it is a local peak that
+        stands out from the running envelope statistics
+        """
+        previous, candidate = self._recent_flux
+        threshold = self._flux_mean + self.onset_sensitivity * math.sqrt(self._flux_var)
+        candidate_frame = self._frame_index - 1
+
+        if (candidate > previous and candidate >= flux and candidate > threshold
+                and candidate_frame - self._last_onset_frame >= self.min_onset_gap
+                and candidate_frame > 0):
+            self._onsets.append(self._frame_time(candidate_frame))
+            self._last_onset_frame = candidate_frame
+
+        self._recent_flux = [candidate, flux]
+
+        delta = flux - self._flux_mean
+        self._flux_mean += (1 - self._stats_decay) * delta
+        self._flux_var = self._stats_decay * (self._flux_var + (1 - self._stats_decay) * delta * delta)
+
+    def _estimate_tempo(self) -> Optional[float]:
+        """
+        Estimate tempo from the autocorrelation of the onset envelope history
+
+        Returns:
+            Tempo in BPM, or None until enough history is available
+        """
+        n = min(self._frame_index, len(self._onset_env))
+        if n < 2 * self._max_lag or self._max_lag <= self._min_lag:
+            return None
+
+        # Oldest to newest
+        start = self._frame_index % len(self._onset_env) if self._frame_index >= len(self._onset_env) else 0
+        env = np.roll(self._onset_env, -start)[:n].astype(np.float64)
+        env -= env.mean()
+        if not env.any():
+            return None
+
+        size = 1 << (2 * n - 1).bit_length()
+        spectrum = np.fft.rfft(env, size)
+        autocorr = np.fft.irfft(spectrum * np.conj(spectrum), size)[:self._max_lag + 2]
+
+        scores = autocorr[self._min_lag:self._max_lag + 1] * self._tempo_prior
+        best = int(np.argmax(scores))
+        if scores[best] <= 0:
+            return None
+
+        # Refine the lag with a parabola through the neighbouring values
+        lag = float(best + self._min_lag)
+        i = best + self._min_lag
+        left, center, right = autocorr[i - 1], autocorr[i], autocorr[i + 1]
+        curvature = left - 2 * center + right
+        if curvature < 0:
+            lag += 0.5 * (left - right) / curvature
+
+        return 60.0 * self.sample_rate / (self.hop_length * lag)
+
+    def _emit_update(self) -> Dict[str, Any]:
+        """Build an update from the accumulated statistics and reset them"""
+        chroma_max = float(self._chroma.max())
+        chroma = self._chroma / chroma_max if chroma_max > 0 else self._chroma
+
+        update = {
+            "time": self._frame_index * self.hop_length / self.sample_rate,
+            "rms": self._rms_sum / self._frames_in_update,
+            "spectral_centroid": self._centroid_sum / self._frames_in_update,
+            "onsets": self._onsets,
+            "tempo": self._estimate_tempo(),
+            "chroma": chroma.tolist()
+        }
+
+        self._rms_sum = 0.0
+        self._centroid_sum = 0.0
+        self._frames_in_update = 0
+        self._onsets = []
+        return update
+
+    def process_frames(self, frames: Sequence[np.ndarray]) -> List[Dict[str, Any]]:
+        """
+        Analyze consecutive frames
+
+        Args:
+            frames: Frames of n_fft samples, each hop_length after the previous
+
+        Returns:
+            Updates emitted while processing the frames
+        """
+        updates = []
+        for frame in frames:
+            update = self.process_frame(frame)
+            if update is not None:
+                updates.append(update)
+        return updates
+
+    def process(self, samples: np.ndarray) -> List[Dict[str, Any]]:
+        """
+        Analyze the next block of raw samples
+
+        Samples that do not complete a frame are kept for the next call.
+
+        Args:
+            samples: 1-D float samples in [-1, 1], of any length
+
+        Returns:
+            Updates emitted while processing the samples
+        """
+        if self._ring is None:
+            self._ring = PCMRingBuffer(4 * self.n_fft, self.n_fft, self.hop_length)
+
+        updates = []
+        offset = 0
+        while offset < len(samples):
+            offset += self._ring.write(samples[offset:])
+            while self._ring.frames_ready:
+                update = self.process_frame(self._ring.peek_frame())
+                self._ring.advance()
+                if update is not None:
+                    updates.append(update)
+        return updates
@@ -7,9 +7,13 @@ using Supabase storage.
 
 import os
 import logging
+import threading
+import time
 import requests
 import json
-from typing import Dict, Any, BinaryIO, Optional, Union
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, BinaryIO, Iterator, List, Optional, Tuple, Union
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -20,12 +24,26 @@ logger = logging.getLogger(__name__)
 class SupabaseStorage:
     """Client for interacting with Supabase Storage"""
     
+    # Maximum number of requests in flight for batch operations that have
+    # no multi-object endpoint (uploads)
+    BATCH_CONCURRENCY = 8
+    
+    # A cached signed URL is reused until this many seconds before it expires
+    SIGNED_URL_EXPIRY_MARGIN = 60
+    
+    # Most signed URLs kept in the local cache; the least recently used go first
+    SIGNED_URL_CACHE_SIZE = 4096
+    
     def __init__(self):
         self.supabase_url = os.environ.get('SUPABASE_URL')
         self.supabase_key = os.environ.get('SUPABASE_API_KEY')
         self.audio_bucket = 'audio-files'
         self.waveform_bucket = 'waveform-images'
         
+        # Local cache of signed URLs: filename -> (signed_url, expires_at)
+        self._signed_url_cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._signed_url_lock = threading.Lock()
+        
         if not self.supabase_url or not self.supabase_key:
             logger.error("Missing Supabase credentials. Set SUPABASE_URL and SUPABASE_API_KEY environment variables.")
             raise ValueError("Missing Supabase credentials")
@@ -106,29 +124,10 @@ class SupabaseStorage:
         # Ensure buckets exist
         self.ensure_buckets_exist()
         
-        url = f"{self.storage_url}/object/{self.audio_bucket}/{filename}"
-        
-        headers = {**self.headers, "Content-Type": content_type}
-        
         try:
-            response = requests.post(
-                url,
-                headers=headers,
-                data=file_data
-            )
-            response.raise_for_status()
-            
-            result = response.json()
+            result = self._upload_object(self.audio_bucket, file_data, filename, content_type)
             logger.info(f"Successfully uploaded audio file: {filename}")
-            
-            # Return upload info with public URL
-            return {
-                "key": result.get("Key"),
-                "filename": filename,
-                "size": len(file_data),
-                "content_type": content_type,
-                "public_url": f"{self.supabase_url}/storage/v1/object/public/{self.audio_bucket}/{filename}"
-            }
+            return result
         
         except requests.exceptions.RequestException as e:
             logger.error(f"Error uploading audio file to Supabase: {e}")
@@ -170,7 +169,7 @@ class SupabaseStorage:
                 "key": result.get("Key"),
                 "filename": filename,
                 "size": len(image_data),
-                "public_url": f"{self.supabase_url}/storage/v1/object/public/{self.waveform_bucket}/{filename}"
+                "public_url": self.get_waveform_url(filename)
             }
         
         except requests.exceptions.RequestException as e:
@@ -179,6 +178,18 @@ class SupabaseStorage:
                 logger.error(f"Response content: {e.response.text}")
             raise
     
+    def get_waveform_url(self, filename: str) -> str:
+        """
+        Get the public URL a waveform image is served from
+        
+        Args:
+            filename: The waveform image filename
+            
+        Returns:
+            Public URL string
+        """
+        return f"{self.supabase_url}/storage/v1/object/public/{self.waveform_bucket}/{filename}"
+    
     def get_audio_file(self, filename: str) -> bytes:
         """
         Get an audio file from Supabase Storage
@@ -205,6 +216,113 @@ class SupabaseStorage:
                 logger.error(f"Response content: {e.response.text}")
             raise
     
+    def list_audio_files(self, prefix: str = "", page_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        List the audio files under a prefix, descending into folders
+        
+        Pages are fetched lazily, so the listing can be consumed while a
+        large bucket is still being enumerated.
+        
+        Args:
+            prefix: Folder to list, without a trailing slash ("" for the whole bucket)
+            page_size: Number of entries fetched per request
+            
+        Yields:
+            Dicts with the file's full name (usable with get_audio_file),
+            size and content type, in name order within each folder
+        """
+        url = f"{self.storage_url}/object/list/{self.audio_bucket}"
+        offset = 0
+        
+        while True:
+            try:
+                response = requests.post(
+                    url,
+                    headers=self.headers,
+                    json={
+                        "prefix": prefix,
+                        "limit": page_size,
+                        "offset": offset,
+                        "sortBy": {"column": "name", "order": "asc"}
+                    }
+                )
+                response.raise_for_status()
+                entries = response.json()
+            
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Error listing audio files in Supabase: {e}")
+                if hasattr(e, 'response') and e.response is not None:
+                    logger.error(f"Response content: {e.response.text}")
+                raise
+            
+            for entry in entries:
+                name = f"{prefix}/{entry['name']}" if prefix else entry["name"]
+                
+                # Folders are listed without an ID
+                if entry.get("id") is None:
+                    yield from self.list_audio_files(name, page_size)
+                    continue
+                
+                metadata = entry.get("metadata") or {}
+                yield {
+                    "name": name,
+                    "size": metadata.get("size"),
+                    "content_type": metadata.get("mimetype")
+                }
+            
+            if len(entries) < page_size:
+                return
+            offset += page_size
+    
+    def stream_audio_file(self, filename: str, byte_range: Optional[str] = None,
+                          chunk_size: int = 64 * 1024) -> Tuple[int, Dict[str, str], Iterator[bytes]]:
+        """
+        Stream an audio file from Supabase Storage, optionally a byte range of it
+        
+        Args:
+            filename: The filename to retrieve
+            byte_range: Value of an HTTP Range header (e.g. "bytes=0-1023")
+            chunk_size: Maximum size of each yielded chunk in bytes
+            
+        Returns:
+            Tuple of (HTTP status, response headers to forward, body iterator)
+        """
+        url = f"{self.storage_url}/object/{self.audio_bucket}/{filename}"
+        
+        headers = dict(self.headers)
+        if byte_range:
+            headers["Range"] = byte_range
+        
+        try:
+            response = requests.get(
+                url,
+                headers=headers,
+                stream=True
+            )
+            if response.status_code != 416:
+                response.raise_for_status()
+        
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error streaming audio file from Supabase: {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                logger.error(f"Response content: {e.response.text}")
+            raise
+        
+        forwarded = {
+            name: response.headers[name]
+            for name in ("Content-Type", "Content-Length", "Content-Range", "Accept-Ranges", "ETag", "Last-Modified")
+            if name in response.headers
+        }
+        forwarded.setdefault("Accept-Ranges", "bytes")
+        
+        def body() -> Iterator[bytes]:
+            with response:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        yield chunk
+        
+        return response.status_code, forwarded, body()
+    
     def delete_audio_file(self, filename: str) -> bool:
         """
         Delete an audio file from Supabase Storage
@@ -223,6 +341,8 @@ class SupabaseStorage:
                 headers=self.headers
             )
             response.raise_for_status()
+            with self._signed_url_lock:
+                self._signed_url_cache.pop(filename, None)
             logger.info(f"Successfully deleted audio file: {filename}")
             return True
         
@@ -238,11 +358,16 @@ class SupabaseStorage:
         
         Args:
             filename: The filename to access
-            expiry_seconds: The time in seconds until the link expires
+            expiry_seconds: The time in seconds until a new link expires; a
+                cached link is reused until shortly before it expires
             
         Returns:
             Signed URL string
         """
+        cached_url = self._get_cached_signed_url(filename)
+        if cached_url:
+            return cached_url
+        
         url = f"{self.storage_url}/object/sign/{self.audio_bucket}/{filename}"
         
         params = {
@@ -257,13 +382,218 @@ class SupabaseStorage:
             )
             response.raise_for_status()
             result = response.json()
-            return result.get("signedURL")
+            signed_url = result.get("signedURL")
+            self._cache_signed_url(filename, signed_url, expiry_seconds)
+            return signed_url
         
         except requests.exceptions.RequestException as e:
             logger.error(f"Error creating signed URL for Supabase: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 logger.error(f"Response content: {e.response.text}")
             raise
+    
+    def upload_audio_files(self, files: List[Tuple[bytes, str]],
+                           content_type: str = 'audio/wav') -> List[Dict[str, Any]]:
+        """
+        Upload several audio files to Supabase Storage
+        
+        The storage API has no multi-object upload endpoint, so uploads are
+        fanned out over a bounded thread pool.
+        
+        Args:
+            files: List of (file_data, filename) pairs
+            content_type: The MIME type of the audio
+            
+        Returns:
+            One result per input, in input order, each containing the
+            filename, a success flag and either the upload info or an error
+        """
+        if not files:
+            return []
+        
+        # Ensure buckets exist once for the whole batch
+        self.ensure_buckets_exist()
+        
+        def upload(item: Tuple[bytes, str]) -> Dict[str, Any]:
+            file_data, filename = item
+            try:
+                return {
+                    "filename": filename,
+                    "success": True,
+                    "result": self._upload_object(self.audio_bucket, file_data, filename, content_type)
+                }
+            except requests.exceptions.RequestException as e:
+                return {"filename": filename, "success": False, "error": str(e)}
+        
+        max_workers = min(self.BATCH_CONCURRENCY, len(files))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(upload, files))
+        
+        logger.info(f"Uploaded {sum(r['success'] for r in results)}/{len(files)} audio files")
+        return results
+    
+    def delete_audio_files(self, filenames: List[str]) -> List[Dict[str, Any]]:
+        """
+        Delete several audio files from Supabase Storage in a single request
+        
+        Args:
+            filenames: The filenames to delete
+            
+        Returns:
+            One result per input, in input order, each containing the
+            filename, a success flag and an error if the file was not deleted
+        """
+        if not filenames:
+            return []
+        
+        url = f"{self.storage_url}/object/{self.audio_bucket}"
+        
+        try:
+            response = requests.delete(
+                url,
+                headers=self.headers,
+                json={"prefixes": list(filenames)}
+            )
+            response.raise_for_status()
+            deleted = {obj.get("name") for obj in response.json()}
+        
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error deleting audio files from Supabase: {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                logger.error(f"Response content: {e.response.text}")
+            return [{"filename": filename, "success": False, "error": str(e)} for filename in filenames]
+        
+        with self._signed_url_lock:
+            for filename in filenames:
+                self._signed_url_cache.pop(filename, None)
+        
+        results = []
+        for filename in filenames:
+            if filename in deleted:
+                results.append({"filename": filename, "success": True})
+            else:
+                results.append({"filename": filename, "success": False, "error": "Object not found"})
+        
+        logger.info(f"Deleted {len(deleted)}/{len(filenames)} audio files")
+        return results
+    
+    def create_signed_urls(self, filenames: List[str], expiry_seconds: int = 3600) -> List[Dict[str, Any]]:
+        """
+        Create signed URLs for several private audio files
+        
+        URLs still valid in the local cache are reused; the rest are signed
+        with a single request to the multi-object signing endpoint.
+        
+        Args:
+            filenames: The filenames to access
+            expiry_seconds: The time in seconds until new links expire
+            
+        Returns:
+            One result per input, in input order, each containing the
+            filename, a success flag and either the signed URL or an error
+        """
+        signed: Dict[str, Dict[str, Any]] = {}
+        missing = []
+        for filename in filenames:
+            cached_url = self._get_cached_signed_url(filename)
+            if cached_url:
+                signed[filename] = {"filename": filename, "success": True, "signed_url": cached_url}
+            elif filename not in missing:
+                missing.append(filename)
+        
+        if missing:
+            url = f"{self.storage_url}/object/sign/{self.audio_bucket}"
+            
+            try:
+                response = requests.post(
+                    url,
+                    headers=self.headers,
+                    json={"expiresIn": expiry_seconds, "paths": missing}
+                )
+                response.raise_for_status()
+                
+                for item in response.json():
+                    path = item.get("path")
+                    signed_url = item.get("signedURL")
+                    if item.get("error") or not signed_url:
+                        signed[path] = {
+                            "filename": path,
+                            "success": False,
+                            "error": item.get("error") or "No signed URL returned"
+                        }
+                    else:
+                        self._cache_signed_url(path, signed_url, expiry_seconds)
+                        signed[path] = {"filename": path, "success": True, "signed_url": signed_url}
+            
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Error creating signed URLs for Supabase: {e}")
+                if hasattr(e, 'response') and e.response is not None:
+                    logger.error(f"Response content: {e.response.text}")
+                for filename in missing:
+                    signed[filename] = {"filename": filename, "success": False, "error": str(e)}
+        
+        return [
+            signed.get(filename, {"filename": filename, "success": False, "error": "No signed URL returned"})
+            for filename in filenames
+        ]
+    
+    def _upload_object(self, bucket: str, file_data: bytes, filename: str, content_type: str) -> Dict[str, Any]:
+        """
+        Upload a single object without checking buckets or catching errors
+        """
+        url = f"{self.storage_url}/object/{bucket}/{filename}"
+        
+        headers = {**self.headers, "Content-Type": content_type}
+        
+        response = requests.post(
+            url,
+            headers=headers,
+            data=file_data
+        )
+        response.raise_for_status()
+        result = response.json()
+        
+        return {
+            "key": result.get("Key"),
+            "filename": filename,
+            "size": len(file_data),
+            "content_type": content_type,
+            "public_url": f"{self.supabase_url}/storage/v1/object/public/{bucket}/{filename}"
+        }
+    
+    def _get_cached_signed_url(self, filename: str) -> Optional[str]:
+        """
+        Return a cached signed URL unless it expires within the margin
+        """
+        with self._signed_url_lock:
+            entry = self._signed_url_cache.get(filename)
+            if entry is None:
+                return None
+            
+            signed_url, expires_at = entry
+            if expires_at - time.monotonic() >= self.SIGNED_URL_EXPIRY_MARGIN:
+                self._signed_url_cache.move_to_end(filename)
+                return signed_url
+            
+            del self._signed_url_cache[filename]
+            return None
+    
+    def _cache_signed_url(self, filename: str, signed_url: Optional[str], expiry_seconds: int) -> None:
+        """
+        Remember a signed URL until shortly before it expires
+        """
+        if not signed_url or expiry_seconds <= self.SIGNED_URL_EXPIRY_MARGIN:
+            return
+        
+        expires_at = time.monotonic() + expiry_seconds
+        with self._signed_url_lock:
+            # Keep whichever URL lasts longer
+            entry = self._signed_url_cache.get(filename)
+            if entry is None or entry[1] < expires_at:
+                self._signed_url_cache[filename] = (signed_url, expires_at)
+            self._signed_url_cache.move_to_end(filename)
+            while len(self._signed_url_cache) > self.SIGNED_URL_CACHE_SIZE:
+                self._signed_url_cache.popitem(last=False)
 
 # Create a singleton instance
 supabase_storage = SupabaseStorage()
@@ -0,0 +1,218 @@
+"""
+WAV Parsing for Audio Processor
+
+This module reads WAV/RIFF data held in memory. The header is parsed
+directly and the PCM payload is exposed as a NumPy view over the original
+bytes, so no temporary files or copies are needed to inspect audio. It
+also builds WAV headers for audio that is streamed as it is produced.
+"""
+
+import logging
+import struct
+from dataclasses import dataclass
+from typing import Optional, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# Some writers of streamed WAV data leave the size fields at these values
+_UNKNOWN_SIZES = (0, 0xFFFFFFFF)
+
+WAV_HEADER_SIZE = 44
+
+@dataclass
+class WavData:
+    """Parsed WAV header with a view of the sample data"""
+    sample_rate: int
+    n_channels: int
+    sample_width: int  # bytes per sample
+    format_tag: int
+    samples: np.ndarray  # (frames, channels)
+
+    @property
+    def n_frames(self) -> int:
+        """Number of audio frames"""
+        return self.samples.shape[0]
+
+    @property
+    def duration(self) -> float:
+        """Duration in seconds"""
+        return self.n_frames / self.sample_rate if self.sample_rate else 0.0
+
+    @property
+    def is_float(self) -> bool:
+        """Whether the samples are IEEE floats"""
+        return self.format_tag == WAVE_FORMAT_IEEE_FLOAT
+
+    def to_float32(self) -> np.ndarray:
+        """
+        Convert the samples to float32 in [-1, 1]
+
+        Returns:
+            (frames, channels) float32 array
+        """
+        if self.is_float:
+            return self.samples.astype(np.float32, copy=False)
+        if self.sample_width == 1:
+            return (self.samples.astype(np.float32) - 128.0) / 128.0
+        full_scale = float(1 << (self.sample_width * 8 - 1))
+        return self.samples.astype(np.float32) / full_scale
+
+    def to_mono_float32(self) -> np.ndarray:
+        """
+        Convert the samples to a mono float32 signal in [-1, 1]
+
+        Returns:
+            1-D float32 array
+        """
+        audio = self.to_float32()
+        if self.n_channels == 1:
+            return audio[:, 0]
+        return audio.mean(axis=1, dtype=np.float32)
+
+def wav_header(sample_rate: int, n_channels: int = 1, sample_width: int = 2,
+               n_frames: Optional[int] = None) -> bytes:
+    """
+    Build a 44-byte PCM WAV header
+
+    When the length is not known in advance, the RIFF and data sizes are
+    set to 0xFFFFFFFF, which streaming-aware decoders read as "until the
+    end of the stream".
+
+    Args:
+        sample_rate: Sample rate in Hz
+        n_channels: Number of channels
+        sample_width: Bytes per sample
+        n_frames: Number of frames that will follow, if known
+
+    Returns:
+        WAV header bytes
+    """
+    block_align = n_channels * sample_width
+
+    if n_frames is None:
+        data_size = riff_size = 0xFFFFFFFF
+    else:
+        data_size = n_frames * block_align
+        riff_size = min(data_size + WAV_HEADER_SIZE - 8, 0xFFFFFFFF)
+
+    return struct.pack(
+        '<4sI4s4sIHHIIHH4sI',
+        b'RIFF', riff_size, b'WAVE',
+        b'fmt ', 16, WAVE_FORMAT_PCM, n_channels, sample_rate,
+        sample_rate * block_align, block_align, sample_width * 8,
+        b'data', data_size
+    )
+
+def parse_wav(data: Union[bytes, bytearray, memoryview]) -> WavData:
+    """
+    Parse WAV data held in memory
+
+    8, 16 and 32-bit integer and 32/64-bit float samples are returned as
+    zero-copy views over the input. 24-bit samples have no matching NumPy
+    dtype and are unpacked into int32 with their 24-bit range preserved.
+
+    Args:
+        data: Complete or truncated WAV file contents
+
+    Returns:
+        WavData with a (frames, channels) sample array
+
+    Raises:
+        ValueError: If the data is not a supported WAV file
+    """
+    view = memoryview(data)
+    if len(view) < 12 or view[0:4] != b'RIFF' or view[8:12] != b'WAVE':
+        raise ValueError("Not a RIFF/WAVE file")
+
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        chunk_size = struct.unpack_from('<I', view, offset + 4)[0]
+        body = offset + 8
+
+        if chunk_id == b'fmt ':
+            fmt = _parse_fmt_chunk(view[body:body + chunk_size])
+
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise ValueError("WAV data chunk appears before fmt chunk")
+
+            available = len(view) - body
+            if chunk_size in _UNKNOWN_SIZES or chunk_size > available:
+                chunk_size = available
+
+            format_tag, n_channels, sample_rate, sample_width = fmt
+            samples = _samples_from_buffer(view, body, chunk_size, format_tag, n_channels, sample_width)
+            return WavData(
+                sample_rate=sample_rate,
+                n_channels=n_channels,
+                sample_width=sample_width,
+                format_tag=format_tag,
+                samples=samples
+            )
+
+        # Chunks are padded to an even number of bytes
+        offset = body + chunk_size + (chunk_size & 1)
+
+    raise ValueError("WAV file has no data chunk")
+
+def _parse_fmt_chunk(chunk: memoryview) -> Tuple[int, int, int, int]:
+    """
+    Parse a fmt chunk
+
+    Returns:
+        Tuple of (format_tag, n_channels, sample_rate, sample_width)
+    """
+    if len(chunk) < 16:
+        raise ValueError("WAV fmt chunk is truncated")
+
+    format_tag, n_channels, sample_rate, _byte_rate, _block_align, bits = struct.unpack_from('<HHIIHH', chunk)
+
+    # The real format of an extensible file is the first two bytes of its sub-format GUID
+    if format_tag == WAVE_FORMAT_EXTENSIBLE:
+        if len(chunk) < 26:
+            raise ValueError("WAV extensible fmt chunk is truncated")
+        format_tag = struct.unpack_from('<H', chunk, 24)[0]
+
+    if format_tag not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+        raise ValueError(f"Unsupported WAV format: 0x{format_tag:04x}")
+    if n_channels < 1:
+        raise ValueError("WAV file has no channels")
+    if bits % 8:
+        raise ValueError(f"Unsupported WAV sample size: {bits} bits")
+
+    return format_tag, n_channels, sample_rate, bits // 8
+
+def _samples_from_buffer(view: memoryview, offset: int, size: int,
+                         format_tag: int, n_channels: int, sample_width: int) -> np.ndarray:
+    """Build a (frames, channels) sample array over the data chunk"""
+    n_frames = size // (n_channels * sample_width)
+    count = n_frames * n_channels
+
+    if format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        dtypes = {4: '<f4', 8: '<f8'}
+    else:
+        dtypes = {1: np.uint8, 2: '<i2', 4: '<i4'}
+
+    if sample_width in dtypes:
+        samples = np.frombuffer(view, dtype=dtypes[sample_width], count=count, offset=offset)
+        return samples.reshape(n_frames, n_channels)
+
+    if format_tag == WAVE_FORMAT_PCM and sample_width == 3:
+        raw = np.frombuffer(view, dtype=np.uint8, count=count * 3, offset=offset).reshape(-1, 3)
+
+        # Place each sample in the top three bytes of an int32, then shift
+        # back down so the sign is extended
+        widened = np.zeros((count, 4), dtype=np.uint8)
+        widened[:, 1:] = raw
+        samples = widened.view('<i4').reshape(-1) >> 8
+        return samples.reshape(n_frames, n_channels)
+
+    raise ValueError(f"Unsupported WAV sample size: {sample_width * 8} bits")
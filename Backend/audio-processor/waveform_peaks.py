@@ -0,0 +1,312 @@
+"""
+Waveform Peaks for Audio Processor
+
+This module builds multi-resolution waveform peak data, similar to
+audiowaveform's .dat files: min/max pairs at successive zoom levels,
+each level halving the resolution of the one before it. The pyramid is
+computed in a single pass over the audio and serialized to a compact
+binary format so it can be stored next to the audio and served by zoom
+level and time range without decoding the audio again. A pyramid built
+from samples also keeps the mean square of each level 0 peak in memory,
+so image columns with an RMS band can be drawn from it; the serialized
+format holds min/max pairs only.
+
+Binary layout (little-endian):
+
+    magic              4 bytes  b'SSPK'
+    version            uint16
+    flags              uint16   (reserved, 0)
+    sample_rate        uint32
+    samples_per_pixel  uint32   (resolution of level 0)
+    level_count        uint32
+    level lengths      uint32 * level_count
+    level data         int16 min/max pairs, level 0 first
+"""
+
+import logging
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PEAKS_MAGIC = b'SSPK'
+PEAKS_VERSION = 1
+
+_HEADER = struct.Struct('<4sHHIII')
+
+# Number of level 0 peaks to aim for on short audio
+MIN_PEAKS = 2048
+
+class PeaksPyramid:
+    """Min/max waveform peaks at successive zoom levels"""
+
+    def __init__(self, sample_rate: int, samples_per_pixel: int, levels: List[np.ndarray],
+                 mean_squares: Optional[np.ndarray] = None):
+        """
+        Args:
+            sample_rate: Sample rate of the source audio
+            samples_per_pixel: Number of audio frames per peak at level 0
+            levels: One (n, 2) int16 array of min/max pairs per level
+            mean_squares: Optional mean square of each level 0 peak, with
+                full scale as 1
+        """
+        self.sample_rate = sample_rate
+        self.samples_per_pixel = samples_per_pixel
+        self.levels = levels
+        self.mean_squares = mean_squares
+
+    @classmethod
+    def from_samples(cls, samples: np.ndarray, sample_rate: int,
+                     samples_per_pixel: int = 256, max_levels: int = 16,
+                     min_peaks: int = MIN_PEAKS) -> 'PeaksPyramid':
+        """
+        Build a peaks pyramid from PCM samples
+
+        Only level 0 touches the audio; every further level is reduced from
+        the level below it. Audio too short for min_peaks peaks at the
+        requested resolution gets a finer level 0, so short clips still
+        have enough detail to fill a full-width image.
+
+        Args:
+            samples: Sample array, either 1-D or (frames, channels). Float
+                samples are expected in [-1, 1]; integer samples are scaled
+                from their full range
+            sample_rate: Sample rate of the audio
+            samples_per_pixel: Number of audio frames per peak at level 0
+            max_levels: Maximum number of zoom levels to build
+            min_peaks: Number of level 0 peaks to aim for on short audio
+
+        Returns:
+            PeaksPyramid instance
+        """
+        if samples_per_pixel <= 0:
+            raise ValueError("samples_per_pixel must be positive")
+
+        samples = np.asarray(samples)
+        if samples.ndim == 1:
+            samples = samples.reshape(-1, 1)
+
+        n_frames = samples.shape[0]
+        if n_frames == 0:
+            return cls(sample_rate, samples_per_pixel, [np.zeros((0, 2), dtype=np.int16)],
+                       np.zeros(0, dtype=np.float32))
+        samples_per_pixel = max(1, min(samples_per_pixel, n_frames // max(min_peaks, 1)))
+
+        edges = np.arange(0, n_frames, samples_per_pixel)
+        mins = np.minimum.reduceat(samples, edges, axis=0).min(axis=1)
+        maxs = np.maximum.reduceat(samples, edges, axis=0).max(axis=1)
+
+        centered = samples.astype(np.int16) - 128 if samples.dtype == np.uint8 else samples
+        squares = np.add.reduceat(np.square(centered, dtype=np.float32), edges, axis=0).sum(axis=1)
+        counts = np.diff(np.append(edges, n_frames)) * samples.shape[1]
+        mean_squares = (squares / counts / cls._full_scale(samples.dtype) ** 2).astype(np.float32)
+
+        levels = [np.stack([cls._quantize(mins), cls._quantize(maxs)], axis=1)]
+
+        while len(levels) < max_levels and len(levels[-1]) > 1:
+            previous = levels[-1]
+            if len(previous) % 2:
+                previous = np.concatenate([previous, previous[-1:]])
+            pairs = previous.reshape(-1, 2, 2)
+            levels.append(np.stack([pairs[:, :, 0].min(axis=1), pairs[:, :, 1].max(axis=1)], axis=1))
+
+        return cls(sample_rate, samples_per_pixel, levels, mean_squares)
+
+    @staticmethod
+    def _full_scale(dtype: np.dtype) -> float:
+        """Amplitude of a full-scale sample of the given type"""
+        if dtype == np.uint8:
+            return 128.0
+        if np.issubdtype(dtype, np.integer):
+            return float(2 ** (np.dtype(dtype).itemsize * 8 - 1))
+        return 1.0
+
+    @staticmethod
+    def _quantize(values: np.ndarray) -> np.ndarray:
+        """Scale peak values to int16"""
+        if values.dtype == np.int16:
+            return values
+        if values.dtype == np.uint8:
+            return ((values.astype(np.int16) - 128) << 8).astype(np.int16)
+        if np.issubdtype(values.dtype, np.integer):
+            shift = values.dtype.itemsize * 8 - 16
+            return (values.astype(np.int64) >> shift).astype(np.int16)
+        return np.round(np.clip(values, -1.0, 1.0) * 32767).astype(np.int16)
+
+    @property
+    def duration(self) -> float:
+        """Approximate duration of the source audio in seconds"""
+        return len(self.levels[0]) * self.samples_per_pixel / self.sample_rate
+
+    def samples_per_pixel_at(self, level: int) -> int:
+        """Number of audio frames covered by one peak at the given level"""
+        return self.samples_per_pixel << level
+
+    def level_for_resolution(self, samples_per_pixel: int) -> int:
+        """
+        Pick the coarsest level that is at least as detailed as requested
+
+        Args:
+            samples_per_pixel: Requested number of frames per peak
+
+        Returns:
+            Level index
+        """
+        level = 0
+        while (level + 1 < len(self.levels) and
+               self.samples_per_pixel_at(level + 1) <= samples_per_pixel):
+            level += 1
+        return level
+
+    def get_range(self, level: int, start: float = 0.0, end: Optional[float] = None) -> Tuple[int, np.ndarray]:
+        """
+        Get the peaks of one level covering a time range
+
+        Args:
+            level: Zoom level index (0 is the most detailed)
+            start: Start time in seconds
+            end: End time in seconds (default is the end of the audio)
+
+        Returns:
+            Tuple of (index of the first peak, (n, 2) int16 min/max pairs)
+        """
+        if not 0 <= level < len(self.levels):
+            raise ValueError(f"Zoom level must be between 0 and {len(self.levels) - 1}")
+
+        peaks = self.levels[level]
+        frames_per_peak = self.samples_per_pixel_at(level)
+
+        first = max(0, int(start * self.sample_rate) // frames_per_peak)
+        if end is None:
+            last = len(peaks)
+        else:
+            last = min(len(peaks), -(-int(end * self.sample_rate) // frames_per_peak))
+
+        return first, peaks[first:max(first, last)]
+
+    def columns(self, width: int,
+                normalize: bool = True) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """
+        Reduce the pyramid to exactly width min/max/RMS columns for rendering
+
+        Args:
+            width: Number of columns
+            normalize: Whether to scale the loudest peak to full range
+
+        Returns:
+            Tuple of float32 (mins, maxs, rms) arrays in [-1, 1]; rms is
+            None for pyramids without mean squares, such as loaded ones
+        """
+        if width <= 0:
+            raise ValueError("Waveform width must be positive")
+
+        # Coarsest level that still has at least one peak per column; with
+        # fewer peaks than columns, neighbouring columns share a peak
+        level = 0
+        while level + 1 < len(self.levels) and len(self.levels[level + 1]) >= width:
+            level += 1
+
+        peaks = self.levels[level]
+        if len(peaks) == 0:
+            empty = np.zeros(width, dtype=np.float32)
+            return empty, empty.copy(), None if self.mean_squares is None else empty.copy()
+
+        edges = (np.arange(width, dtype=np.int64) * len(peaks)) // width
+        mins = np.minimum.reduceat(peaks[:, 0], edges).astype(np.float32) / 32767.0
+        maxs = np.maximum.reduceat(peaks[:, 1], edges).astype(np.float32) / 32767.0
+
+        rms = None
+        if self.mean_squares is not None:
+            # Level 0 peaks under each column; columns sharing a peak get
+            # that peak alone
+            first = edges << level
+            counts = np.maximum(np.diff(np.append(first, len(self.mean_squares))), 1)
+            rms = np.sqrt(np.add.reduceat(self.mean_squares, first) / counts).astype(np.float32)
+
+        if normalize:
+            peak = max(float(np.max(np.abs(mins))), float(np.max(np.abs(maxs))))
+            if peak > 0:
+                mins /= peak
+                maxs /= peak
+                if rms is not None:
+                    rms /= peak
+
+        return mins, maxs, rms
+
+    def to_bytes(self) -> bytes:
+        """Serialize the pyramid to the binary peaks format"""
+        lengths = np.array([len(level) for level in self.levels], dtype='<u4')
+        header = _HEADER.pack(
+            PEAKS_MAGIC,
+            PEAKS_VERSION,
+            0,
+            self.sample_rate,
+            self.samples_per_pixel,
+            len(self.levels)
+        )
+        body = b''.join(level.astype('<i2', copy=False).tobytes() for level in self.levels)
+        return header + lengths.tobytes() + body
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'PeaksPyramid':
+        """
+        Load a pyramid from the binary peaks format
+
+        Level arrays are read-only views over the input bytes.
+
+        Args:
+            data: Serialized peaks
+
+        Returns:
+            PeaksPyramid instance
+        """
+        if len(data) < _HEADER.size:
+            raise ValueError("Peaks data is truncated")
+
+        magic, version, _flags, sample_rate, samples_per_pixel, level_count = _HEADER.unpack_from(data)
+        if magic != PEAKS_MAGIC:
+            raise ValueError("Not a peaks file")
+        if version != PEAKS_VERSION:
+            raise ValueError(f"Unsupported peaks version: {version}")
+
+        offset = _HEADER.size
+        lengths = np.frombuffer(data, dtype='<u4', count=level_count, offset=offset)
+        offset += lengths.nbytes
+
+        if len(data) < offset + int(lengths.sum()) * 4:
+            raise ValueError("Peaks data is truncated")
+
+        levels = []
+        for length in lengths:
+            level = np.frombuffer(data, dtype='<i2', count=int(length) * 2, offset=offset).reshape(-1, 2)
+            levels.append(level)
+            offset += level.nbytes
+
+        return cls(sample_rate, samples_per_pixel, levels)
+
+    def to_dict(self, level: int = 0, start: float = 0.0, end: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Get one level of the pyramid as a JSON-serializable dictionary
+
+        Args:
+            level: Zoom level index
+            start: Start time in seconds
+            end: End time in seconds
+
+        Returns:
+            Dictionary with the peaks and the metadata needed to place them
+        """
+        first, peaks = self.get_range(level, start, end)
+        return {
+            "version": PEAKS_VERSION,
+            "sample_rate": self.sample_rate,
+            "samples_per_pixel": self.samples_per_pixel_at(level),
+            "bits": 16,
+            "level": level,
+            "levels": len(self.levels),
+            "offset": first,
+            "length": len(peaks),
+            "data": peaks.ravel().tolist()
+        }
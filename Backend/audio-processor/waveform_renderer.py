@@ -0,0 +1,207 @@
+"""
+Waveform Rendering for Audio Processor
+
+This module renders waveform images directly from PCM sample arrays.
+Samples are reduced to one min/max/RMS column per pixel with vectorized
+reductions and rasterized straight into an image buffer, so rendering does
+not depend on matplotlib's global state and is safe to call from threads.
+"""
+
+import logging
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+logger = logging.getLogger(__name__)
+
+class WaveformRenderer:
+    """Renderer for waveform visualization images"""
+
+    def __init__(self, width: int = 1000, height: int = 300,
+                 color: str = '#3498db', background: str = 'transparent'):
+        self.width = width
+        self.height = height
+        self.color = color
+        self.background = background
+
+    def render(self, samples: np.ndarray,
+               width: Optional[int] = None,
+               height: Optional[int] = None,
+               color: Optional[str] = None,
+               background: Optional[str] = None) -> bytes:
+        """
+        Render a waveform image from PCM samples
+
+        Args:
+            samples: Sample array, either 1-D or (frames, channels)
+            width: Image width in pixels
+            height: Image height in pixels
+            color: Waveform color as a hex code
+            background: Background color as a hex code or 'transparent'
+
+        Returns:
+            PNG image data as bytes
+        """
+        width = width or self.width
+        mins, maxs, rms = self.compute_columns(samples, width)
+        return self.render_columns(mins, maxs, rms, height=height, color=color, background=background)
+
+    def compute_columns(self, samples: np.ndarray, width: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Reduce samples to per-pixel min, max and RMS columns
+
+        Values are normalized to the peak amplitude so the loudest sample
+        reaches the edge of the image.
+
+        Args:
+            samples: Sample array, either 1-D or (frames, channels)
+            width: Number of columns to produce
+
+        Returns:
+            Tuple of float32 (mins, maxs, rms) arrays of length width
+        """
+        if width <= 0:
+            raise ValueError("Waveform width must be positive")
+
+        samples = np.asarray(samples)
+        if samples.ndim == 1:
+            samples = samples.reshape(-1, 1)
+
+        # Unsigned 8-bit PCM is centered on 128
+        if samples.dtype == np.uint8:
+            samples = samples.astype(np.int16) - 128
+
+        n_frames = samples.shape[0]
+        if n_frames == 0:
+            empty = np.zeros(width, dtype=np.float32)
+            return empty, empty.copy(), empty.copy()
+
+        # Start frame of each column; when there are fewer frames than
+        # columns, neighbouring columns share a frame
+        edges = (np.arange(width, dtype=np.int64) * n_frames) // width
+        counts = np.diff(np.append(edges, n_frames))
+
+        # Envelope over all channels
+        mins = np.minimum.reduceat(samples, edges, axis=0).min(axis=1).astype(np.float32)
+        maxs = np.maximum.reduceat(samples, edges, axis=0).max(axis=1).astype(np.float32)
+
+        squares = np.add.reduceat(np.square(samples, dtype=np.float32), edges, axis=0).sum(axis=1)
+        rms = np.sqrt(squares / (np.maximum(counts, 1) * samples.shape[1])).astype(np.float32)
+
+        peak = max(float(np.max(np.abs(mins))), float(np.max(np.abs(maxs))))
+        if peak > 0:
+            mins /= peak
+            maxs /= peak
+            rms /= peak
+
+        return mins, maxs, rms
+
+    def render_columns(self, mins: np.ndarray, maxs: np.ndarray, rms: Optional[np.ndarray] = None,
+                       height: Optional[int] = None,
+                       color: Optional[str] = None,
+                       background: Optional[str] = None) -> bytes:
+        """
+        Rasterize precomputed min/max/RMS columns into a PNG image
+
+        When RMS is given, the min/max envelope is drawn at reduced opacity
+        and the RMS band on top of it at full opacity. The image is built as
+        a 3-entry palette index buffer, which keeps PNG encoding cheap.
+
+        Args:
+            mins: Per-column minimum in [-1, 1]
+            maxs: Per-column maximum in [-1, 1]
+            rms: Optional per-column RMS in [0, 1]
+            height: Image height in pixels
+            color: Waveform color as a hex code
+            background: Background color as a hex code or 'transparent'
+
+        Returns:
+            PNG image data as bytes
+        """
+        height = height or self.height
+        fg = self._parse_color(color or self.color)
+        bg = self._parse_color(background or self.background)
+
+        mins = np.clip(np.asarray(mins, dtype=np.float32), -1.0, 1.0)
+        maxs = np.clip(np.asarray(maxs, dtype=np.float32), -1.0, 1.0)
+
+        # Row extent of each column; row 0 is the top of the image
+        half = (height - 1) / 2.0
+        rows = np.arange(height, dtype=np.float32).reshape(-1, 1)
+        top = np.floor((1.0 - maxs) * half)
+        bottom = np.ceil((1.0 - mins) * half)
+
+        # Palette index per pixel: 0 background, 1 envelope, 2 RMS band
+        pixels = ((rows >= top) & (rows <= bottom)).view(np.uint8)
+
+        if rms is not None:
+            rms = np.clip(np.asarray(rms, dtype=np.float32), 0.0, 1.0)
+            rms_top = np.maximum(np.floor((1.0 - rms) * half), top)
+            rms_bottom = np.minimum(np.ceil((1.0 + rms) * half), bottom)
+            pixels = pixels + ((rows >= rms_top) & (rows <= rms_bottom)).view(np.uint8)
+
+        envelope_alpha = int(fg[3] * 0.6) if rms is not None else fg[3]
+        palette = [*bg[:3], *fg[:3], *fg[:3]]
+        alpha = bytes([bg[3], envelope_alpha, fg[3]])
+
+        return self._encode_png(pixels, palette, alpha)
+
+    def render_placeholder(self, text: str = 'Waveform unavailable',
+                           width: Optional[int] = None,
+                           height: Optional[int] = None) -> bytes:
+        """
+        Render a placeholder image when no waveform can be drawn
+
+        Args:
+            text: Message to show in the image
+            width: Image width in pixels
+            height: Image height in pixels
+
+        Returns:
+            PNG image data as bytes
+        """
+        width = width or self.width
+        height = height or self.height
+
+        image = Image.new('RGBA', (width, height), (255, 255, 255, 255))
+        draw = ImageDraw.Draw(image)
+        left, top, right, bottom = draw.textbbox((0, 0), text)
+        position = ((width - (right - left)) / 2, (height - (bottom - top)) / 2)
+        draw.text(position, text, fill=(0, 0, 0, 255))
+
+        buf = BytesIO()
+        image.save(buf, format='PNG')
+        return buf.getvalue()
+
+    def _encode_png(self, pixels: np.ndarray, palette: List[int], alpha: bytes) -> bytes:
+        """Encode a palette index buffer as PNG, favouring speed over size"""
+        image = Image.fromarray(np.ascontiguousarray(pixels))
+        image.putpalette(palette)
+
+        buf = BytesIO()
+        image.save(buf, format='PNG', compress_level=1, transparency=alpha)
+        return buf.getvalue()
+
+    @staticmethod
+    def _parse_color(color: str) -> Tuple[int, int, int, int]:
+        """
+        Parse a '#RRGGBB' or '#RRGGBBAA' hex code, or 'transparent'
+
+        Returns:
+            RGBA tuple
+        """
+        if color == 'transparent':
+            return (0, 0, 0, 0)
+
+        value = color.lstrip('#')
+        if len(value) == 6:
+            value += 'ff'
+        if len(value) != 8:
+            raise ValueError(f"Invalid color: {color}")
+
+        return tuple(int(value[i:i + 2], 16) for i in range(0, 8, 2))
+
+# Create a singleton instance
+waveform_renderer = WaveformRenderer()
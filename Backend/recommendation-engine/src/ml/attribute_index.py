@@ -0,0 +1,196 @@
+import numpy as np
+import logging
+from typing import Dict, Any, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Filterable attributes; categorical ones match any of the given values,
+# numeric ones a (low, high) range with either end None for open
+CATEGORICAL_ATTRIBUTES = ("genre", "mood")
+NUMERIC_ATTRIBUTES = ("duration", "tempo")
+
+def track_attributes(document: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Pick a track's filterable attributes from its feature document
+
+    The genre and mood are the top predictions of AudioFeaturePipeline
+    unless the document sets them explicitly.
+    """
+    genre = document.get("genre")
+    if genre is None:
+        top_genres = (document.get("genre_prediction") or {}).get("top_genres") or []
+        genre = top_genres[0]["genre"] if top_genres else None
+
+    mood = document.get("mood")
+    if mood is None:
+        mood = ((document.get("emotion_prediction") or {}).get("dominant_emotion") or {}).get("emotion")
+
+    def number(value) -> float:
+        return float(value) if value else np.nan
+
+    return {
+        "genre": str(genre).lower() if genre else "",
+        "mood": str(mood).lower() if mood else "",
+        "duration": number(document.get("duration")),
+        "tempo": number(document.get("tempo"))
+    }
+
+def _condition(attribute: str, condition: Any) -> Any:
+    """Normalize a filter condition: a set of values or a (low, high) range"""
+    if attribute in CATEGORICAL_ATTRIBUTES:
+        values = [condition] if isinstance(condition, str) else list(condition)
+        return {str(value).lower() for value in values}
+    if attribute in NUMERIC_ATTRIBUTES:
+        low, high = condition
+        return (-np.inf if low is None else float(low), np.inf if high is None else float(high))
+    raise ValueError(f"Unknown filter attribute: {attribute}")
+
+def attribute_matches(attributes: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+    """Whether one track's attributes satisfy every filter"""
+    for attribute, condition in filters.items():
+        condition = _condition(attribute, condition)
+        value = attributes[attribute]
+        if attribute in CATEGORICAL_ATTRIBUTES:
+            if value not in condition:
+                return False
+        elif not condition[0] <= value <= condition[1]:
+            return False
+    return True
+
+class AttributeIndex:
+    """
+    Finds the tracks matching attribute filters without scanning them all
+
+    Each categorical value has a bitmap of its tracks, and each numeric
+    attribute keeps its tracks sorted by value so a range is one slice.
+    The filter with the fewest matches gives the candidate rows and the
+    others are checked on those rows only, so a restrictive filter leaves
+    little to score.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray]):
+        """
+        Args:
+            columns: Row-aligned column per attribute: strings ("" if
+                unknown) for categorical ones, float32 (NaN if unknown)
+                for numeric ones
+        """
+        self.columns = columns
+        self._count = len(next(iter(columns.values()))) if columns else 0
+
+        self._values: Dict[str, np.ndarray] = {}
+        self._bitmaps: Dict[str, np.ndarray] = {}
+        self._counts: Dict[str, np.ndarray] = {}
+        for attribute in CATEGORICAL_ATTRIBUTES:
+            values, codes, counts = np.unique(columns[attribute], return_inverse=True, return_counts=True)
+            self._values[attribute] = values
+            self._counts[attribute] = counts
+            self._bitmaps[attribute] = np.stack([
+                np.packbits(codes == code) for code in range(len(values))
+            ]) if len(values) else np.zeros((0, 0), dtype=np.uint8)
+
+        self._order: Dict[str, np.ndarray] = {}
+        self._sorted: Dict[str, np.ndarray] = {}
+        for attribute in NUMERIC_ATTRIBUTES:
+            order = np.argsort(columns[attribute], kind="stable")  # NaN last
+            self._order[attribute] = order.astype(np.int32)
+            self._sorted[attribute] = columns[attribute][order]
+
+    def __len__(self) -> int:
+        return self._count
+
+    @staticmethod
+    def columns_from_documents(documents: Iterable[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+        """Attribute columns of documents, in order"""
+        attributes = [track_attributes(document) for document in documents]
+        columns = {
+            attribute: np.array([row[attribute] for row in attributes], dtype=str)
+            for attribute in CATEGORICAL_ATTRIBUTES
+        }
+        columns.update({
+            attribute: np.array([row[attribute] for row in attributes], dtype=np.float32)
+            for attribute in NUMERIC_ATTRIBUTES
+        })
+        return columns
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Dict[str, Any]]) -> "AttributeIndex":
+        return cls(cls.columns_from_documents(documents))
+
+    def values(self, attribute: str) -> Dict[str, int]:
+        """Number of tracks with each value of a categorical attribute"""
+        return {
+            str(value): int(count)
+            for value, count in zip(self._values[attribute], self._counts[attribute])
+            if value
+        }
+
+    def _bitmap(self, attribute: str, wanted: set) -> Tuple[np.ndarray, int]:
+        """Union of the bitmaps of the wanted values, with its number of tracks"""
+        values = self._values[attribute]
+        positions = [int(i) for i in np.searchsorted(values, sorted(wanted)) if i < len(values)]
+        positions = [i for i in positions if values[i] in wanted]
+        if not positions:
+            return np.zeros((self._count + 7) // 8, dtype=np.uint8), 0
+        bitmap = np.bitwise_or.reduce(self._bitmaps[attribute][positions], axis=0)
+        return bitmap, int(self._counts[attribute][positions].sum())
+
+    def _range(self, attribute: str, low: float, high: float) -> Tuple[int, int]:
+        """Slice of the sorted order holding values within [low, high]"""
+        values = self._sorted[attribute]
+        return int(np.searchsorted(values, low, "left")), int(np.searchsorted(values, high, "right"))
+
+    def rows(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Rows of the tracks matching every filter
+
+        Args:
+            filters: Condition per attribute, e.g. {"genre": ["rock", "pop"],
+                "tempo": (90, 110)}
+
+        Returns:
+            Sorted row numbers, or None without filters
+        """
+        if not filters:
+            return None
+
+        # Size each filter's matches from the bitmap counts and range bounds
+        candidates = []
+        for attribute, condition in filters.items():
+            condition = _condition(attribute, condition)
+            if attribute in CATEGORICAL_ATTRIBUTES:
+                bitmap, count = self._bitmap(attribute, condition)
+                candidates.append((count, attribute, bitmap))
+            else:
+                start, stop = self._range(attribute, *condition)
+                candidates.append((max(stop - start, 0), attribute, (start, stop, condition)))
+        candidates.sort(key=lambda candidate: candidate[0])
+
+        count, attribute, selection = candidates[0]
+        if count == 0:
+            return np.zeros(0, dtype=np.int64)
+        if attribute in CATEGORICAL_ATTRIBUTES:
+            rows = np.flatnonzero(np.unpackbits(selection, count=self._count))
+        else:
+            rows = np.sort(self._order[attribute][selection[0]:selection[1]]).astype(np.int64)
+
+        for _, attribute, selection in candidates[1:]:
+            if attribute in CATEGORICAL_ATTRIBUTES:
+                keep = (selection[rows >> 3] >> (7 - (rows & 7)).astype(np.uint8)) & 1
+                rows = rows[keep.astype(bool)]
+            else:
+                low, high = selection[2]
+                values = self.columns[attribute][rows]
+                rows = rows[(values >= low) & (values <= high)]
+            if not len(rows):
+                break
+
+        return rows
+
+    def save(self, path: str) -> None:
+        np.savez(path, **self.columns)
+
+    @classmethod
+    def load(cls, path: str) -> "AttributeIndex":
+        with np.load(path) as data:
+            return cls({attribute: data[attribute] for attribute in data.files})
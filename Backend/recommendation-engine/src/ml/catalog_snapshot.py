@@ -0,0 +1,449 @@
+import numpy as np
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, List, Any, Optional, Callable, Iterator, Mapping, Set, Tuple
+
+from .feature_store import FEATURE_COLUMNS, FeatureMatrices, feature_values, stack_features
+from .attribute_index import AttributeIndex
+from .diversity import fingerprint_signatures
+
+logger = logging.getLogger(__name__)
+
+# Encodes tag strings to an (n, d) embedding matrix
+TextEncoder = Callable[[List[str]], np.ndarray]
+
+def _audio_id(document: Dict[str, Any]) -> Optional[str]:
+    audio_id = document.get("audio_id", document.get("audioId"))
+    return str(audio_id) if audio_id is not None else None
+
+def _tag_text(document: Dict[str, Any]) -> str:
+    return ' '.join(document.get("tags") or [])
+
+def _frozen(array: np.ndarray) -> np.ndarray:
+    array.flags.writeable = False
+    return array
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """
+    Immutable view of the catalog's features and tag embeddings
+
+    Nothing in a snapshot changes after it is built; refreshes build a new
+    snapshot and swap it in, so a query can keep using the one it started
+    with without locking.
+    """
+    features: FeatureMatrices
+    tag_embeddings: np.ndarray  # (n, d) unit rows, zero for tracks without tags
+    has_tags: np.ndarray  # (n,) bool
+    attributes: AttributeIndex  # Genre, mood, duration and tempo for filtering
+    fingerprints: np.ndarray  # (n,) uint64 fingerprint signatures, for dropping duplicates
+    has_fingerprint: np.ndarray  # (n,) bool
+    rows: Mapping[str, int]  # audio_id -> row
+    embedding_dim: Optional[int]
+    version: int
+    created_at: float
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+    @classmethod
+    def empty(cls) -> "CatalogSnapshot":
+        columns, present = stack_features([], None)
+        return cls(
+            features=FeatureMatrices(
+                ids=_frozen(np.zeros(0, dtype=str)),
+                columns={column: _frozen(values) for column, values in columns.items()},
+                present={column: _frozen(present[:, i]) for i, column in enumerate(FEATURE_COLUMNS)},
+                generation=0
+            ),
+            tag_embeddings=_frozen(np.zeros((0, 0), dtype=np.float32)),
+            has_tags=_frozen(np.zeros(0, dtype=bool)),
+            attributes=AttributeIndex(AttributeIndex.columns_from_documents([])),
+            fingerprints=_frozen(np.zeros(0, dtype=np.uint64)),
+            has_fingerprint=_frozen(np.zeros(0, dtype=bool)),
+            rows=MappingProxyType({}),
+            embedding_dim=None,
+            version=0,
+            created_at=time.time()
+        )
+
+    def apply(self, upserts: Mapping[str, Dict[str, Any]], deletes: Set[str],
+              encode: Optional[TextEncoder] = None) -> "CatalogSnapshot":
+        """
+        Build the next snapshot with tracks added, replaced or removed
+
+        Unchanged rows are copied over; only changed tracks have their
+        features stacked and tags encoded.
+
+        Args:
+            upserts: New feature documents keyed by audio_id
+            deletes: audio_ids to remove
+            encode: Text encoder for tags (None to skip tag embeddings)
+
+        Returns:
+            New snapshot
+        """
+        keep = np.ones(len(self), dtype=bool)
+        for audio_id in set(upserts) | set(deletes):
+            row = self.rows.get(audio_id)
+            if row is not None:
+                keep[row] = False
+
+        new_ids = [audio_id for audio_id in upserts if audio_id not in deletes]
+        documents = [upserts[audio_id] for audio_id in new_ids]
+        values = [feature_values(document) for document in documents]
+
+        embedding_dim = self.embedding_dim
+        if embedding_dim is None:
+            embedding_dim = next((len(v["embedding"]) for v in values if v["embedding"]), None)
+        new_columns, new_present = stack_features(values, embedding_dim)
+
+        features = self.features
+        columns = {}
+        present = {}
+        for position, column in enumerate(FEATURE_COLUMNS):
+            old = features.columns[column][keep]
+            if old.shape[1:] != new_columns[column].shape[1:]:
+                # Embedding width became known with this batch
+                old = np.zeros((len(old),) + new_columns[column].shape[1:], dtype=np.float32)
+            columns[column] = _frozen(np.concatenate([old, new_columns[column]]))
+            present[column] = _frozen(np.concatenate([features.present[column][keep], new_present[:, position]]))
+
+        ids = _frozen(np.concatenate([features.ids[keep], np.array(new_ids, dtype=str)]))
+
+        # Tag embeddings for changed tracks only
+        texts = [_tag_text(document) for document in documents]
+        tagged = [i for i, text in enumerate(texts) if text]
+        old_embeddings = self.tag_embeddings[keep]
+        new_embeddings = np.zeros((len(new_ids), old_embeddings.shape[1]), dtype=np.float32)
+        if encode is not None and tagged:
+            encoded = np.asarray(encode([texts[i] for i in tagged]), dtype=np.float32)
+            norms = np.linalg.norm(encoded, axis=1, keepdims=True)
+            encoded = np.divide(encoded, norms, out=np.zeros_like(encoded), where=norms > 0)
+            if old_embeddings.shape[1] != encoded.shape[1]:
+                old_embeddings = np.zeros((len(old_embeddings), encoded.shape[1]), dtype=np.float32)
+                new_embeddings = np.zeros((len(new_ids), encoded.shape[1]), dtype=np.float32)
+            new_embeddings[tagged] = encoded
+        new_has_tags = np.zeros(len(new_ids), dtype=bool)
+        if encode is not None:
+            new_has_tags[tagged] = True
+
+        new_attributes = AttributeIndex.columns_from_documents(documents)
+        attributes = AttributeIndex({
+            attribute: _frozen(np.concatenate([values[keep], new_attributes[attribute]]))
+            for attribute, values in self.attributes.columns.items()
+        })
+        new_fingerprints, new_has_fingerprint = fingerprint_signatures(documents)
+
+        return CatalogSnapshot(
+            features=FeatureMatrices(
+                ids=ids,
+                columns=columns,
+                present=present,
+                generation=self.version + 1
+            ),
+            tag_embeddings=_frozen(np.concatenate([old_embeddings, new_embeddings])),
+            has_tags=_frozen(np.concatenate([self.has_tags[keep], new_has_tags])),
+            attributes=attributes,
+            fingerprints=_frozen(np.concatenate([self.fingerprints[keep], new_fingerprints])),
+            has_fingerprint=_frozen(np.concatenate([self.has_fingerprint[keep], new_has_fingerprint])),
+            rows=MappingProxyType({str(audio_id): row for row, audio_id in enumerate(ids)}),
+            embedding_dim=embedding_dim,
+            version=self.version + 1,
+            created_at=time.time()
+        )
+
+class CatalogFeedReset(Exception):
+    """The feed lost its position and the catalog must be loaded again"""
+
+class CatalogFeed(ABC):
+    """Source of catalog feature documents and their changes"""
+
+    @abstractmethod
+    def load(self) -> Iterator[Dict[str, Any]]:
+        """
+        Scan every document, positioning the feed so that changes() returns
+        everything modified after the scan began
+        """
+
+    @abstractmethod
+    def changes(self, timeout: float) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Wait up to timeout seconds for changes since the last call
+
+        Returns:
+            Tuple of (upserted documents, deleted audio_ids)
+
+        Raises:
+            CatalogFeedReset: If changes were lost and load() must run again
+        """
+
+    def close(self) -> None:
+        pass
+
+class MongoPollingFeed(CatalogFeed):
+    """
+    Follows a collection through a timestamp field, paging by
+    (timestamp, _id) so equal timestamps are neither skipped nor repeated
+
+    Deletions are only visible as documents flagged with a deleted field.
+    """
+
+    def __init__(self, collection, updated_field: str = "updated_at",
+                 batch_size: int = 1000, poll_interval: float = 5.0):
+        self.collection = collection
+        self.updated_field = updated_field
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._position: Optional[Tuple[Any, Any]] = None
+
+    def load(self) -> Iterator[Dict[str, Any]]:
+        # Anything changed during the scan gets a later timestamp than the
+        # newest document before it
+        newest = list(self.collection.find({}, {self.updated_field: 1}).sort(
+            [(self.updated_field, -1), ("_id", -1)]).limit(1))
+        self._position = (newest[0].get(self.updated_field), newest[0]["_id"]) if newest else None
+
+        for document in self.collection.find({"deleted": {"$ne": True}}):
+            yield document
+
+    def changes(self, timeout: float) -> Tuple[List[Dict[str, Any]], List[str]]:
+        query = {}
+        if self._position is not None:
+            updated, last_id = self._position
+            query = {"$or": [
+                {self.updated_field: {"$gt": updated}},
+                {self.updated_field: updated, "_id": {"$gt": last_id}}
+            ]}
+
+        documents = list(self.collection.find(query).sort(
+            [(self.updated_field, 1), ("_id", 1)]).limit(self.batch_size))
+        if not documents:
+            time.sleep(min(timeout, self.poll_interval))
+            return [], []
+
+        last = documents[-1]
+        self._position = (last.get(self.updated_field), last["_id"])
+
+        upserts = [document for document in documents if not document.get("deleted")]
+        deletes = [_audio_id(document) for document in documents if document.get("deleted")]
+        return upserts, [audio_id for audio_id in deletes if audio_id is not None]
+
+class MongoChangeStreamFeed(CatalogFeed):
+    """
+    Follows a collection through a MongoDB change stream, resuming from the
+    last token after connection errors (requires a replica set)
+    """
+
+    def __init__(self, collection, batch_size: int = 1000):
+        self.collection = collection
+        self.batch_size = batch_size
+        self._stream = None
+        self._resume_token = None
+        self._audio_ids: Dict[Any, str] = {}  # _id -> audio_id, to resolve deletes
+
+    def _open(self, timeout: float) -> None:
+        if self._stream is not None:
+            self._stream.close()
+        self._stream = self.collection.watch(
+            full_document="updateLookup",
+            resume_after=self._resume_token,
+            max_await_time_ms=int(timeout * 1000)
+        )
+
+    def load(self) -> Iterator[Dict[str, Any]]:
+        # Open the stream before scanning so no change falls in between
+        self._resume_token = None
+        self._audio_ids = {}
+        self._open(1.0)
+
+        for document in self.collection.find({}):
+            audio_id = _audio_id(document)
+            if audio_id is not None:
+                self._audio_ids[document["_id"]] = audio_id
+            yield document
+
+    def changes(self, timeout: float) -> Tuple[List[Dict[str, Any]], List[str]]:
+        from pymongo.errors import PyMongoError
+
+        if self._stream is None:
+            raise CatalogFeedReset("Change stream not open")
+
+        upserts, deletes = [], []
+        try:
+            while len(upserts) + len(deletes) < self.batch_size:
+                event = self._stream.try_next()
+                if event is None:
+                    break
+                self._resume_token = self._stream.resume_token
+
+                operation = event["operationType"]
+                if operation in ("insert", "update", "replace"):
+                    document = event.get("fullDocument")
+                    if document is not None:
+                        audio_id = _audio_id(document)
+                        if audio_id is not None:
+                            self._audio_ids[document["_id"]] = audio_id
+                        upserts.append(document)
+                elif operation == "delete":
+                    audio_id = self._audio_ids.pop(event["documentKey"]["_id"], None)
+                    if audio_id is not None:
+                        deletes.append(audio_id)
+                elif operation in ("drop", "rename", "dropDatabase", "invalidate"):
+                    self._stream.close()
+                    self._stream = None
+                    raise CatalogFeedReset(f"Change stream ended by {operation}")
+
+        except PyMongoError as e:
+            if self._resume_token is None:
+                raise CatalogFeedReset(str(e))
+            logger.warning(f"Change stream interrupted, resuming: {e}")
+            self._open(timeout)
+
+        return upserts, deletes
+
+    def close(self) -> None:
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+def create_catalog_feed() -> Optional[CatalogFeed]:
+    """
+    Create the catalog feed configured by environment variables
+
+        CATALOG_FEED             change_stream, polling, or auto (default:
+                                 change stream where supported, else polling)
+        MONGODB_URI              MongoDB connection string
+        MONGODB_DATABASE         Database holding the audio_features collection
+        CATALOG_UPDATED_FIELD    Timestamp field used for polling
+
+    Returns:
+        The feed, or None if MongoDB is not reachable
+    """
+    mode = os.getenv("CATALOG_FEED", "auto")
+    try:
+        from pymongo import MongoClient
+        from pymongo.errors import OperationFailure
+
+        client = MongoClient(os.getenv("MONGODB_URI", "mongodb://mongodb:27017"), serverSelectionTimeoutMS=5000)
+        collection = client[os.getenv("MONGODB_DATABASE", "soundscape-recommendations")]["audio_features"]
+        client.admin.command("ping")
+    except Exception as e:
+        logger.warning(f"Catalog feed unavailable: {e}")
+        return None
+
+    polling = MongoPollingFeed(collection, os.getenv("CATALOG_UPDATED_FIELD", "updated_at"))
+    if mode == "polling":
+        return polling
+
+    if mode == "auto":
+        try:
+            collection.watch(max_await_time_ms=1).close()
+        except OperationFailure:
+            logger.info("Change streams not supported, polling the catalog instead")
+            return polling
+
+    return MongoChangeStreamFeed(collection)
+
+class CatalogSnapshotManager:
+    """
+    Keeps an up-to-date catalog snapshot, refreshed in a background thread
+
+    Readers take the current snapshot from the snapshot property and use
+    it for the whole query; replacing it is a single reference assignment,
+    so readers never wait for a refresh.
+    """
+
+    def __init__(self, feed: CatalogFeed, encode: Optional[TextEncoder] = None,
+                 refresh_interval: float = 1.0, load_batch_size: int = 10000):
+        """
+        Args:
+            feed: Source of catalog documents and changes
+            encode: Text encoder for tag embeddings
+            refresh_interval: Longest wait for changes before checking again
+            load_batch_size: Documents stacked at a time during a full load
+        """
+        self.feed = feed
+        self.encode = encode
+        self.refresh_interval = refresh_interval
+        self.load_batch_size = load_batch_size
+
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def snapshot(self) -> Optional[CatalogSnapshot]:
+        """The latest snapshot, or None before the first load finishes"""
+        return self._snapshot
+
+    def start(self) -> None:
+        """Start loading and following the catalog, if not already running"""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="catalog-snapshot", daemon=True)
+            self._thread.start()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the first snapshot; returns whether it is available"""
+        return self._ready.wait(timeout)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.feed.close()
+
+    def _load(self) -> None:
+        """Build a snapshot of the whole catalog, stacking it in batches"""
+        started = time.time()
+        snapshot = CatalogSnapshot.empty()
+        batch: Dict[str, Dict[str, Any]] = {}
+
+        for document in self.feed.load():
+            audio_id = _audio_id(document)
+            if audio_id is None:
+                continue
+            batch[audio_id] = document
+            if len(batch) >= self.load_batch_size:
+                snapshot = snapshot.apply(batch, set(), self.encode)
+                batch = {}
+        snapshot = snapshot.apply(batch, set(), self.encode)
+
+        self._snapshot = snapshot
+        self._ready.set()
+        logger.info(f"Loaded catalog snapshot of {len(snapshot)} tracks in {time.time() - started:.2f}s")
+
+    def _run(self) -> None:
+        needs_load = True
+        while not self._stop.is_set():
+            try:
+                if needs_load:
+                    self._load()
+                    needs_load = False
+
+                upserts, deletes = self.feed.changes(self.refresh_interval)
+                if upserts or deletes:
+                    changed = {}
+                    for document in upserts:
+                        audio_id = _audio_id(document)
+                        if audio_id is not None:
+                            changed[audio_id] = document
+                    self._snapshot = self._snapshot.apply(changed, set(deletes), self.encode)
+                    logger.debug(f"Catalog snapshot {self._snapshot.version}: "
+                                 f"{len(changed)} updated, {len(deletes)} deleted")
+
+            except CatalogFeedReset as e:
+                logger.warning(f"Reloading catalog snapshot: {e}")
+                needs_load = True
+            except Exception as e:
+                logger.error(f"Error refreshing catalog snapshot: {e}")
+                self._stop.wait(self.refresh_interval)
@@ -4,12 +4,20 @@ from typing import List, Dict, Any, Optional, Tuple
 import logging
 from sklearn.metrics.pairwise import cosine_similarity
 import tensorflow as tf
-from sentence_transformers import SentenceTransformer
 import asyncio
+import os
 import time
 
 from ..models.audio_features import AudioFeatures
 from ..services.database import MongoDBService
+from .feature_store import FEATURE_COLUMNS, FeatureStore, FeatureMatrices, feature_values, stack_features
+from .neighbor_table import NeighborTable, prepare_features, similarity_block
+from .vector_index import VectorIndex
+from .attribute_index import attribute_matches, track_attributes
+from .user_profiles import UserProfileService, create_event_source
+from .catalog_snapshot import CatalogSnapshot, CatalogSnapshotManager, create_catalog_feed
+from .text_embeddings import get_text_embedding_service
+from .diversity import candidate_pool, diversify, fingerprint_signatures
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,14 +28,56 @@ class ContentBasedRecommender:
     Content-based recommendation system that uses audio features to find similar tracks
     """
     
-    def __init__(self):
-        """Initialize the content-based recommender with services and models"""
+    def __init__(self, feature_store: Optional[FeatureStore] = None,
+                 catalog: Optional[CatalogSnapshotManager] = None,
+                 neighbor_table: Optional[NeighborTable] = None,
+                 vector_index: Optional[VectorIndex] = None,
+                 user_profiles: Optional[UserProfileService] = None):
+        """
+        Initialize the content-based recommender with services and models
+        
+        Args:
+            feature_store: Columnar store of catalog features to score against
+                (default: the store at FEATURE_STORE_PATH, if set)
+            catalog: In-memory catalog snapshot kept current from MongoDB
+                (default: one following the configured catalog feed); until
+                its first load finishes, features are fetched per request
+            neighbor_table: Precomputed neighbors of catalog tracks (default:
+                the table at NEIGHBOR_TABLE_PATH, if set)
+            vector_index: Compressed index of projected track vectors
+                (default: the index at VECTOR_INDEX_PATH, if set); catalog
+                tracks without precomputed neighbors are searched in it
+            user_profiles: Taste profiles for recommend_for_user (default:
+                profiles over the vector index, fed from the analytics
+                events and snapshotted to USER_PROFILES_PATH)
+        """
         self.db = MongoDBService()
         
-        # Load text embedding model for processing descriptions and tags
+        store_path = os.getenv("FEATURE_STORE_PATH")
+        self.feature_store = feature_store or (FeatureStore(store_path) if store_path else None)
+        
+        table_path = os.getenv("NEIGHBOR_TABLE_PATH")
+        self.neighbor_table = neighbor_table or (NeighborTable(table_path) if table_path else None)
+        
+        index_path = os.getenv("VECTOR_INDEX_PATH")
+        self.vector_index = vector_index or (VectorIndex.load(index_path) if index_path else None)
+        
+        self.user_profiles = user_profiles
+        if self.user_profiles is None and self.vector_index is not None:
+            self.user_profiles = UserProfileService(
+                create_event_source(),
+                self.vector_index.vector,
+                dim=self.vector_index.metadata["dim"],
+                snapshot_path=os.getenv("USER_PROFILES_PATH"),
+                space=f"{self.vector_index.metadata.get('column')}/{self.vector_index.metadata.get('projection')}"
+            )
+        if self.user_profiles is not None:
+            self.user_profiles.start()
+        
+        # Text embedding model for descriptions and tags, shared by every
+        # recommender in the process
         try:
-            self.text_model = SentenceTransformer('all-MiniLM-L6-v2')
-            logger.info("Text embedding model loaded successfully")
+            self.text_model = get_text_embedding_service()
         except Exception as e:
             logger.error(f"Error loading text embedding model: {e}")
             self.text_model = None
@@ -41,27 +91,93 @@ class ContentBasedRecommender:
             'text_features': 0.1   # Tags and descriptions
         }
         
-        # Cache for similarity matrices to improve performance
-        self.similarity_cache = {}
-        self.cache_timestamp = time.time()
-        self.cache_ttl = 3600  # 1 hour
+        # Diversity re-ranking of similar tracks: relevance weight (1 for
+        # none), whether to drop fingerprint duplicates, and how many of the
+        # most similar tracks to choose from
+        self.mmr_lambda = float(os.getenv("MMR_LAMBDA", "0.7"))
+        self.dedup_fingerprints = os.getenv("DEDUP_FINGERPRINTS", "true").lower() == "true"
+        self.diversity_candidates = int(os.getenv("DIVERSITY_CANDIDATES", "500"))
+        
+        # Immutable catalog snapshot, swapped in by a background refresh
+        self.catalog = catalog
+        if self.catalog is None:
+            feed = create_catalog_feed()
+            if feed is not None:
+                encode = self.text_model.encode if self.text_model else None
+                self.catalog = CatalogSnapshotManager(feed, encode=encode)
+        if self.catalog is not None:
+            self.catalog.start()
         
         logger.info("Content-based recommender initialized")
     
-    async def get_similar_tracks(self, audio_features: AudioFeatures, limit: int = 10) -> List[Dict[str, Any]]:
+    async def get_similar_tracks(self, audio_features: AudioFeatures, limit: int = 10,
+                                 filters: Optional[Dict[str, Any]] = None,
+                                 mmr_lambda: Optional[float] = None,
+                                 dedup: Optional[bool] = None) -> List[Dict[str, Any]]:
         """
         Get tracks similar to the provided audio features
         
+        The most similar tracks are re-ranked for diversity, so that copies
+        and close variants of one song do not fill the results.
+        
         Args:
             audio_features: The audio features to compare against
             limit: Maximum number of similar tracks to return
+            filters: Conditions the tracks must meet, e.g. {"genre": "rock",
+                "tempo": (90, 110)}; applied before scoring, so up to limit
+                matching tracks are returned
+            mmr_lambda: Weight of similarity against diversity, from 0 to 1
+                (default: self.mmr_lambda); 1 ranks by similarity alone
+            dedup: Whether to drop tracks whose audio fingerprint matches a
+                higher-ranked one (default: self.dedup_fingerprints)
             
         Returns:
             List of similar tracks with similarity scores
         """
+        mmr_lambda = self.mmr_lambda if mmr_lambda is None else mmr_lambda
+        dedup = self.dedup_fingerprints if dedup is None else dedup
+        diverse = mmr_lambda < 1 or dedup
+        pool = self._diversity_pool(limit) if diverse else limit
+        
+        async def rerank(candidates: List[Dict[str, Any]], documents: Optional[List[Dict[str, Any]]] = None,
+                         from_index: bool = False) -> List[Dict[str, Any]]:
+            if not diverse or len(candidates) <= 1:
+                return candidates[:limit]
+            return await asyncio.to_thread(
+                self._diversify, candidates, limit, mmr_lambda, dedup, documents, from_index
+            )
+        
         try:
+            # Catalog tracks are answered from the precomputed neighbors.
+            # Incremental updates leave rows short when neighbors are changed
+            # or deleted; those tracks are searched below instead
+            if self.neighbor_table is not None and not filters:
+                self.neighbor_table.refresh()
+                if limit <= self.neighbor_table.k:
+                    neighbors = self.neighbor_table.neighbors(
+                        audio_features.audio_id, min(pool, self.neighbor_table.k)
+                    )
+                    if neighbors is not None and len(neighbors) >= min(limit, len(self.neighbor_table) - 1):
+                        return await rerank(neighbors)
+            
+            if (self.vector_index is not None and audio_features.audio_id in self.vector_index
+                    and (not filters or self.vector_index.attributes is not None)):
+                return await rerank(await asyncio.to_thread(
+                    self.vector_index.similar, audio_features.audio_id, pool, filters=filters
+                ), from_index=True)
+            
+            # The feature store has no attributes to filter on
+            if self.feature_store is not None and not filters:
+                return await rerank(await asyncio.to_thread(self._similar_from_store, audio_features, pool))
+            
+            snapshot = self.catalog.snapshot if self.catalog is not None else None
+            if snapshot is not None:
+                return await rerank(await asyncio.to_thread(
+                    self._similar_from_matrices, audio_features, snapshot.features, pool,
+                    snapshot.attributes.rows(filters)
+                ))
+            
             # Fetch all audio features from the database
-            # In a production environment, this should be optimized with pre-computed embeddings
             all_features = await self.db.get_all_audio_features(limit=1000)
             
             if not all_features:
@@ -70,11 +186,15 @@ class ContentBasedRecommender:
             
             # Calculate similarities
             similarities = []
+            documents = {}
             for track_features in all_features:
                 # Skip the same track
                 if track_features.get('audio_id') == audio_features.audio_id:
                     continue
                 
+                if filters and not attribute_matches(track_attributes(track_features), filters):
+                    continue
+                
                 # Calculate similarity
                 similarity_score = self._calculate_similarity(audio_features, track_features)
                 
@@ -82,17 +202,192 @@ class ContentBasedRecommender:
                     'audio_id': track_features.get('audio_id'),
                     'score': similarity_score
                 })
+                documents[track_features.get('audio_id')] = track_features
             
             # Sort by similarity score (descending)
             sorted_similarities = sorted(similarities, key=lambda x: x['score'], reverse=True)
             
             # Return top matches
-            return sorted_similarities[:limit]
+            candidates = sorted_similarities[:pool]
+            return await rerank(candidates, [documents[candidate['audio_id']] for candidate in candidates])
         
         except Exception as e:
             logger.error(f"Error getting similar tracks: {e}")
             return []
     
+    def _diversity_pool(self, limit: int) -> int:
+        """Similar tracks to re-rank, within the pairwise similarity budget"""
+        if self.vector_index is not None:
+            width = self.vector_index.metadata.get("dim", 0)
+        else:
+            # Tempo similarity costs about as much as an 8-wide product
+            width = FEATURE_COLUMNS["mfccs"] + FEATURE_COLUMNS["chroma"] + FEATURE_COLUMNS["spectral"] + 8
+        return candidate_pool(limit, self.diversity_candidates, width)
+    
+    def _diversify(self, candidates: List[Dict[str, Any]], limit: int, mmr_lambda: float, dedup: bool,
+                   documents: Optional[List[Dict[str, Any]]] = None,
+                   from_index: bool = False) -> List[Dict[str, Any]]:
+        """
+        Re-rank similar tracks by maximal marginal relevance
+        
+        Candidates are compared with each other the way they were scored:
+        by their vectors if they came from the vector index, otherwise by
+        the weighted audio features of the given documents or the catalog
+        snapshot. Without those, the ranking is kept as it is.
+        """
+        audio_ids = [candidate['audio_id'] for candidate in candidates]
+        snapshot = self.catalog.snapshot if self.catalog is not None else None
+        rows = [snapshot.rows.get(audio_id) for audio_id in audio_ids] if snapshot is not None else [None]
+        in_snapshot = None not in rows
+        rows = np.array(rows, dtype=np.int64) if in_snapshot else None
+        
+        signatures = None
+        if documents is not None:
+            signatures = fingerprint_signatures(documents)
+        elif in_snapshot:
+            signatures = (snapshot.fingerprints[rows], snapshot.has_fingerprint[rows])
+        
+        similarity = None
+        matrices = None
+        if from_index:
+            vectors = self.vector_index.vectors_of(audio_ids)
+            if vectors is not None:
+                similarity = vectors @ vectors.T
+        elif documents is not None:
+            columns, present = stack_features([feature_values(document) for document in documents], None)
+            matrices = FeatureMatrices(
+                ids=np.array(audio_ids, dtype=str),
+                columns=columns,
+                present={column: present[:, i] for i, column in enumerate(FEATURE_COLUMNS)},
+                generation=0
+            )
+        elif in_snapshot:
+            matrices = self._matrix_rows(snapshot.features, rows)
+        
+        if matrices is not None:
+            positions = np.arange(len(audio_ids))
+            similarity = similarity_block(prepare_features(matrices), positions, positions, self.feature_weights)
+        if similarity is None:
+            return candidates[:limit]
+        
+        return diversify(candidates, similarity, limit, mmr_lambda, signatures if dedup else None)
+    
+    def _similar_from_store(self, audio_features: AudioFeatures, limit: int) -> List[Dict[str, Any]]:
+        """
+        Score every track in the feature store at once
+        
+        Tags are not part of the store, so text features do not contribute.
+        """
+        self.feature_store.refresh()
+        matrices = self.feature_store.matrices(["mfccs", "chroma", "tempo", "spectral"])
+        if not len(matrices):
+            logger.warning("No audio features found in feature store")
+            return []
+        
+        return self._similar_from_matrices(audio_features, matrices, limit)
+    
+    def _similar_from_matrices(self, audio_features: AudioFeatures, matrices: FeatureMatrices,
+                               limit: int, rows: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Rank every row of the feature matrices against the audio features
+        
+        Gives the same scores as _calculate_similarity, computed over whole
+        columns instead of one document at a time. With rows, only those
+        rows are scored.
+        """
+        if rows is not None:
+            matrices = self._matrix_rows(matrices, rows)
+        
+        scores = self._store_similarities(audio_features, matrices)
+        scores[matrices.ids == audio_features.audio_id] = -np.inf
+        
+        candidates = self._top_rows(scores, limit)
+        return [
+            {'audio_id': str(matrices.ids[i]), 'score': float(scores[i])}
+            for i in candidates
+        ]
+    
+    def _matrix_rows(self, matrices: FeatureMatrices, rows: np.ndarray) -> FeatureMatrices:
+        """The rows of the audio similarity columns"""
+        columns = ["mfccs", "chroma", "tempo", "spectral"]
+        return FeatureMatrices(
+            ids=matrices.ids[rows],
+            columns={column: matrices.columns[column][rows] for column in columns},
+            present={column: matrices.present[column][rows] for column in columns},
+            generation=matrices.generation
+        )
+    
+    def _top_rows(self, scores: np.ndarray, limit: int) -> np.ndarray:
+        """Positions of the highest finite scores, best first"""
+        top = min(limit, int(np.isfinite(scores).sum()))
+        if top <= 0:
+            return np.zeros(0, dtype=np.int64)
+        candidates = np.argpartition(-scores, top - 1)[:top]
+        return candidates[np.argsort(-scores[candidates], kind="stable")]
+    
+    def _store_similarities(self, source_features: AudioFeatures, matrices: FeatureMatrices) -> np.ndarray:
+        """
+        Weighted similarity of the source features against every row of the matrices
+        
+        Returns:
+            (n,) float32 similarity scores
+        """
+        n = len(matrices)
+        similarities = {
+            'mfccs': self._cosine_column(source_features.mfccs, matrices, 'mfccs'),
+            'chroma': self._cosine_column(source_features.chroma, matrices, 'chroma')
+        }
+        
+        # Tempo similarity
+        tempos = matrices.columns['tempo']
+        tempo_sim = np.zeros(n, dtype=np.float32)
+        if source_features.tempo:
+            largest = np.maximum(tempos, source_features.tempo)
+            valid = matrices.present['tempo'] & (tempos != 0) & (largest > 0)
+            np.divide(np.abs(tempos - source_features.tempo), largest, out=tempo_sim, where=valid)
+            tempo_sim = np.where(valid, 1.0 - tempo_sim, 0.0)
+        similarities['tempo'] = tempo_sim
+        
+        # Spectral features similarity, only where all three are non-zero
+        spectral_source = [
+            source_features.spectral_centroid,
+            source_features.spectral_bandwidth,
+            source_features.spectral_rolloff
+        ]
+        spectral_sim = np.zeros(n, dtype=np.float32)
+        if all(spectral_source):
+            spectral = matrices.columns['spectral']
+            valid = matrices.present['spectral'] & np.all(spectral != 0, axis=1)
+            spectral_sim = np.where(valid, self._cosine_column(spectral_source, matrices, 'spectral'), 0.0)
+        similarities['spectral_features'] = spectral_sim
+        
+        weighted_similarity = np.zeros(n, dtype=np.float32)
+        for feature, weight in self.feature_weights.items():
+            if feature in similarities:
+                weighted_similarity += similarities[feature] * weight
+        
+        return weighted_similarity
+    
+    def _cosine_column(self, vector, matrices: FeatureMatrices, column: str) -> np.ndarray:
+        """
+        Cosine similarity of a vector against every row of a feature column;
+        0 for missing features and zero vectors, like _cosine_similarity
+        """
+        values = matrices.columns[column]
+        result = np.zeros(len(matrices), dtype=np.float32)
+        if not vector or len(vector) != values.shape[1]:
+            return result
+        
+        query = np.asarray(vector, dtype=np.float32)
+        query_norm = np.linalg.norm(query)
+        if query_norm == 0:
+            return result
+        
+        norms = np.linalg.norm(values, axis=1)
+        valid = matrices.present[column] & (norms > 0)
+        np.divide(values @ query, norms * query_norm, out=result, where=valid)
+        return result
+    
     def _calculate_similarity(self, source_features: AudioFeatures, target_features: Dict[str, Any]) -> float:
         """
         Calculate weighted similarity between two sets of audio features
@@ -220,20 +515,24 @@ class ContentBasedRecommender:
         
         try:
             # Encode tags
-            tags_embedding = self.text_model.encode(' '.join(tags))
+            tags_embedding = await self.text_model.aencode(' '.join(tags))
+            
+            snapshot = self.catalog.snapshot if self.catalog is not None else None
+            if snapshot is not None:
+                return self._tag_matches(tags_embedding, snapshot, limit)
             
             # Get all tracks with their tags
             tracks = await self.db.get_tracks_with_tags()
             
+            tracks = [track for track in tracks if track.get('tags')]
+            if not tracks:
+                return []
+            
+            # Encode every track's tags in one batch
+            track_embeddings = await self.text_model.aencode([' '.join(track['tags']) for track in tracks])
+            
             similarities = []
-            for track in tracks:
-                track_tags = track.get('tags', [])
-                if not track_tags:
-                    continue
-                
-                # Encode track tags
-                track_embedding = self.text_model.encode(' '.join(track_tags))
-                
+            for track, track_embedding in zip(tracks, track_embeddings):
                 # Calculate similarity
                 similarity = self._cosine_similarity(tags_embedding, track_embedding)
                 
@@ -250,4 +549,198 @@ class ContentBasedRecommender:
         
         except Exception as e:
             logger.error(f"Error getting recommendations by tags: {e}")
-            return []
\ No newline at end of file
+            return []
+    
+    def _tag_matches(self, tags_embedding, snapshot: CatalogSnapshot, limit: int) -> List[Dict[str, Any]]:
+        """
+        Rank tagged tracks in the snapshot by cosine similarity to a tag embedding
+        
+        The snapshot holds unit-length tag embeddings, so one matrix-vector
+        product scores the whole catalog.
+        """
+        scores = self._tag_scores(tags_embedding, snapshot)
+        return [
+            {'audio_id': str(snapshot.features.ids[i]), 'score': float(scores[i])}
+            for i in self._top_rows(scores, limit)
+        ]
+    
+    def _tag_scores(self, tags_embedding, snapshot: CatalogSnapshot,
+                    rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Cosine similarity of a tag embedding to the tags of the snapshot's
+        tracks (or the given rows of it); -inf for tracks without tags
+        """
+        count = len(snapshot) if rows is None else len(rows)
+        query = np.asarray(tags_embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query)
+        embeddings = snapshot.tag_embeddings if rows is None else snapshot.tag_embeddings[rows]
+        has_tags = snapshot.has_tags if rows is None else snapshot.has_tags[rows]
+        if query_norm == 0 or embeddings.shape[1] != len(query):
+            return np.full(count, -np.inf, dtype=np.float32)
+        
+        return np.where(has_tags, embeddings @ (query / query_norm), -np.inf).astype(np.float32)
+    
+    async def recommend(self, seed: Optional[AudioFeatures] = None, text: Optional[str] = None,
+                        tags: Optional[List[str]] = None, filters: Optional[Dict[str, Any]] = None,
+                        limit: int = 10, candidates: int = 200) -> List[Dict[str, Any]]:
+        """
+        Recommend tracks for any mix of a seed track, free text and tags
+        
+        Each modality proposes its own candidates under the filters, at the
+        same time: the vector index (or a scan of the catalog snapshot)
+        for the seed track, the tag embeddings for text. Their union, at
+        most `candidates` per modality, is re-ranked with feature_weights:
+        the audio feature weights for similarity to the seed and the text
+        weight for similarity to the text, normalized over the modalities
+        used. Re-ranking cost depends only on the candidate count.
+        
+        Args:
+            seed: Audio features of a seed track
+            text: Free-text description
+            tags: Tags or genres
+            filters: Attribute conditions, as for get_similar_tracks
+            limit: Maximum number of tracks to return
+            candidates: Candidates each modality proposes
+            
+        Returns:
+            List of recommended tracks with fused scores
+        """
+        query_text = ' '.join(([text] if text else []) + list(tags or []))
+        if seed is None and not query_text:
+            return []
+        
+        try:
+            text_embedding = None
+            if query_text and self.text_model:
+                text_embedding = await self.text_model.aencode(query_text)
+            
+            snapshot = self.catalog.snapshot if self.catalog is not None else None
+            if snapshot is None:
+                return await self._merge_recommendations(seed, query_text, filters, limit, candidates)
+            
+            rows = snapshot.attributes.rows(filters)
+            stages = []
+            if seed is not None:
+                stages.append(asyncio.to_thread(self._audio_candidates, snapshot, seed, rows, filters, candidates))
+            if text_embedding is not None:
+                stages.append(asyncio.to_thread(self._text_candidates, snapshot, text_embedding, rows, candidates))
+            if not stages:
+                return []
+            
+            pool = np.unique(np.concatenate(await asyncio.gather(*stages)))
+            return self._fused_ranking(snapshot, seed, text_embedding, pool, limit)
+        
+        except Exception as e:
+            logger.error(f"Error getting fused recommendations: {e}")
+            return []
+    
+    def _audio_candidates(self, snapshot: CatalogSnapshot, seed: AudioFeatures,
+                          rows: Optional[np.ndarray], filters: Optional[Dict[str, Any]],
+                          candidates: int) -> np.ndarray:
+        """Snapshot rows of the tracks most similar to the seed"""
+        index = self.vector_index
+        if (index is not None and seed.audio_id in index
+                and (not filters or index.attributes is not None)):
+            similar = index.similar(seed.audio_id, candidates, filters=filters) or []
+            found = [snapshot.rows.get(track['audio_id']) for track in similar]
+            return np.array([row for row in found if row is not None], dtype=np.int64)
+        
+        matrices = snapshot.features if rows is None else self._matrix_rows(snapshot.features, rows)
+        scores = self._store_similarities(seed, matrices)
+        top = self._top_rows(scores, candidates)
+        return top if rows is None else rows[top]
+    
+    def _text_candidates(self, snapshot: CatalogSnapshot, text_embedding, rows: Optional[np.ndarray],
+                         candidates: int) -> np.ndarray:
+        """Snapshot rows of the tracks whose tags are closest to the text"""
+        top = self._top_rows(self._tag_scores(text_embedding, snapshot, rows), candidates)
+        return top if rows is None else rows[top]
+    
+    def _fused_ranking(self, snapshot: CatalogSnapshot, seed: Optional[AudioFeatures], text_embedding,
+                       pool: np.ndarray, limit: int) -> List[Dict[str, Any]]:
+        """Score candidate rows on every modality of the query and keep the best"""
+        text_weight = self.feature_weights.get('text_features', 0)
+        scores = np.zeros(len(pool), dtype=np.float32)
+        total_weight = 0.0
+        
+        if seed is not None:
+            scores += self._store_similarities(seed, self._matrix_rows(snapshot.features, pool))
+            total_weight += sum(weight for feature, weight in self.feature_weights.items() if feature != 'text_features')
+        if text_embedding is not None:
+            text_scores = self._tag_scores(text_embedding, snapshot, pool)
+            scores += text_weight * np.where(np.isfinite(text_scores), text_scores, 0)
+            total_weight += text_weight
+        
+        if total_weight > 0:
+            scores /= total_weight
+        if seed is not None:
+            scores[snapshot.features.ids[pool] == seed.audio_id] = -np.inf
+        
+        return [
+            {'audio_id': str(snapshot.features.ids[pool[i]]), 'score': float(scores[i])}
+            for i in self._top_rows(scores, limit)
+        ]
+    
+    async def _merge_recommendations(self, seed: Optional[AudioFeatures], query_text: str,
+                                     filters: Optional[Dict[str, Any]], limit: int,
+                                     candidates: int) -> List[Dict[str, Any]]:
+        """
+        Fuse the separate audio and tag rankings, before the catalog
+        snapshot is available
+        
+        Tag matches cannot be filtered by attributes without the snapshot,
+        so filtered queries only use the seed track.
+        """
+        use_text = bool(query_text) and not filters
+        audio, text = await asyncio.gather(
+            self.get_similar_tracks(seed, candidates, filters, mmr_lambda=1.0, dedup=False)
+            if seed is not None else asyncio.sleep(0, []),
+            self.get_recommendations_by_tags([query_text], candidates) if use_text else asyncio.sleep(0, [])
+        )
+        
+        text_weight = self.feature_weights.get('text_features', 0)
+        audio_weight = sum(weight for feature, weight in self.feature_weights.items() if feature != 'text_features')
+        total_weight = (audio_weight if seed is not None else 0) + (text_weight if use_text else 0)
+        
+        fused: Dict[str, float] = {}
+        for track in audio:
+            fused[track['audio_id']] = fused.get(track['audio_id'], 0) + track['score']
+        for track in text:
+            fused[track['audio_id']] = fused.get(track['audio_id'], 0) + text_weight * track['score']
+        
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [
+            {'audio_id': audio_id, 'score': float(score / total_weight if total_weight else score)}
+            for audio_id, score in ranked
+        ]
+    
+    async def recommend_for_user(self, user_id: str, limit: int = 10,
+                                 filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Recommend tracks for a user from their current taste profile
+        
+        Args:
+            user_id: User to recommend for
+            limit: Maximum number of tracks to return
+            filters: Attribute conditions, as for get_similar_tracks
+            
+        Returns:
+            List of recommended tracks, leaving out the user's recent
+            tracks; empty for users without positive history
+        """
+        if self.user_profiles is None or self.vector_index is None:
+            return []
+        
+        try:
+            taste = self.user_profiles.profiles.vector(user_id)
+            if taste is None:
+                return []
+            
+            recent = self.user_profiles.profiles.recent(user_id)
+            return await asyncio.to_thread(
+                self.vector_index.search, taste, limit, exclude=recent, filters=filters
+            )
+        
+        except Exception as e:
+            logger.error(f"Error getting recommendations for user {user_id}: {e}")
+            return []
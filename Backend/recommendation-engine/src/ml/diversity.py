@@ -0,0 +1,168 @@
+import numpy as np
+import logging
+import math
+from functools import lru_cache
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Fingerprints are reduced to 64-bit SimHash signatures; two tracks whose
+# signatures differ in at most this many bits (an angle of about 22
+# degrees between their fingerprints) are taken to be the same recording
+DUPLICATE_DISTANCE = 8
+
+# Multiply-adds allowed for the candidates' pairwise similarity matrix,
+# which keeps re-ranking 500 candidates of 48 dimensions under a millisecond
+PAIRWISE_BUDGET = 500 * 500 * 48
+
+# Peak fingerprints are (frequency bin, frame) pairs, packed into one key
+# the way the audio processor's similarity matrix packs them
+_PEAK_KEY_FACTOR = 1 << 32
+
+_BITS = np.arange(64, dtype=np.uint64)
+_POPCOUNT = np.array([bin(i).count("1") for i in range(1 << 16)], dtype=np.uint8)
+
+@lru_cache(maxsize=8)
+def _hyperplanes(dim: int) -> np.ndarray:
+    """Fixed random hyperplanes for SimHash, the same in every process"""
+    return np.random.default_rng(dim).standard_normal((dim, 64)).astype(np.float32)
+
+def _pack(bits: np.ndarray) -> int:
+    return int(np.packbits(bits.astype(np.uint8), bitorder="little").view("<u8")[0])
+
+def _mix(keys: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, spreading peak keys over all 64 bits"""
+    with np.errstate(over="ignore"):
+        keys = keys + np.uint64(0x9E3779B97F4A7C15)
+        keys = (keys ^ (keys >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        keys = (keys ^ (keys >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return keys ^ (keys >> np.uint64(31))
+
+def fingerprint_signature(document: Dict[str, Any]) -> Optional[int]:
+    """
+    64-bit SimHash of a track's audio fingerprint
+
+    Neural fingerprint vectors are projected on fixed random hyperplanes;
+    peak fingerprints take a majority vote of per-peak hashes. Either way
+    the signature is the same in every process, and fingerprints that
+    largely agree have signatures differing in few bits.
+
+    Returns:
+        The signature, or None without a usable fingerprint
+    """
+    fingerprint = document.get("audio_fingerprint")
+    if not isinstance(fingerprint, dict):
+        return None
+
+    vector = fingerprint.get("vector")
+    if vector:
+        vector = np.asarray(vector, dtype=np.float32)
+        if not np.any(vector):
+            return None
+        return _pack(vector @ _hyperplanes(len(vector)) > 0)
+
+    peaks = fingerprint.get("peaks")
+    if peaks:
+        keys = np.unique(np.array([int(f) * _PEAK_KEY_FACTOR + int(t) for f, t in peaks], dtype=np.uint64))
+        bits = (_mix(keys)[:, None] >> _BITS) & np.uint64(1)
+        return _pack(2 * bits.sum(axis=0) > len(keys))
+
+    return None
+
+def fingerprint_signatures(documents: Iterable[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Signatures of documents, in order
+
+    Returns:
+        Tuple of (n,) uint64 signatures and (n,) bool for which tracks have one
+    """
+    signatures = [fingerprint_signature(document) for document in documents]
+    return (
+        np.array([signature or 0 for signature in signatures], dtype=np.uint64),
+        np.array([signature is not None for signature in signatures], dtype=bool)
+    )
+
+def hamming_distances(signature: np.uint64, signatures: np.ndarray) -> np.ndarray:
+    """Bits in which one signature differs from each of the others"""
+    differences = np.ascontiguousarray(np.bitwise_xor(signatures, signature)).view(np.uint16)
+    return _POPCOUNT[differences].reshape(-1, 4).sum(axis=1)
+
+def candidate_pool(limit: int, candidates: int, width: int, budget: int = PAIRWISE_BUDGET) -> int:
+    """
+    Number of candidates to re-rank: as many as asked for, but no more than
+    the pairwise similarity budget allows for features of the given width,
+    and never fewer than the results wanted
+    """
+    affordable = int(math.sqrt(budget / max(width, 1)))
+    return max(limit, min(candidates, affordable))
+
+def mmr_order(relevance: np.ndarray, similarity: np.ndarray, limit: int, mmr_lambda: float = 0.7,
+              signatures: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+              max_distance: int = DUPLICATE_DISTANCE) -> np.ndarray:
+    """
+    Order candidates by maximal marginal relevance
+
+    Each step picks the candidate maximizing
+    mmr_lambda * relevance - (1 - mmr_lambda) * (similarity to the closest
+    candidate already picked). The closest-pick similarities are kept as
+    one array, updated with the picked candidate's row of the similarity
+    matrix, so a step is a few vector operations over the candidates.
+
+    Args:
+        relevance: (n,) score of each candidate against the query
+        similarity: (n, n) candidate-to-candidate similarity, on the same
+            scale as relevance
+        limit: Candidates to pick
+        mmr_lambda: 1 ranks by relevance alone; lower values trade
+            relevance for diversity
+        signatures: Fingerprint signatures and their availability, as from
+            fingerprint_signatures; candidates within max_distance bits of
+            a picked one are dropped as duplicates (None to keep them)
+        max_distance: Largest signature distance counted as a duplicate
+
+    Returns:
+        Positions of the picked candidates, in order
+    """
+    relevance = np.asarray(relevance, dtype=np.float32)
+    gain = np.where(np.isfinite(relevance), mmr_lambda * relevance, -np.inf).astype(np.float32)
+    closest = np.full(len(relevance), -np.inf, dtype=np.float32)
+    scores = gain.copy()
+
+    picked = []
+    for _ in range(min(limit, len(relevance))):
+        best = int(np.argmax(scores))
+        if scores[best] == -np.inf:
+            break
+        picked.append(best)
+
+        # Picked candidates and their duplicates drop out with a gain of -inf
+        gain[best] = -np.inf
+        if signatures is not None and signatures[1][best]:
+            duplicates = hamming_distances(signatures[0][best], signatures[0]) <= max_distance
+            gain[duplicates & signatures[1]] = -np.inf
+
+        np.maximum(closest, similarity[best], out=closest)
+        np.multiply(closest, mmr_lambda - 1, out=scores)
+        scores += gain
+
+    return np.array(picked, dtype=np.int64)
+
+def diversify(results: List[Dict[str, Any]], similarity: np.ndarray, limit: int, mmr_lambda: float = 0.7,
+              signatures: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> List[Dict[str, Any]]:
+    """
+    Re-rank scored results ({audio_id, score}) with mmr_order
+
+    Args:
+        results: Candidates, aligned with the rows of similarity
+        similarity: (n, n) candidate-to-candidate similarity
+        limit: Maximum number of results
+        mmr_lambda: Relevance weight, as for mmr_order
+        signatures: Candidates' fingerprint signatures for dropping duplicates
+
+    Returns:
+        Up to limit of the results
+    """
+    if not results:
+        return []
+    relevance = np.array([result['score'] for result in results], dtype=np.float32)
+    return [results[i] for i in mmr_order(relevance, similarity, limit, mmr_lambda, signatures)]
@@ -0,0 +1,221 @@
+import numpy as np
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import List, Optional, Sequence
+
+from .feature_store import FeatureStore, FeatureMatrices
+
+logger = logging.getLogger(__name__)
+
+# Columns combined into the projected vector, with their widths
+PROJECTED_COLUMNS = {
+    "mfccs": 20,
+    "chroma": 12,
+    "contrast": 7,
+    "tonnetz": 6,
+    "tempo": 1,
+    "spectral": 3
+}
+
+# Measured in BPM or Hz, so compared on a log scale
+LOG_COLUMNS = {"tempo", "spectral"}
+
+class FeatureProjection:
+    """
+    Fitted normalization and PCA that turns a track's features into one
+    compact float32 vector
+
+    Each feature is standardized with the catalog's mean and standard
+    deviation (after a log for BPM and Hz values), so no single coefficient
+    or unit dominates, and each column is scaled to the same total variance
+    regardless of its width. PCA then keeps the leading components,
+    optionally whitened, and vectors are scaled to unit length so inner
+    products are cosine similarities.
+
+    Missing features are imputed with the catalog mean. The fitted
+    parameters are saved with a version derived from their values; vectors
+    are computed once when tracks are ingested and tagged with that version.
+    """
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray, components: np.ndarray,
+                 explained_variance: np.ndarray, columns: Sequence[str], whiten: bool,
+                 fitted_at: Optional[float] = None, samples: int = 0):
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.components = np.asarray(components, dtype=np.float64)
+        self.explained_variance = np.asarray(explained_variance, dtype=np.float64)
+        self.columns = list(columns)
+        self.whiten = whiten
+        self.fitted_at = fitted_at or time.time()
+        self.samples = samples
+
+        # Standardization, PCA and whitening folded into one affine map
+        projection = self.components.T / self.scale[:, None]
+        if whiten:
+            projection = projection / np.sqrt(np.maximum(self.explained_variance, 1e-12))
+        self._projection = projection.astype(np.float32)
+        self._offset = (self.mean @ projection).astype(np.float32)
+
+    @property
+    def dim(self) -> int:
+        return len(self.components)
+
+    @property
+    def version(self) -> str:
+        """Identifies the fitted parameters; changes whenever they do"""
+        digest = hashlib.sha256()
+        for array in (self.mean, self.scale, self.components, self.explained_variance):
+            digest.update(np.ascontiguousarray(array).tobytes())
+        digest.update(json.dumps([self.columns, self.whiten]).encode())
+        return f"pca{self.dim}{'w' if self.whiten else ''}-{digest.hexdigest()[:12]}"
+
+    @staticmethod
+    def _raw(matrices: FeatureMatrices, columns: Sequence[str]) -> np.ndarray:
+        """Stack the columns into one float64 matrix, NaN where missing"""
+        parts = []
+        for column in columns:
+            values = np.asarray(matrices.columns[column], dtype=np.float64)
+            if values.ndim == 1:
+                values = values[:, None]
+            if column in LOG_COLUMNS:
+                values = np.log1p(np.maximum(values, 0))
+            parts.append(np.where(matrices.present[column][:, None], values, np.nan))
+        return np.concatenate(parts, axis=1)
+
+    @classmethod
+    def fit(cls, matrices: FeatureMatrices, n_components: int = 48, whiten: bool = True,
+            columns: Optional[Sequence[str]] = None, max_samples: int = 200000,
+            seed: int = 0) -> "FeatureProjection":
+        """
+        Fit the projection to a catalog
+
+        Args:
+            matrices: Catalog features
+            n_components: Vector width, at most the number of input values
+            whiten: Whether to give every component unit variance
+            columns: Columns to combine (default: PROJECTED_COLUMNS)
+            max_samples: Tracks sampled for fitting
+            seed: Sampling seed
+
+        Returns:
+            Fitted projection
+        """
+        columns = list(columns or PROJECTED_COLUMNS)
+        rows = np.arange(len(matrices))
+        if len(rows) > max_samples:
+            rows = np.sort(np.random.default_rng(seed).choice(rows, max_samples, replace=False))
+        if len(rows) < 2:
+            raise ValueError("At least two tracks are needed to fit a projection")
+
+        sample = FeatureMatrices(
+            ids=matrices.ids[rows],
+            columns={column: matrices.columns[column][rows] for column in columns},
+            present={column: matrices.present[column][rows] for column in columns},
+            generation=matrices.generation
+        )
+        raw = cls._raw(sample, columns)
+
+        # Statistics over the tracks having each feature; features no track
+        # has are left at zero
+        observed = ~np.isnan(raw)
+        counts = np.maximum(observed.sum(axis=0), 1)
+        mean = np.where(observed, raw, 0).sum(axis=0) / counts
+        std = np.sqrt(np.where(observed, (raw - mean) ** 2, 0).sum(axis=0) / counts)
+        std = np.where(std > 1e-6, std, 1.0)
+
+        # Equal total variance per column: a 20-wide column is scaled down
+        # by sqrt(20) relative to tempo
+        widths = []
+        for column in columns:
+            width = matrices.columns[column].shape[1] if matrices.columns[column].ndim > 1 else 1
+            widths.extend([width] * width)
+        scale = std * np.sqrt(np.array(widths, dtype=np.float64))
+
+        standardized = np.nan_to_num((raw - mean) / scale)
+        n_components = min(n_components, standardized.shape[1], len(rows))
+        _, singular_values, vt = np.linalg.svd(standardized, full_matrices=False)
+        explained_variance = singular_values[:n_components] ** 2 / (len(rows) - 1)
+
+        projection = cls(mean, scale, vt[:n_components], explained_variance, columns, whiten,
+                         samples=len(rows))
+        retained = explained_variance.sum() / max((singular_values ** 2).sum() / (len(rows) - 1), 1e-12)
+        logger.info(f"Fitted feature projection {projection.version} on {len(rows)} tracks, "
+                    f"{retained:.1%} of variance retained")
+        return projection
+
+    def transform(self, matrices: FeatureMatrices) -> np.ndarray:
+        """
+        Project tracks to unit-length vectors
+
+        Returns:
+            (n, dim) float32 vectors
+        """
+        raw = self._raw(matrices, self.columns)
+        raw = np.where(np.isnan(raw), self.mean, raw).astype(np.float32)
+        vectors = raw @ self._projection - self._offset
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+    def save(self, path: str) -> None:
+        """Save the fitted parameters to an .npz file"""
+        metadata = {
+            "version": self.version,
+            "columns": self.columns,
+            "whiten": self.whiten,
+            "fitted_at": self.fitted_at,
+            "samples": self.samples
+        }
+        temporary = f"{path}.tmp.npz"
+        np.savez(
+            temporary,
+            mean=self.mean,
+            scale=self.scale,
+            components=self.components,
+            explained_variance=self.explained_variance,
+            metadata=np.array(json.dumps(metadata))
+        )
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str) -> "FeatureProjection":
+        """Load parameters saved by save()"""
+        with np.load(path) as data:
+            metadata = json.loads(str(data["metadata"]))
+            projection = cls(
+                data["mean"], data["scale"], data["components"], data["explained_variance"],
+                metadata["columns"], metadata["whiten"], metadata["fitted_at"], metadata["samples"]
+            )
+        if projection.version != metadata["version"]:
+            raise ValueError(f"Feature projection {path} does not match its recorded version")
+        return projection
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Fit the feature projection and apply it to the feature store")
+    parser.add_argument("--store", default=os.getenv("FEATURE_STORE_PATH"), help="Feature store directory")
+    parser.add_argument("--output", default=os.getenv("FEATURE_PROJECTION_PATH"), help="Where to save the projection (.npz)")
+    parser.add_argument("--components", type=int, default=48, help="Vector width")
+    parser.add_argument("--no-whiten", action="store_true", help="Keep the components' variance")
+    parser.add_argument("--max-samples", type=int, default=200000, help="Tracks sampled for fitting")
+    args = parser.parse_args(argv)
+
+    if not args.store or not args.output:
+        parser.error("--store and --output (or FEATURE_STORE_PATH and FEATURE_PROJECTION_PATH) are required")
+
+    logging.basicConfig(level=logging.INFO)
+    store = FeatureStore(args.store)
+    projection = FeatureProjection.fit(
+        store.matrices(list(PROJECTED_COLUMNS)),
+        n_components=args.components,
+        whiten=not args.no_whiten,
+        max_samples=args.max_samples
+    )
+    projection.save(args.output)
+    store.reproject(projection)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,628 @@
+import numpy as np
+import argparse
+import itertools
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Any, Optional, Iterable, Iterator, Sequence, Tuple
+
+if TYPE_CHECKING:
+    from .feature_projection import FeatureProjection
+
+logger = logging.getLogger(__name__)
+
+# Fixed width of each feature column; the embedding width is set per store
+FEATURE_COLUMNS = {
+    "mfccs": 20,
+    "chroma": 12,
+    "contrast": 7,
+    "tonnetz": 6,
+    "tempo": 1,
+    "spectral": 3,  # Centroid, bandwidth and rolloff in Hz
+    "embedding": None
+}
+
+# Projected vector of each track, present in stores opened with a projection
+VECTOR_COLUMN = "vector"
+
+MANIFEST_FILE = "manifest.json"
+FORMAT_VERSION = 1
+
+@dataclass(frozen=True)
+class FeatureMatrices:
+    """
+    Stacked features of every live track in the store
+
+    Each column is an (n, width) float32 matrix, tempo an (n,) vector.
+    Rows of tracks lacking a feature are zero and False in present. The
+    vector column, if requested, is present for every track.
+    """
+    ids: np.ndarray
+    columns: Dict[str, np.ndarray]
+    present: Dict[str, np.ndarray]
+    generation: int
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+@dataclass(frozen=True)
+class _Segment:
+    """An immutable, memory-mapped block of rows"""
+    name: str
+    ids: np.ndarray
+    columns: Dict[str, np.ndarray]
+    present: np.ndarray  # (rows, n columns) bool
+    deleted: Optional[np.ndarray]  # (rows,) bool, or None if nothing is deleted
+    tombstones: Optional[str]  # File holding deleted
+
+    @property
+    def live(self) -> np.ndarray:
+        return ~self.deleted if self.deleted is not None else np.ones(len(self.ids), dtype=bool)
+
+def feature_values(features: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Pick each column's value from a feature document
+
+    Accepts AudioFeaturePipeline output as well as the flattened documents
+    the recommender reads from MongoDB.
+    """
+    advanced = features.get("advanced_features") or {}
+    embedding = features.get("audio_embedding", features.get("embedding"))
+    if isinstance(embedding, dict):
+        embedding = embedding.get("vector")
+
+    spectral = [features.get(key) for key in ("spectral_centroid", "spectral_bandwidth", "spectral_rolloff")]
+    tempo = features.get("tempo")
+
+    return {
+        "mfccs": features.get("mfccs"),
+        "chroma": features.get("chroma", features.get("chroma_features")),
+        "contrast": features.get("spectral_contrast", advanced.get("spectral_contrast")),
+        "tonnetz": features.get("tonnetz", advanced.get("tonnetz")),
+        "tempo": [tempo] if tempo is not None else None,
+        "spectral": spectral if all(value is not None for value in spectral) else None,
+        "embedding": embedding
+    }
+
+def stack_features(values: Sequence[Dict[str, Any]],
+                   embedding_dim: Optional[int]) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    """
+    Stack column values of many tracks into fixed-width matrices
+
+    Args:
+        values: Per-track column values from feature_values
+        embedding_dim: Embedding width (None for no embeddings)
+
+    Returns:
+        Tuple of (matrix per column, (n, n columns) bool present matrix);
+        values of the wrong width count as missing
+    """
+    widths = dict(FEATURE_COLUMNS)
+    widths["embedding"] = embedding_dim or 0
+
+    n = len(values)
+    columns = {
+        column: np.zeros((n, width) if column != "tempo" else n, dtype=np.float32)
+        for column, width in widths.items()
+    }
+    present = np.zeros((n, len(FEATURE_COLUMNS)), dtype=bool)
+
+    for row, row_values in enumerate(values):
+        for position, (column, width) in enumerate(widths.items()):
+            value = row_values[column]
+            if value is None or width == 0 or len(value) != width:
+                continue
+            columns[column][row] = value[0] if column == "tempo" else value
+            present[row, position] = True
+
+    return columns, present
+
+class FeatureStore:
+    """
+    Columnar on-disk store of track features
+
+    Rows live in append-only segments, one NumPy file per column, which are
+    memory-mapped for reading. Appending an existing audio_id replaces its
+    row, deleting marks rows with a tombstone, and compaction rewrites the
+    live rows into a single segment. A JSON manifest lists the current
+    segments and is replaced atomically, so readers see either the old or
+    the new state and memory-mapped files stay valid after compaction
+    removes them.
+
+    Once compacted, matrices() hands out the memory maps themselves without
+    copying. With several segments or tombstones, live rows are gathered
+    into new arrays.
+
+    With a FeatureProjection, each appended track also gets its projected
+    vector, stored as the vector column. The manifest records the
+    projection's version; reproject() recomputes every vector when it
+    changes, so vectors are never computed at query time.
+
+    One process writes to a store; any number may read it.
+    """
+
+    def __init__(self, path: str, embedding_dim: Optional[int] = None,
+                 projection: Optional["FeatureProjection"] = None):
+        """
+        Args:
+            path: Store directory, created if missing
+            embedding_dim: Embedding width for a new store (default: the
+                width of the first embedding appended)
+            projection: Projection applied to appended tracks; needed to
+                append to a store that has vectors
+        """
+        self.path = path
+        self.projection = projection
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get("format") != FORMAT_VERSION:
+                raise ValueError(f"Unsupported feature store format: {manifest.get('format')}")
+        else:
+            manifest = {
+                "format": FORMAT_VERSION,
+                "generation": 0,
+                "next_segment": 0,
+                "embedding_dim": embedding_dim,
+                "projection": None,
+                "vector_dim": None,
+                "segments": []
+            }
+
+        self._load(manifest)
+
+    @property
+    def generation(self) -> int:
+        """Incremented by every change to the store"""
+        return self._manifest["generation"]
+
+    @property
+    def embedding_dim(self) -> Optional[int]:
+        return self._manifest["embedding_dim"]
+
+    @property
+    def projection_version(self) -> Optional[str]:
+        """Version of the projection the stored vectors were made with"""
+        return self._manifest.get("projection")
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, audio_id: str) -> bool:
+        return audio_id in self._index
+
+    def _widths(self) -> Dict[str, int]:
+        widths = dict(FEATURE_COLUMNS)
+        widths["embedding"] = self.embedding_dim or 0
+        if self.projection_version:
+            widths[VECTOR_COLUMN] = self._manifest["vector_dim"]
+        return widths
+
+    def _load(self, manifest: Dict[str, Any]) -> None:
+        """Open the manifest's segments and index their live rows"""
+        segments = []
+        index: Dict[str, Tuple[int, int]] = {}
+
+        for position, entry in enumerate(manifest["segments"]):
+            segment = self._open_segment(entry, bool(manifest.get("projection")))
+            segments.append(segment)
+            for row in np.flatnonzero(segment.live):
+                index[str(segment.ids[row])] = (position, int(row))
+
+        self._manifest = manifest
+        self._segments = segments
+        self._index = index
+
+    def _open_segment(self, entry: Dict[str, Any], vectors: bool) -> _Segment:
+        directory = os.path.join(self.path, entry["name"])
+
+        def load(name: str) -> np.ndarray:
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+
+        tombstones = entry.get("tombstones")
+        return _Segment(
+            name=entry["name"],
+            ids=load("ids"),
+            columns={column: load(column) for column in list(FEATURE_COLUMNS) + ([VECTOR_COLUMN] if vectors else [])},
+            present=load("present"),
+            deleted=np.load(os.path.join(self.path, tombstones)) if tombstones else None,
+            tombstones=tombstones
+        )
+
+    def refresh(self) -> bool:
+        """
+        Reload the manifest if another process changed the store
+
+        Returns:
+            Whether the store changed
+        """
+        for attempt in range(3):
+            with open(os.path.join(self.path, MANIFEST_FILE)) as f:
+                manifest = json.load(f)
+
+            with self._lock:
+                if manifest["generation"] == self.generation:
+                    return False
+                try:
+                    self._load(manifest)
+                    return True
+                except FileNotFoundError:
+                    # Compacted away between reading the manifest and
+                    # opening its segments; read the newer manifest
+                    if attempt == 2:
+                        raise
+        return False
+
+    def append(self, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        Add or replace tracks as a new segment
+
+        Args:
+            records: Feature documents, each with an audio_id
+
+        Returns:
+            Number of rows written
+        """
+        # Later records for the same track win
+        latest: Dict[str, Dict[str, Any]] = {}
+        for record in records:
+            audio_id = record.get("audio_id")
+            if audio_id is None:
+                raise ValueError("Feature records need an audio_id")
+            latest[str(audio_id)] = feature_values(record)
+        if not latest:
+            return 0
+
+        with self._lock:
+            self._check_projection()
+            manifest = json.loads(json.dumps(self._manifest))
+            if manifest["embedding_dim"] is None:
+                manifest["embedding_dim"] = next(
+                    (len(values["embedding"]) for values in latest.values() if values["embedding"]),
+                    None
+                )
+            ids = list(latest)
+            n = len(ids)
+            columns, present = stack_features([latest[audio_id] for audio_id in ids], manifest["embedding_dim"])
+            if self.projection is not None:
+                columns[VECTOR_COLUMN] = self.projection.transform(FeatureMatrices(
+                    ids=np.array(ids),
+                    columns=columns,
+                    present={column: present[:, i] for i, column in enumerate(FEATURE_COLUMNS)},
+                    generation=manifest["generation"]
+                ))
+                manifest["projection"] = self.projection.version
+                manifest["vector_dim"] = self.projection.dim
+
+            name = f"seg-{manifest['next_segment']:06d}"
+            manifest["next_segment"] += 1
+            self._write_segment(name, np.array(ids), columns, present)
+            manifest["segments"].append({"name": name, "rows": n, "tombstones": None})
+
+            # Rows replaced by the new segment
+            replaced = [self._index[audio_id] for audio_id in ids if audio_id in self._index]
+            stale = self._tombstone(manifest, replaced)
+
+            self._commit(manifest)
+            self._remove(stale)
+
+        logger.info(f"Appended {n} tracks to feature store {self.path}")
+        return n
+
+    def _check_projection(self) -> None:
+        """Refuse to mix vectors of different projections in one store"""
+        version = self.projection.version if self.projection is not None else None
+        if version != self.projection_version and (len(self) or self._segments):
+            raise ValueError(
+                f"Feature store vectors were made with projection {self.projection_version}, "
+                f"not {version}; call reproject() first"
+            )
+
+    def delete(self, audio_ids: Iterable[str]) -> int:
+        """
+        Mark tracks as deleted
+
+        Returns:
+            Number of tracks that were in the store
+        """
+        with self._lock:
+            rows = [self._index[audio_id] for audio_id in map(str, audio_ids) if audio_id in self._index]
+            if not rows:
+                return 0
+
+            manifest = json.loads(json.dumps(self._manifest))
+            stale = self._tombstone(manifest, rows)
+            self._commit(manifest)
+            self._remove(stale)
+            return len(rows)
+
+    def compact(self) -> None:
+        """Rewrite the live rows as a single segment without tombstones"""
+        with self._lock:
+            if len(self._segments) <= 1 and all(segment.deleted is None for segment in self._segments):
+                return
+
+            matrices = self._rewrite(self._gather(list(self._widths())), dict(self._manifest))
+
+        logger.info(f"Compacted feature store {self.path} to {len(matrices)} tracks")
+
+    def reproject(self, projection: "FeatureProjection") -> None:
+        """
+        Compute every track's vector with a new projection
+
+        Rewrites the store as a single segment, like compact(), and uses
+        the projection for tracks appended afterwards.
+        """
+        with self._lock:
+            matrices = self._gather(list(FEATURE_COLUMNS))
+            columns = dict(matrices.columns)
+            columns[VECTOR_COLUMN] = projection.transform(matrices)
+            matrices = FeatureMatrices(
+                ids=matrices.ids,
+                columns=columns,
+                present=matrices.present,
+                generation=matrices.generation
+            )
+
+            manifest = dict(self._manifest)
+            manifest["projection"] = projection.version
+            manifest["vector_dim"] = projection.dim
+            self._rewrite(matrices, manifest)
+            self.projection = projection
+
+        logger.info(f"Reprojected {len(matrices)} tracks in feature store {self.path} with {projection.version}")
+
+    def _rewrite(self, matrices: FeatureMatrices, manifest: Dict[str, Any]) -> FeatureMatrices:
+        """Replace every segment with one holding the matrices"""
+        manifest = json.loads(json.dumps(manifest))
+        name = f"seg-{manifest['next_segment']:06d}"
+        manifest["next_segment"] += 1
+
+        present = np.stack([matrices.present[column] for column in FEATURE_COLUMNS], axis=1)
+        self._write_segment(name, matrices.ids, matrices.columns, present)
+
+        manifest["segments"] = [{"name": name, "rows": len(matrices), "tombstones": None}]
+        self._commit(manifest)
+
+        # Everything else is from older generations or interrupted writes
+        self._remove([entry for entry in os.listdir(self.path) if entry not in (name, MANIFEST_FILE)])
+        return matrices
+
+    def matrices(self, columns: Optional[Sequence[str]] = None) -> FeatureMatrices:
+        """
+        Get every live track's features as matrices
+
+        Args:
+            columns: Columns to include (default: all)
+
+        Returns:
+            FeatureMatrices, read-only; memory-mapped without copying when
+            the store is compacted
+        """
+        with self._lock:
+            return self._gather(columns)
+
+    def _gather(self, columns: Optional[Sequence[str]] = None) -> FeatureMatrices:
+        widths = self._widths()
+        columns = list(columns or FEATURE_COLUMNS)
+        unknown = set(columns) - set(widths)
+        if unknown:
+            raise ValueError(f"Unknown feature columns: {', '.join(sorted(unknown))}")
+        positions = {column: list(FEATURE_COLUMNS).index(column) for column in columns if column in FEATURE_COLUMNS}
+
+        def segment_present(segment: _Segment, column: str) -> np.ndarray:
+            if column == VECTOR_COLUMN:
+                return np.ones(len(segment.ids), dtype=bool)
+            return segment.present[:, positions[column]]
+
+        if len(self._segments) == 1 and self._segments[0].deleted is None:
+            segment = self._segments[0]
+            return FeatureMatrices(
+                ids=segment.ids,
+                columns={column: segment.columns[column] for column in columns},
+                present={column: segment_present(segment, column) for column in columns},
+                generation=self.generation
+            )
+
+        lives = [segment.live for segment in self._segments]
+
+        def gather(arrays: List[np.ndarray], empty_shape: Tuple[int, ...], dtype) -> np.ndarray:
+            parts = []
+            for array, live in zip(arrays, lives):
+                if array.shape[1:] != empty_shape[1:]:
+                    # Written before the store's embedding width was known
+                    parts.append(np.zeros((int(live.sum()),) + empty_shape[1:], dtype=dtype))
+                else:
+                    parts.append(array[live])
+            result = np.concatenate(parts) if parts else np.zeros(empty_shape, dtype=dtype)
+            result.flags.writeable = False
+            return result
+
+        return FeatureMatrices(
+            ids=gather([segment.ids for segment in self._segments], (0,), str),
+            columns={
+                column: gather(
+                    [segment.columns[column] for segment in self._segments],
+                    (0, widths[column]) if column != "tempo" else (0,),
+                    np.float32
+                )
+                for column in columns
+            },
+            present={
+                column: gather([segment_present(segment, column) for segment in self._segments], (0,), bool)
+                for column in columns
+            },
+            generation=self.generation
+        )
+
+    def get(self, audio_id: str) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Get one track's features
+
+        Returns:
+            Dictionary of the columns the track has, or None if not stored
+        """
+        with self._lock:
+            location = self._index.get(str(audio_id))
+            if location is None:
+                return None
+
+            segment = self._segments[location[0]]
+            row = location[1]
+            features = {
+                column: np.array(segment.columns[column][row])
+                for position, column in enumerate(FEATURE_COLUMNS)
+                if segment.present[row, position]
+            }
+            if VECTOR_COLUMN in segment.columns:
+                features[VECTOR_COLUMN] = np.array(segment.columns[VECTOR_COLUMN][row])
+            return features
+
+    def _write_segment(self, name: str, ids: np.ndarray, columns: Dict[str, np.ndarray],
+                       present: np.ndarray) -> None:
+        """Write a segment to a temporary directory and move it into place"""
+        directory = os.path.join(self.path, name)
+        temporary = f"{directory}.tmp"
+        shutil.rmtree(temporary, ignore_errors=True)
+        os.makedirs(temporary)
+
+        np.save(os.path.join(temporary, "ids.npy"), ids)
+        np.save(os.path.join(temporary, "present.npy"), present)
+        for column, values in columns.items():
+            np.save(os.path.join(temporary, f"{column}.npy"), np.ascontiguousarray(values, dtype=np.float32))
+
+        os.replace(temporary, directory)
+
+    def _tombstone(self, manifest: Dict[str, Any], rows: Sequence[Tuple[int, int]]) -> List[str]:
+        """
+        Write new tombstone files for the segments holding rows
+
+        Returns:
+            Tombstone files replaced, to remove once the manifest is committed
+        """
+        by_segment: Dict[int, List[int]] = {}
+        for position, row in rows:
+            by_segment.setdefault(position, []).append(row)
+
+        stale = []
+        for position, segment_rows in by_segment.items():
+            segment = self._segments[position]
+            deleted = np.array(segment.deleted) if segment.deleted is not None else np.zeros(len(segment.ids), dtype=bool)
+            deleted[segment_rows] = True
+
+            name = f"{segment.name}.tombstones-{manifest['generation'] + 1}.npy"
+            np.save(os.path.join(self.path, name), deleted)
+            manifest["segments"][position]["tombstones"] = name
+            if segment.tombstones:
+                stale.append(segment.tombstones)
+
+        return stale
+
+    def _commit(self, manifest: Dict[str, Any]) -> None:
+        """Atomically replace the manifest and reopen the store from it"""
+        manifest["generation"] += 1
+        manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        temporary = f"{manifest_path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, manifest_path)
+
+        self._load(manifest)
+
+    def _remove(self, names: Sequence[str]) -> None:
+        """Delete files no longer referenced by the manifest"""
+        for name in names:
+            path = os.path.join(self.path, name)
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                # Files still mapped cannot be removed on some platforms;
+                # the next compaction retries
+                logger.warning(f"Could not remove {path}: {e}")
+
+def _read_json_lines(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def load_documents(store: FeatureStore, documents: Iterable[Dict[str, Any]], batch_size: int = 10000) -> int:
+    """
+    Append feature documents to the store in batches
+
+    Documents are keyed by audio_id or audioId; those without either are
+    skipped. Later documents for a track replace earlier ones, so the
+    backfill's JSON Lines output can be loaded as is.
+
+    Returns:
+        Number of rows written
+    """
+    records = (
+        {**document, "audio_id": str(document.get("audio_id", document.get("audioId")))}
+        for document in documents
+        if document.get("audio_id", document.get("audioId")) is not None
+    )
+    written = 0
+    while True:
+        batch = list(itertools.islice(records, batch_size))
+        if not batch:
+            return written
+        written += store.append(batch)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Load feature documents into the feature store")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("load", help="Append feature documents from a file or the catalog collection")
+    source = load.add_mutually_exclusive_group(required=True)
+    source.add_argument("--jsonl", help="JSON Lines file, e.g. the audio processor's backfill output")
+    source.add_argument("--mongo", action="store_true", help="The catalog's audio_features collection")
+    load.add_argument("--store", default=os.getenv("FEATURE_STORE_PATH"), help="Feature store directory")
+    load.add_argument("--projection", default=os.getenv("FEATURE_PROJECTION_PATH"),
+                      help="Projection of a store with vectors (.npz)")
+    load.add_argument("--batch-size", type=int, default=10000, help="Tracks per appended segment")
+    load.add_argument("--no-compact", action="store_true", help="Leave the appended segments uncompacted")
+    args = parser.parse_args(argv)
+
+    if not args.store:
+        parser.error("--store (or FEATURE_STORE_PATH) is required")
+
+    logging.basicConfig(level=logging.INFO)
+    projection = None
+    if args.projection and os.path.exists(args.projection):
+        from .feature_projection import FeatureProjection
+
+        projection = FeatureProjection.load(args.projection)
+    store = FeatureStore(args.store, projection=projection)
+
+    if args.mongo:
+        from .catalog_snapshot import create_catalog_feed
+
+        feed = create_catalog_feed()
+        if feed is None:
+            raise SystemExit("The catalog collection is not reachable")
+        documents = feed.load()
+    else:
+        documents = _read_json_lines(args.jsonl)
+
+    started = time.time()
+    written = load_documents(store, documents, args.batch_size)
+    if not args.no_compact:
+        store.compact()
+    logger.info(f"Loaded {written} rows in {time.time() - started:.1f}s; the store holds {len(store)} tracks")
+
+if __name__ == "__main__":
+    main()
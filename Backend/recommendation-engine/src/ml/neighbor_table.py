@@ -0,0 +1,451 @@
+import numpy as np
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Any, Optional, Tuple
+
+from .feature_store import FeatureStore, FeatureMatrices
+
+logger = logging.getLogger(__name__)
+
+# Audio feature weights of ContentBasedRecommender
+DEFAULT_WEIGHTS = {
+    'mfccs': 0.4,
+    'chroma': 0.2,
+    'tempo': 0.15,
+    'spectral_features': 0.15
+}
+
+SIMILARITY_COLUMNS = ["mfccs", "chroma", "tempo", "spectral"]
+
+MANIFEST_FILE = "manifest.json"
+FORMAT_VERSION = 1
+
+def _unit_rows(values: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """Rows scaled to unit length, zero where invalid or all zero"""
+    values = np.asarray(values, dtype=np.float32)
+    norms = np.linalg.norm(values, axis=1, keepdims=True)
+    valid = valid[:, None] & (norms > 0)
+    return np.divide(values, norms, out=np.zeros_like(values), where=valid)
+
+def prepare_features(matrices: FeatureMatrices) -> Dict[str, np.ndarray]:
+    """
+    Normalize feature columns once so that pairwise similarity is a sum of
+    matrix products
+
+    Missing features become zero rows (and zero tempo, as do non-positive
+    tempos), which score 0 like they do in
+    ContentBasedRecommender._calculate_similarity.
+    """
+    spectral = matrices.columns["spectral"]
+    tempo = np.asarray(matrices.columns["tempo"], dtype=np.float32)
+    return {
+        "mfccs": _unit_rows(matrices.columns["mfccs"], matrices.present["mfccs"]),
+        "chroma": _unit_rows(matrices.columns["chroma"], matrices.present["chroma"]),
+        "spectral": _unit_rows(spectral, matrices.present["spectral"] & np.all(spectral != 0, axis=1)),
+        "tempo": np.where(matrices.present["tempo"] & (tempo > 0), tempo, 0).astype(np.float32)
+    }
+
+def similarity_block(prepared: Dict[str, np.ndarray], rows: np.ndarray, columns: np.ndarray,
+                     weights: Dict[str, float]) -> np.ndarray:
+    """
+    Weighted similarity between two sets of tracks
+
+    Args:
+        prepared: Output of prepare_features
+        rows: Track indices of the block's rows
+        columns: Track indices of the block's columns
+        weights: Weight per feature, as in ContentBasedRecommender.feature_weights
+
+    Returns:
+        (len(rows), len(columns)) float32 similarity scores
+    """
+    # Scaling each feature by the square root of its weight turns the
+    # weighted sum of cosines into a single matrix product
+    weighted = [
+        np.float32(np.sqrt(weights[feature])) * prepared[column]
+        for feature, column in (("mfccs", "mfccs"), ("chroma", "chroma"), ("spectral_features", "spectral"))
+        if weights.get(feature, 0)
+    ]
+    if weighted:
+        values = np.concatenate(weighted, axis=1)
+        scores = values[rows] @ values[columns].T
+    else:
+        scores = np.zeros((len(rows), len(columns)), dtype=np.float32)
+
+    weight = weights.get("tempo", 0)
+    if weight:
+        # 1 - |a - b| / max(a, b) is min(a, b) / max(a, b), which is also 0
+        # when either tempo is missing (0); the denominator is kept above 0
+        # and the weight folded into the numerator
+        row_tempo = prepared["tempo"][rows]
+        column_tempo = prepared["tempo"][columns]
+        tiny = np.finfo(np.float32).tiny
+        largest = np.maximum(np.maximum(row_tempo, tiny)[:, None], np.maximum(column_tempo, tiny)[None, :])
+        tempo_similarity = np.minimum(np.float32(weight) * row_tempo[:, None],
+                                      np.float32(weight) * column_tempo[None, :])
+        tempo_similarity /= largest
+        scores += tempo_similarity
+
+    return scores
+
+def _merge_top_k(best: np.ndarray, best_scores: np.ndarray, candidates: np.ndarray,
+                 candidate_scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Keep the k highest scoring of the current and candidate neighbors per row (unordered)"""
+    merged = np.concatenate([best, candidates], axis=1)
+    merged_scores = np.concatenate([best_scores, candidate_scores], axis=1)
+    if merged.shape[1] <= k:
+        return merged, merged_scores
+    keep = np.argpartition(-merged_scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(merged, keep, axis=1), np.take_along_axis(merged_scores, keep, axis=1)
+
+def _finish_top_k(best: np.ndarray, best_scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Sort neighbors by descending score and pad rows to k with -1"""
+    best = np.where(np.isfinite(best_scores), best, -1)
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    best = np.take_along_axis(best, order, axis=1)
+    best_scores = np.take_along_axis(best_scores, order, axis=1)
+
+    padding = k - best.shape[1]
+    if padding > 0:
+        best = np.pad(best, ((0, 0), (0, padding)), constant_values=-1)
+        best_scores = np.pad(best_scores, ((0, 0), (0, padding)), constant_values=-np.inf)
+    return best[:, :k], best_scores[:, :k]
+
+def top_k_neighbors(prepared: Dict[str, np.ndarray], rows: np.ndarray, columns: np.ndarray, k: int,
+                    weights: Dict[str, float], block_size: int = 2048,
+                    best: Optional[np.ndarray] = None,
+                    best_scores: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find each row's k most similar columns, one block_size x block_size
+    tile of the similarity matrix at a time
+
+    A track is never its own neighbor. best and best_scores, if given, are
+    existing neighbors to merge with (-1 for none).
+
+    Returns:
+        Tuple of ((len(rows), k) int64 track indices, (len(rows), k) float32
+        scores), sorted by descending score and padded with -1 / -inf
+    """
+    neighbors = np.full((len(rows), k), -1, dtype=np.int64)
+    scores = np.full((len(rows), k), -np.inf, dtype=np.float32)
+
+    for start in range(0, len(rows), block_size):
+        block_rows = rows[start:start + block_size]
+        if best is None:
+            block_best = np.zeros((len(block_rows), 0), dtype=np.int64)
+            block_scores = np.zeros((len(block_rows), 0), dtype=np.float32)
+        else:
+            block_best = best[start:start + block_size]
+            block_scores = np.where(block_best >= 0, best_scores[start:start + block_size], -np.inf)
+
+        for column_start in range(0, len(columns), block_size):
+            block_columns = columns[column_start:column_start + block_size]
+            tile = similarity_block(prepared, block_rows, block_columns, weights)
+            tile[block_rows[:, None] == block_columns[None, :]] = -np.inf
+            block_best, block_scores = _merge_top_k(
+                block_best, block_scores,
+                np.broadcast_to(block_columns, tile.shape), tile, k
+            )
+
+        neighbors[start:start + block_size], scores[start:start + block_size] = \
+            _finish_top_k(block_best, block_scores, k)
+
+    return neighbors, scores
+
+def feature_signatures(prepared: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    One number per track that changes whenever its features change, used
+    to find tracks to recompute in an incremental update
+    """
+    values = np.concatenate([
+        prepared["mfccs"], prepared["chroma"], prepared["spectral"], prepared["tempo"][:, None]
+    ], axis=1).astype(np.float64)
+    projection = np.random.default_rng(0).standard_normal(values.shape[1])
+    return values @ projection
+
+class NeighborTable:
+    """
+    Precomputed top-k similar tracks for every track in the catalog
+
+    Neighbors are stored as int32 row numbers with float16 scores in NumPy
+    files that are memory-mapped for lookups. Each build writes a new table
+    directory and atomically replaces the manifest pointing to it, so
+    readers in other processes pick it up on refresh().
+
+    Tracks whose neighbor was deleted keep the rest of their list until
+    the next full rebuild.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Table directory, created if missing
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+        self._manifest: Optional[Dict[str, Any]] = None
+        self._rows: Dict[str, int] = {}
+        self.ids = np.zeros(0, dtype=str)
+        self._neighbors = np.zeros((0, 0), dtype=np.int32)
+        self._scores = np.zeros((0, 0), dtype=np.float16)
+        self._signatures = np.zeros(0, dtype=np.float64)
+
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get("format") != FORMAT_VERSION:
+                raise ValueError(f"Unsupported neighbor table format: {manifest.get('format')}")
+            self._load(manifest)
+
+    @property
+    def generation(self) -> int:
+        return self._manifest["generation"] if self._manifest else 0
+
+    @property
+    def k(self) -> int:
+        return self._neighbors.shape[1]
+
+    @property
+    def weights(self) -> Optional[Dict[str, float]]:
+        return self._manifest["weights"] if self._manifest else None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, audio_id: str) -> bool:
+        return audio_id in self._rows
+
+    def _load(self, manifest: Dict[str, Any]) -> None:
+        directory = os.path.join(self.path, manifest["table"])
+
+        def load(name: str) -> np.ndarray:
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+
+        ids = load("ids")
+        neighbors = load("neighbors")
+        scores = load("scores")
+        signatures = load("signatures")
+
+        self._rows = {str(audio_id): row for row, audio_id in enumerate(ids)}
+        self.ids, self._neighbors, self._scores, self._signatures = ids, neighbors, scores, signatures
+        self._manifest = manifest
+
+    def refresh(self) -> bool:
+        """
+        Reload the manifest if another process rebuilt the table
+
+        Returns:
+            Whether the table changed
+        """
+        manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        for attempt in range(3):
+            if not os.path.exists(manifest_path):
+                return False
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+
+            with self._lock:
+                if manifest["generation"] == self.generation:
+                    return False
+                try:
+                    self._load(manifest)
+                    return True
+                except FileNotFoundError:
+                    # Replaced by a newer build in the meantime
+                    if attempt == 2:
+                        raise
+        return False
+
+    def neighbors(self, audio_id: str, limit: int = 10) -> Optional[List[Dict[str, Any]]]:
+        """
+        Look up a track's most similar tracks
+
+        Args:
+            audio_id: Track to look up
+            limit: Maximum number of neighbors (at most k)
+
+        Returns:
+            List of similar tracks with similarity scores, or None if the
+            track is not in the table
+        """
+        row = self._rows.get(audio_id)
+        if row is None:
+            return None
+
+        neighbors = self._neighbors[row, :limit]
+        scores = self._scores[row, :limit]
+        return [
+            {'audio_id': str(self.ids[neighbor]), 'score': float(score)}
+            for neighbor, score in zip(neighbors, scores)
+            if neighbor >= 0
+        ]
+
+    def rebuild(self, matrices: FeatureMatrices, k: int = 50,
+                weights: Optional[Dict[str, float]] = None, block_size: int = 2048) -> None:
+        """
+        Compute the neighbors of every track from scratch
+
+        Args:
+            matrices: Catalog features, with at least SIMILARITY_COLUMNS
+            k: Neighbors kept per track
+            weights: Feature weights (default: DEFAULT_WEIGHTS)
+            block_size: Rows and columns per similarity tile; a tile takes
+                block_size^2 * 4 bytes
+        """
+        weights = weights or DEFAULT_WEIGHTS
+        prepared = prepare_features(matrices)
+        tracks = np.arange(len(matrices))
+        neighbors, scores = top_k_neighbors(prepared, tracks, tracks, k, weights, block_size)
+        self._write(matrices.ids, neighbors, scores, feature_signatures(prepared), weights)
+
+    def update(self, matrices: FeatureMatrices, block_size: int = 2048) -> int:
+        """
+        Bring the table up to date with the catalog, recomputing only what
+        new, changed and deleted tracks affect
+
+        New and changed tracks, and tracks that lost a neighbor to a change
+        or deletion, get a full neighbor list; every other track is compared
+        against the new and changed tracks alone and merges the results into
+        its list. Costs O(n * affected) instead of O(n^2).
+
+        Args:
+            matrices: Current catalog features
+            block_size: Rows and columns per similarity tile
+
+        Returns:
+            Number of tracks recomputed
+        """
+        if self._manifest is None:
+            self.rebuild(matrices, block_size=block_size)
+            return len(matrices)
+
+        weights = self.weights
+        k = self.k
+        prepared = prepare_features(matrices)
+        signatures = feature_signatures(prepared)
+
+        # Table row of each current track, and current index of each table row
+        old_rows = np.array([self._rows.get(str(audio_id), -1) for audio_id in matrices.ids], dtype=np.int64)
+        new_index = np.full(len(self.ids) + 1, -1, dtype=np.int64)  # Last entry maps -1 to -1
+        kept = old_rows >= 0
+        new_index[old_rows[kept]] = np.flatnonzero(kept)
+
+        dirty = ~kept
+        dirty[kept] = signatures[kept] != self._signatures[old_rows[kept]]
+        removed = len(self.ids) - int(kept.sum())
+        if not dirty.any() and not removed:
+            return 0
+
+        # Existing lists of unchanged tracks, renumbered, without neighbors
+        # that changed (their scores are stale) or were deleted
+        neighbors = np.full((len(matrices), k), -1, dtype=np.int64)
+        scores = np.full((len(matrices), k), -np.inf, dtype=np.float32)
+        recompute = dirty.copy()
+        clean_tracks = np.flatnonzero(~dirty)
+        if len(clean_tracks):
+            stored = np.asarray(self._neighbors[old_rows[clean_tracks]], dtype=np.int64)
+            previous = new_index[stored]
+            previous = np.where(dirty[np.maximum(previous, 0)], -1, previous)
+            neighbors[clean_tracks] = previous
+            scores[clean_tracks] = np.where(
+                previous >= 0, np.asarray(self._scores[old_rows[clean_tracks]], dtype=np.float32), -np.inf
+            )
+
+            # A list that lost a neighbor no longer holds the true top k, and
+            # the track that should take its place may be any other track
+            recompute[clean_tracks] = ((stored >= 0) & (previous < 0)).any(axis=1)
+
+        dirty_tracks = np.flatnonzero(dirty)
+        merged_tracks = np.flatnonzero(~recompute)
+        recompute_tracks = np.flatnonzero(recompute)
+        if len(merged_tracks) and len(dirty_tracks):
+            neighbors[merged_tracks], scores[merged_tracks] = top_k_neighbors(
+                prepared, merged_tracks, dirty_tracks, k, weights, block_size,
+                neighbors[merged_tracks], scores[merged_tracks]
+            )
+
+        if len(recompute_tracks):
+            neighbors[recompute_tracks], scores[recompute_tracks] = top_k_neighbors(
+                prepared, recompute_tracks, np.arange(len(matrices)), k, weights, block_size
+            )
+
+        self._write(matrices.ids, neighbors, scores, signatures, weights)
+        return len(recompute_tracks)
+
+    def _write(self, ids: np.ndarray, neighbors: np.ndarray, scores: np.ndarray,
+               signatures: np.ndarray, weights: Dict[str, float]) -> None:
+        """Write a new table directory and switch the manifest to it"""
+        generation = self.generation + 1
+        name = f"table-{generation:06d}"
+        directory = os.path.join(self.path, name)
+        os.makedirs(directory, exist_ok=True)
+
+        np.save(os.path.join(directory, "ids.npy"), np.asarray(ids, dtype=str))
+        np.save(os.path.join(directory, "neighbors.npy"), neighbors.astype(np.int32))
+        np.save(os.path.join(directory, "scores.npy"), np.where(neighbors >= 0, scores, 0).astype(np.float16))
+        np.save(os.path.join(directory, "signatures.npy"), signatures.astype(np.float64))
+
+        manifest = {
+            "format": FORMAT_VERSION,
+            "generation": generation,
+            "table": name,
+            "k": int(neighbors.shape[1]),
+            "weights": dict(weights),
+            "count": int(len(ids)),
+            "built_at": time.time()
+        }
+        manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        temporary = f"{manifest_path}.tmp"
+        with open(temporary, "w") as f:
+            json.dump(manifest, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, manifest_path)
+
+        previous = self._manifest["table"] if self._manifest else None
+        with self._lock:
+            self._load(manifest)
+
+        if previous and previous != name:
+            try:
+                shutil.rmtree(os.path.join(self.path, previous))
+            except OSError as e:
+                # Still mapped on some platforms; harmless to leave behind
+                logger.warning(f"Could not remove old neighbor table {previous}: {e}")
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build or update the track neighbor table from the feature store")
+    parser.add_argument("--store", default=os.getenv("FEATURE_STORE_PATH"), help="Feature store directory")
+    parser.add_argument("--table", default=os.getenv("NEIGHBOR_TABLE_PATH"), help="Neighbor table directory")
+    parser.add_argument("-k", type=int, default=50, help="Neighbors per track")
+    parser.add_argument("--block-size", type=int, default=2048, help="Rows and columns per similarity tile")
+    parser.add_argument("--full", action="store_true", help="Rebuild from scratch instead of updating")
+    args = parser.parse_args(argv)
+
+    if not args.store or not args.table:
+        parser.error("--store and --table (or FEATURE_STORE_PATH and NEIGHBOR_TABLE_PATH) are required")
+
+    logging.basicConfig(level=logging.INFO)
+    matrices = FeatureStore(args.store).matrices(SIMILARITY_COLUMNS)
+    table = NeighborTable(args.table)
+
+    started = time.time()
+    if args.full or not len(table) or table.k != args.k:
+        table.rebuild(matrices, k=args.k, block_size=args.block_size)
+        recomputed = len(matrices)
+    else:
+        recomputed = table.update(matrices, block_size=args.block_size)
+
+    elapsed = time.time() - started
+    logger.info(f"Neighbor table {table.generation}: {len(table)} tracks, {recomputed} recomputed in {elapsed:.1f}s")
+
+if __name__ == "__main__":
+    main()
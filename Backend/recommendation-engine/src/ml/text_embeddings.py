@@ -0,0 +1,226 @@
+import numpy as np
+import asyncio
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence, Union
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEXT_MODEL = "all-MiniLM-L6-v2"
+
+def normalize_text(text: str) -> str:
+    """Cache key and model input for a text: NFKC, case-folded, single-spaced"""
+    return ' '.join(unicodedata.normalize("NFKC", text).casefold().split())
+
+class TextEmbeddingService:
+    """
+    Shared SentenceTransformer encoder
+
+    Concurrent encode() calls are queued and a worker thread encodes them
+    together, up to batch_size texts or max_wait seconds after the first,
+    in one model call. Embeddings are cached by normalized text in an
+    in-memory LRU and, optionally, an SQLite file shared across restarts.
+
+    version names the model, backend and dimension; cached and stored
+    embeddings are only valid for the version that produced them.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_TEXT_MODEL, backend: str = "torch",
+                 onnx_file: Optional[str] = None, cache_size: int = 10000,
+                 cache_path: Optional[str] = None, batch_size: int = 64, max_wait: float = 0.005):
+        """
+        Args:
+            model_name: SentenceTransformer model
+            backend: "torch", or "onnx" for ONNX Runtime on CPU
+            onnx_file: ONNX file within the model repository, e.g. a
+                quantized "onnx/model_qint8_avx512_vnni.onnx"
+            cache_size: Embeddings kept in memory
+            cache_path: SQLite file caching embeddings on disk (None for none)
+            batch_size: Most texts encoded in one model call
+            max_wait: Seconds to wait for more texts before encoding a batch
+        """
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.cache_size = cache_size
+
+        self.model, self.backend = self._load_model(model_name, backend, onnx_file)
+        self.dim = int(self.model.get_sentence_embedding_dimension())
+        variant = f"{self.backend}:{os.path.basename(onnx_file)}" if onnx_file and self.backend == "onnx" else self.backend
+        self.version = f"{model_name}/{variant}/{self.dim}"
+
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._disk: Optional[sqlite3.Connection] = None
+        if cache_path:
+            self._disk = sqlite3.connect(cache_path, check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS text_embeddings ("
+                "version TEXT, key TEXT, vector BLOB, PRIMARY KEY (version, key))"
+            )
+            self._disk.commit()
+
+        self._requests: "queue.Queue" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="text-embeddings", daemon=True)
+        self._worker.start()
+
+        logger.info(f"Text embedding model {self.version} loaded")
+
+    @staticmethod
+    def _load_model(model_name: str, backend: str, onnx_file: Optional[str]):
+        from sentence_transformers import SentenceTransformer
+
+        if backend != "torch":
+            try:
+                model_kwargs = {"file_name": onnx_file} if onnx_file else None
+                return SentenceTransformer(model_name, backend=backend, model_kwargs=model_kwargs), backend
+            except Exception as e:
+                logger.warning(f"Could not load {model_name} with the {backend} backend, using torch: {e}")
+        return SentenceTransformer(model_name), "torch"
+
+    def validate(self, vectors: np.ndarray, version: Optional[str] = None) -> None:
+        """
+        Check that stored embeddings can be compared with this service's
+
+        Raises:
+            ValueError: If the version or dimension differs
+        """
+        if version is not None and version != self.version:
+            raise ValueError(f"Embeddings are from {version}, not {self.version}")
+        if np.shape(vectors)[-1] != self.dim:
+            raise ValueError(f"Embeddings have dimension {np.shape(vectors)[-1]}, not {self.dim}")
+
+    def _lookup(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Cached embeddings of the keys, from memory or disk"""
+        found = {}
+        with self._cache_lock:
+            for key in keys:
+                vector = self._cache.get(key)
+                if vector is not None:
+                    self._cache.move_to_end(key)
+                    found[key] = vector
+
+            missing = [key for key in keys if key not in found]
+            if self._disk is not None and missing:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = self._disk.execute(
+                        f"SELECT key, vector FROM text_embeddings WHERE version = ? "
+                        f"AND key IN ({', '.join('?' * len(chunk))})",
+                        [self.version, *chunk]
+                    ).fetchall()
+                    for key, blob in rows:
+                        found[key] = np.frombuffer(blob, dtype=np.float32)
+                        self._remember(key, found[key])
+        return found
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._cache[key] = vector
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _store(self, embeddings: Dict[str, np.ndarray]) -> None:
+        with self._cache_lock:
+            for key, vector in embeddings.items():
+                self._remember(key, vector)
+            if self._disk is not None:
+                self._disk.executemany(
+                    "INSERT OR REPLACE INTO text_embeddings (version, key, vector) VALUES (?, ?, ?)",
+                    [(self.version, key, vector.tobytes()) for key, vector in embeddings.items()]
+                )
+                self._disk.commit()
+
+    def _request(self, keys: List[str]) -> Future:
+        """Queue keys for the next batch; the future resolves to their embeddings"""
+        future: Future = Future()
+        self._requests.put((keys, future))
+        return future
+
+    def _prepare(self, texts: Union[str, Sequence[str]]):
+        single = isinstance(texts, str)
+        keys = [normalize_text(text) for text in ([texts] if single else texts)]
+        found = self._lookup(list(dict.fromkeys(keys)))
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        return single, keys, found, missing
+
+    def _result(self, single: bool, keys: List[str], found: Dict[str, np.ndarray]) -> np.ndarray:
+        if not keys:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        vectors = np.stack([found[key] for key in keys])
+        return vectors[0] if single else vectors
+
+    def encode(self, texts: Union[str, Sequence[str]]) -> np.ndarray:
+        """
+        Embed one text or a list of texts
+
+        Returns:
+            (dim,) float32 embedding for a string, (n, dim) for a list
+        """
+        single, keys, found, missing = self._prepare(texts)
+        if missing:
+            found.update(self._request(missing).result())
+        return self._result(single, keys, found)
+
+    async def aencode(self, texts: Union[str, Sequence[str]]) -> np.ndarray:
+        """encode() without blocking the event loop"""
+        single, keys, found, missing = self._prepare(texts)
+        if missing:
+            found.update(await asyncio.wrap_future(self._request(missing)))
+        return self._result(single, keys, found)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._requests.get()]
+            count = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while count < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                count += len(batch[-1][0])
+
+            keys = list(dict.fromkeys(key for request_keys, _ in batch for key in request_keys))
+            try:
+                vectors = self.model.encode(keys, batch_size=self.batch_size, convert_to_numpy=True)
+                embeddings = {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(keys, vectors)}
+                self._store(embeddings)
+            except Exception as e:
+                logger.error(f"Error encoding {len(keys)} texts: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for request_keys, future in batch:
+                future.set_result({key: embeddings[key] for key in request_keys})
+
+_service: Optional[TextEmbeddingService] = None
+_service_lock = threading.Lock()
+
+def get_text_embedding_service() -> TextEmbeddingService:
+    """
+    The process-wide text embedding service, created on first use from
+    TEXT_MODEL, TEXT_MODEL_BACKEND, TEXT_MODEL_ONNX_FILE and
+    TEXT_EMBEDDING_CACHE
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = TextEmbeddingService(
+                model_name=os.getenv("TEXT_MODEL", DEFAULT_TEXT_MODEL),
+                backend=os.getenv("TEXT_MODEL_BACKEND", "torch"),
+                onnx_file=os.getenv("TEXT_MODEL_ONNX_FILE"),
+                cache_path=os.getenv("TEXT_EMBEDDING_CACHE")
+            )
+        return _service
@@ -0,0 +1,361 @@
+import numpy as np
+import json
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Callable, Deque, Iterable
+
+logger = logging.getLogger(__name__)
+
+# How much each analytics event pulls a user's taste toward the track
+EVENT_WEIGHTS = {
+    "track_play": 0.5,
+    "track_complete": 1.0,
+    "track_like": 2.0,
+    "track_download": 1.5,
+    "track_share": 1.5,
+    "recommendation_click": 0.5,
+    "track_skip": -0.5
+}
+
+# Tracks remembered per user, to leave out of their recommendations
+RECENT_TRACKS = 50
+
+def _event_time(event: Dict[str, Any]) -> float:
+    timestamp = event.get("timestamp")
+    if isinstance(timestamp, (int, float)):
+        return float(timestamp)
+    if isinstance(timestamp, str):
+        try:
+            return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    return time.time()
+
+class TasteProfiles:
+    """
+    Exponentially decayed taste vector per user
+
+    Each event adds the track's vector, scaled by the event's weight, to
+    the user's vector after decaying it for the time since their last
+    event, so an update costs O(dim) and needs no history. An event older
+    than the user's last one is instead added with its weight decayed for
+    the difference. A second vector sums the positive events alone, so a
+    taste pointing away from everything the user played is not served.
+    Vectors live in float32 matrices that grow by doubling.
+    """
+
+    def __init__(self, dim: int, half_life: float = 14 * 24 * 3600, space: Optional[str] = None):
+        """
+        Args:
+            dim: Width of the track vectors
+            half_life: Seconds after which an event counts half as much
+            space: Names the vector space of the track vectors, e.g. the
+                index column and projection; stored with snapshots
+        """
+        self.dim = dim
+        self.half_life = half_life
+        self.space = space
+        self._decay = math.log(2) / half_life
+        self._lock = threading.Lock()
+
+        self._rows: Dict[str, int] = {}
+        self._vectors = np.zeros((1024, dim), dtype=np.float32)
+        self._positive = np.zeros((1024, dim), dtype=np.float32)
+        self._updated = np.zeros(1024, dtype=np.float64)
+        self._recent: Dict[str, Deque[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self._rows
+
+    def _row(self, user_id: str, timestamp: float) -> int:
+        """A user's row, added with a zero vector if new"""
+        row = self._rows.get(user_id)
+        if row is None:
+            row = len(self._rows)
+            if row == len(self._vectors):
+                self._vectors = np.concatenate([self._vectors, np.zeros_like(self._vectors)])
+                self._positive = np.concatenate([self._positive, np.zeros_like(self._positive)])
+                self._updated = np.concatenate([self._updated, np.zeros_like(self._updated)])
+            self._rows[user_id] = row
+            self._updated[row] = timestamp
+            self._recent[user_id] = deque(maxlen=RECENT_TRACKS)
+        return row
+
+    def update(self, user_id: str, audio_id: str, vector: np.ndarray, weight: float,
+               timestamp: Optional[float] = None) -> None:
+        """
+        Fold one event into a user's taste
+
+        Args:
+            user_id: User the event belongs to
+            audio_id: Track of the event
+            vector: The track's vector
+            weight: Event weight, negative for skips
+            timestamp: Event time in seconds (default: now)
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            row = self._row(user_id, timestamp)
+            elapsed = timestamp - self._updated[row]
+            if elapsed >= 0:
+                decay = math.exp(-self._decay * elapsed)
+                self._vectors[row] *= decay
+                self._positive[row] *= decay
+                self._updated[row] = timestamp
+            else:
+                # A late event: the profile stays at its own time and the
+                # event counts as much as it would have then
+                weight *= math.exp(self._decay * elapsed)
+            self._vectors[row] += weight * vector
+            if weight > 0:
+                self._positive[row] += weight * vector
+            self._recent[user_id].append(audio_id)
+
+    def vector(self, user_id: str) -> Optional[np.ndarray]:
+        """A user's unit-length taste vector, or None without positive history"""
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is None:
+                return None
+            vector = self._vectors[row].copy()
+            positive = self._positive[row].copy()
+        norm = np.linalg.norm(vector)
+        if norm == 0 or float(vector @ positive) <= 0:
+            return None
+        return vector / norm
+
+    def recent(self, user_id: str) -> List[str]:
+        """Tracks of the user's latest events"""
+        with self._lock:
+            return list(self._recent.get(user_id, ()))
+
+    def save(self, path: str) -> None:
+        """Write a snapshot that load() restores, replacing the file atomically"""
+        with self._lock:
+            count = len(self._rows)
+            users = np.array(list(self._rows), dtype=str)
+            vectors = self._vectors[:count].copy()
+            positive = self._positive[:count].copy()
+            updated = self._updated[:count].copy()
+            recent = json.dumps({user_id: list(tracks) for user_id, tracks in self._recent.items()})
+
+        temporary = f"{path}.tmp.npz"
+        np.savez(
+            temporary,
+            users=users,
+            vectors=vectors,
+            positive=positive,
+            updated=updated,
+            recent=np.array(recent),
+            metadata=np.array(json.dumps({"dim": self.dim, "half_life": self.half_life, "space": self.space}))
+        )
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str) -> "TasteProfiles":
+        with np.load(path) as data:
+            metadata = json.loads(str(data["metadata"]))
+            profiles = cls(metadata["dim"], metadata["half_life"], metadata.get("space"))
+            users = data["users"]
+            capacity = max(1024, 1 << max(len(users) - 1, 0).bit_length())
+            profiles._vectors = np.zeros((capacity, profiles.dim), dtype=np.float32)
+            profiles._positive = np.zeros((capacity, profiles.dim), dtype=np.float32)
+            profiles._updated = np.zeros(capacity, dtype=np.float64)
+            profiles._vectors[:len(users)] = data["vectors"]
+            profiles._positive[:len(users)] = data["positive"]
+            profiles._updated[:len(users)] = data["updated"]
+            profiles._rows = {str(user_id): row for row, user_id in enumerate(users)}
+            recent = json.loads(str(data["recent"]))
+
+        profiles._recent = {
+            user_id: deque(recent.get(user_id, ()), maxlen=RECENT_TRACKS) for user_id in profiles._rows
+        }
+        return profiles
+
+class EventSource(ABC):
+    """Stream of analytics events ({userId, eventType, entityId, timestamp})"""
+
+    @abstractmethod
+    def poll(self, timeout: float) -> List[Dict[str, Any]]:
+        """Wait up to timeout seconds for events"""
+
+    def commit(self) -> None:
+        """Mark the events polled so far as processed"""
+
+    def close(self) -> None:
+        pass
+
+class KafkaEventSource(EventSource):
+    """
+    Consumes the analytics service's Kafka topic
+
+    Offsets are committed only after a profile snapshot is saved, so a
+    restart replays the events since the last snapshot.
+    """
+
+    def __init__(self, topic: str = "analytics-events", brokers: Optional[str] = None,
+                 group_id: str = "recommendation-profiles", max_records: int = 1000):
+        from kafka import KafkaConsumer
+
+        self.max_records = max_records
+        self.consumer = KafkaConsumer(
+            topic,
+            bootstrap_servers=(brokers or os.getenv("KAFKA_BROKERS", "kafka:9092")).split(","),
+            group_id=group_id,
+            enable_auto_commit=False,
+            auto_offset_reset="latest",
+            value_deserializer=lambda value: json.loads(value.decode("utf-8"))
+        )
+
+    def poll(self, timeout: float) -> List[Dict[str, Any]]:
+        batches = self.consumer.poll(timeout_ms=int(timeout * 1000), max_records=self.max_records)
+        return [record.value for records in batches.values() for record in records]
+
+    def commit(self) -> None:
+        self.consumer.commit()
+
+    def close(self) -> None:
+        self.consumer.close()
+
+class LocalEventQueue(EventSource):
+    """In-process stand-in for the Kafka topic, for development and tests"""
+
+    def __init__(self, max_records: int = 1000):
+        self.max_records = max_records
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        self._queue.put(event)
+
+    def poll(self, timeout: float) -> List[Dict[str, Any]]:
+        try:
+            events = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(events) < self.max_records:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+class UserProfileService:
+    """
+    Keeps taste profiles current from an event stream and snapshots them
+
+    Events are applied by a background thread; track vectors come from
+    item_vector, usually VectorIndex.vector, so profiles live in the same
+    space as the index that serves recommend_for_user.
+    """
+
+    def __init__(self, source: EventSource, item_vector: Callable[[str], Optional[np.ndarray]],
+                 dim: int, snapshot_path: Optional[str] = None, snapshot_interval: float = 60.0,
+                 half_life: float = 14 * 24 * 3600, space: Optional[str] = None):
+        """
+        Args:
+            source: Analytics events to consume
+            item_vector: Looks up a track's vector by audio_id
+            dim: Width of the track vectors
+            snapshot_path: File to restore profiles from and snapshot them to
+            snapshot_interval: Seconds between snapshots
+            half_life: Seconds after which an event counts half as much
+            space: Names the vector space of item_vector; a snapshot made
+                in another space (e.g. before the index was rebuilt with a
+                new projection) is discarded
+        """
+        self.source = source
+        self.item_vector = item_vector
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+
+        self.profiles = None
+        if snapshot_path and os.path.exists(snapshot_path):
+            try:
+                self.profiles = TasteProfiles.load(snapshot_path)
+                logger.info(f"Restored {len(self.profiles)} user profiles from {snapshot_path}")
+            except Exception as e:
+                logger.error(f"Error restoring user profiles from {snapshot_path}: {e}")
+        if self.profiles is not None and (self.profiles.dim != dim or self.profiles.space != space):
+            logger.warning(
+                f"Discarding user profiles made in {self.profiles.space} ({self.profiles.dim} dims), "
+                f"not {space} ({dim} dims)"
+            )
+            self.profiles = None
+        if self.profiles is None:
+            self.profiles = TasteProfiles(dim, half_life, space)
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def apply(self, events: Iterable[Dict[str, Any]]) -> int:
+        """
+        Fold events into the profiles
+
+        Returns:
+            Number of events applied
+        """
+        applied = 0
+        for event in events:
+            weight = EVENT_WEIGHTS.get(event.get("eventType"))
+            user_id, audio_id = event.get("userId"), event.get("entityId")
+            if weight is None or not user_id or not audio_id:
+                continue
+            vector = self.item_vector(str(audio_id))
+            if vector is None:
+                continue
+            self.profiles.update(str(user_id), str(audio_id), vector, weight, _event_time(event))
+            applied += 1
+        return applied
+
+    def snapshot(self) -> None:
+        """Save the profiles, then acknowledge the events they include"""
+        if self.snapshot_path:
+            self.profiles.save(self.snapshot_path)
+        self.source.commit()
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="user-profiles", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.snapshot()
+        self.source.close()
+
+    def _run(self) -> None:
+        last_snapshot = time.time()
+        while not self._stop.is_set():
+            try:
+                self.apply(self.source.poll(1.0))
+                if time.time() - last_snapshot >= self.snapshot_interval:
+                    self.snapshot()
+                    last_snapshot = time.time()
+            except Exception as e:
+                logger.error(f"Error updating user profiles: {e}")
+                self._stop.wait(1.0)
+
+def create_event_source() -> EventSource:
+    """
+    Create the event source configured by PROFILE_EVENT_SOURCE: kafka
+    (the analytics-events topic at KAFKA_BROKERS) or local
+    """
+    if os.getenv("PROFILE_EVENT_SOURCE", "kafka") == "kafka":
+        try:
+            return KafkaEventSource(os.getenv("PROFILE_EVENT_TOPIC", "analytics-events"))
+        except Exception as e:
+            logger.warning(f"Kafka unavailable, using a local event queue: {e}")
+    return LocalEventQueue()
@@ -0,0 +1,551 @@
+import numpy as np
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Dict, List, Any, Optional, Collection, Tuple, Union
+
+from .feature_store import FeatureStore, VECTOR_COLUMN
+from .attribute_index import AttributeIndex
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+FORMAT_VERSION = 1
+
+def _kmeans(data: np.ndarray, clusters: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """Lloyd's k-means, returning (clusters, dim) float32 centroids"""
+    centroids = data[rng.choice(len(data), clusters, replace=len(data) < clusters)].copy()
+    data_norms = (data ** 2).sum(axis=1)
+    for _ in range(iterations):
+        distances = data_norms[:, None] - 2 * data @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]
+        assignment = distances.argmin(axis=1)
+        counts = np.bincount(assignment, minlength=clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, data)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Restart empty clusters from random points
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty))]
+    return centroids.astype(np.float32)
+
+class ScalarQuantizer:
+    """
+    Stores each dimension as an int8 in the range seen during fitting;
+    4x smaller than float32
+    """
+    name = "int8"
+
+    def __init__(self, low: Optional[np.ndarray] = None, step: Optional[np.ndarray] = None):
+        self.low = low
+        self.step = step
+
+    def fit(self, vectors: np.ndarray, max_samples: int = 100000, seed: int = 0) -> "ScalarQuantizer":
+        rng = np.random.default_rng(seed)
+        sample = vectors[np.sort(rng.choice(len(vectors), min(max_samples, len(vectors)), replace=False))]
+        low = sample.min(axis=0).astype(np.float32)
+        high = sample.max(axis=0).astype(np.float32)
+        self.low = low
+        self.step = np.maximum(high - low, 1e-12).astype(np.float32) / 255
+        return self
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        levels = np.rint((np.asarray(vectors, dtype=np.float32) - self.low) / self.step)
+        return (np.clip(levels, 0, 255) - 128).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return (codes.astype(np.float32) + 128) * self.step + self.low
+
+    def prepare(self, query: np.ndarray) -> Tuple[np.ndarray, float]:
+        """Fold the dequantization into the query"""
+        return self.step * query, float((128 * self.step + self.low) @ query)
+
+    def scores(self, prepared: Tuple[np.ndarray, float], codes: np.ndarray) -> np.ndarray:
+        """Inner products of the query with encoded vectors"""
+        weights, offset = prepared
+        return codes.astype(np.float32) @ weights + offset
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {"low": self.low, "step": self.step}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], params: Dict[str, Any]) -> "ScalarQuantizer":
+        return cls(arrays["low"], arrays["step"])
+
+class ProductQuantizer:
+    """
+    Splits vectors into subspaces and stores the nearest of 256 k-means
+    centroids in each, one byte per subspace
+
+    Queries are compared without decoding (asymmetric distance): the
+    query's inner product with every centroid is computed once, and a
+    vector's score is the sum of its codes' entries in that table.
+    """
+    name = "pq"
+
+    def __init__(self, subspaces: int = 16, centroids: Optional[np.ndarray] = None):
+        """
+        Args:
+            subspaces: Bytes per vector; the dimension is zero-padded to a
+                multiple of it
+            centroids: (subspaces, 256, subspace dim) fitted centroids
+        """
+        self.subspaces = subspaces
+        self.centroids = centroids
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """(n, dim) -> (n, subspaces, subspace dim), zero-padding the dimension"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        padding = -vectors.shape[-1] % self.subspaces
+        if padding:
+            vectors = np.pad(vectors, [(0, 0)] * (vectors.ndim - 1) + [(0, padding)])
+        return vectors.reshape(vectors.shape[:-1] + (self.subspaces, -1))
+
+    def fit(self, vectors: np.ndarray, max_samples: int = 65536, iterations: int = 20,
+            seed: int = 0) -> "ProductQuantizer":
+        rng = np.random.default_rng(seed)
+        sample = self._split(vectors[np.sort(rng.choice(len(vectors), min(max_samples, len(vectors)), replace=False))])
+        self.centroids = np.stack([
+            _kmeans(sample[:, subspace], 256, iterations, rng) for subspace in range(self.subspaces)
+        ])
+        return self
+
+    def encode(self, vectors: np.ndarray, block_size: int = 65536) -> np.ndarray:
+        codes = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        centroid_norms = (self.centroids ** 2).sum(axis=2)
+        for start in range(0, len(vectors), block_size):
+            block = self._split(vectors[start:start + block_size])
+            for subspace in range(self.subspaces):
+                distances = centroid_norms[subspace][None, :] - 2 * block[:, subspace] @ self.centroids[subspace].T
+                codes[start:start + block_size, subspace] = distances.argmin(axis=1)
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = [self.centroids[subspace][codes[:, subspace]] for subspace in range(self.subspaces)]
+        return np.concatenate(parts, axis=1)
+
+    def prepare(self, query: np.ndarray) -> np.ndarray:
+        """
+        Inner products of the query with every centroid, as a (subspaces,
+        256) table, or with an even number of subspaces, a (subspaces / 2,
+        65536) table over pairs of them so scoring needs half the lookups
+        """
+        table = np.einsum("skd,sd->sk", self.centroids, self._split(query[None, :])[0])
+        if self.subspaces % 2:
+            return table
+        # Codes of a pair read as a little-endian uint16 are first + 256 * second
+        return (table[1::2, :, None] + table[0::2, None, :]).reshape(self.subspaces // 2, -1)
+
+    def scores(self, table: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        if table.shape[1] != 256:
+            codes = np.ascontiguousarray(codes).view("<u2")
+        scores = table[0][codes[:, 0]]
+        for position in range(1, len(table)):
+            scores += table[position][codes[:, position]]
+        return scores
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return {"centroids": self.centroids}
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], params: Dict[str, Any]) -> "ProductQuantizer":
+        return cls(params["subspaces"], arrays["centroids"])
+
+QUANTIZERS = {
+    ScalarQuantizer.name: ScalarQuantizer,
+    ProductQuantizer.name: ProductQuantizer
+}
+
+class VectorIndex:
+    """
+    Compressed track vectors searchable by inner product
+
+    Candidates are scored against the quantized codes, which are all that
+    needs to stay in memory, and the best of them are re-ranked with the
+    exact float32 vectors, which stay memory-mapped on disk and are read
+    only for those candidates.
+
+    With an AttributeIndex, searches can be filtered by genre, mood,
+    duration and tempo; only the matching tracks are scored.
+    """
+
+    def __init__(self, ids: np.ndarray, codes: np.ndarray, quantizer,
+                 vectors: Optional[np.ndarray] = None, metadata: Optional[Dict[str, Any]] = None,
+                 attributes: Optional[AttributeIndex] = None):
+        """
+        Args:
+            ids: (n,) audio_ids
+            codes: (n, code size) quantized vectors
+            quantizer: Fitted ScalarQuantizer or ProductQuantizer
+            vectors: (n, dim) exact vectors for re-ranking (None to skip)
+            metadata: Describes how the index was built
+            attributes: Row-aligned track attributes for filtering
+        """
+        if attributes is not None and len(attributes) != len(ids):
+            raise ValueError(f"Attributes of {len(attributes)} tracks do not match an index of {len(ids)}")
+        self.ids = ids
+        self.attributes = attributes
+        self.codes = codes
+        self.quantizer = quantizer
+        self.vectors = vectors
+        self.metadata = metadata or {}
+        self._rows = {str(audio_id): row for row, audio_id in enumerate(ids)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, audio_id: str) -> bool:
+        return audio_id in self._rows
+
+    @property
+    def memory_bytes(self) -> int:
+        """Size of the codes and quantizer parameters, what searching keeps in memory"""
+        return self.codes.nbytes + sum(array.nbytes for array in self.quantizer.to_arrays().values())
+
+    @classmethod
+    def build(cls, ids: np.ndarray, vectors: np.ndarray, quantizer: str = "pq",
+              keep_vectors: bool = True, **params) -> "VectorIndex":
+        """
+        Fit a quantizer to the vectors and encode them
+
+        Args:
+            ids: (n,) audio_ids
+            vectors: (n, dim) float32 vectors
+            quantizer: "pq" or "int8"
+            keep_vectors: Whether to keep exact vectors for re-ranking
+            **params: Quantizer arguments (subspaces for pq)
+
+        Returns:
+            The index
+        """
+        if quantizer not in QUANTIZERS:
+            raise ValueError(f"Unknown quantizer: {quantizer}")
+
+        started = time.time()
+        fitted = QUANTIZERS[quantizer](**params).fit(vectors)
+        codes = fitted.encode(vectors)
+        logger.info(f"Built {quantizer} index of {len(ids)} vectors in {time.time() - started:.1f}s")
+
+        metadata = {"quantizer": quantizer, "params": params, "dim": int(vectors.shape[1])}
+        return cls(np.asarray(ids), codes, fitted, np.asarray(vectors, dtype=np.float32) if keep_vectors else None,
+                   metadata)
+
+    def vector(self, audio_id: str) -> Optional[np.ndarray]:
+        """A track's exact vector, or its decoded approximation"""
+        row = self._rows.get(audio_id)
+        if row is None:
+            return None
+        if self.vectors is not None:
+            return np.array(self.vectors[row])
+        return self.quantizer.decode(self.codes[row:row + 1])[0]
+
+    def vectors_of(self, audio_ids: Collection[str]) -> Optional[np.ndarray]:
+        """(n, dim) vectors of tracks, as for vector(), or None if any is not indexed"""
+        rows = [self._rows.get(audio_id) for audio_id in audio_ids]
+        if None in rows:
+            return None
+        rows = np.array(rows, dtype=np.int64)
+        if self.vectors is not None:
+            return np.asarray(self.vectors[rows], dtype=np.float32)
+        return self.quantizer.decode(self.codes[rows])
+
+    def search_rows(self, query: np.ndarray, k: int = 10, rerank: int = 100,
+                    block_size: int = 65536, rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the rows with the highest inner product with the query
+
+        Args:
+            query: (dim,) float32 query vector
+            k: Rows to return
+            rerank: Candidates re-scored with exact vectors (0 to return
+                approximate scores)
+            block_size: Rows scored at a time
+            rows: Sorted rows to search among (default: all)
+
+        Returns:
+            Tuple of (rows, scores) by descending score
+        """
+        query = np.asarray(query, dtype=np.float32)
+        prepared = self.quantizer.prepare(query)
+
+        count = len(self) if rows is None else len(rows)
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, block_size):
+            codes = self.codes[start:start + block_size] if rows is None else self.codes[rows[start:start + block_size]]
+            scores[start:start + block_size] = self.quantizer.scores(prepared, codes)
+
+        exact = self.vectors is not None and rerank > 0
+        candidates = min(count, max(k, rerank) if exact else k)
+        if candidates <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        positions = np.argpartition(-scores, candidates - 1)[:candidates]
+        scores = scores[positions]
+        rows = positions if rows is None else rows[positions]
+
+        if exact:
+            rows = np.sort(rows)  # Sequential reads from the memory map
+            scores = np.asarray(self.vectors[rows], dtype=np.float32) @ query
+
+        order = np.argsort(-scores, kind="stable")[:k]
+        return rows[order], scores[order]
+
+    def search(self, query: np.ndarray, k: int = 10, rerank: int = 100,
+               exclude: Optional[Union[str, Collection[str]]] = None,
+               filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Find the tracks most similar to a query vector
+
+        Args:
+            query: (dim,) float32 query vector
+            k: Maximum number of tracks
+            rerank: Candidates re-scored with exact vectors
+            exclude: audio_id or audio_ids to leave out, usually the query track
+            filters: Attribute conditions the tracks must meet, as taken
+                by AttributeIndex.rows
+
+        Returns:
+            List of tracks with similarity scores
+        """
+        rows = None
+        if filters:
+            if self.attributes is None:
+                raise ValueError("This vector index has no track attributes to filter on")
+            rows = self.attributes.rows(filters)
+
+        excluded = {exclude} if isinstance(exclude, str) else set(exclude or ())
+        rows, scores = self.search_rows(query, k + len(excluded), rerank, rows=rows)
+        results = [
+            {'audio_id': str(self.ids[row]), 'score': float(score)}
+            for row, score in zip(rows, scores)
+            if str(self.ids[row]) not in excluded
+        ]
+        return results[:k]
+
+    def similar(self, audio_id: str, k: int = 10, rerank: int = 100,
+                filters: Optional[Dict[str, Any]] = None) -> Optional[List[Dict[str, Any]]]:
+        """Tracks most similar to an indexed track, or None if it is not indexed"""
+        vector = self.vector(audio_id)
+        if vector is None:
+            return None
+        return self.search(vector, k, rerank, exclude=audio_id, filters=filters)
+
+    def save(self, path: str) -> None:
+        """
+        Write the index to a directory, replacing any index there
+
+        Readers that loaded the previous index keep their memory maps.
+        """
+        temporary = f"{path}.tmp"
+        shutil.rmtree(temporary, ignore_errors=True)
+        os.makedirs(temporary)
+
+        np.save(os.path.join(temporary, "ids.npy"), np.asarray(self.ids, dtype=str))
+        np.save(os.path.join(temporary, "codes.npy"), self.codes)
+        np.savez(os.path.join(temporary, "quantizer.npz"), **self.quantizer.to_arrays())
+        if self.vectors is not None:
+            np.save(os.path.join(temporary, "vectors.npy"), np.asarray(self.vectors, dtype=np.float32))
+        if self.attributes is not None:
+            self.attributes.save(os.path.join(temporary, "attributes.npz"))
+        with open(os.path.join(temporary, INDEX_FILE), "w") as f:
+            json.dump({"format": FORMAT_VERSION, "count": len(self), **self.metadata}, f)
+
+        previous = f"{path}.old"
+        if os.path.exists(path):
+            shutil.rmtree(previous, ignore_errors=True)
+            os.replace(path, previous)
+        os.replace(temporary, path)
+        shutil.rmtree(previous, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path: str) -> "VectorIndex":
+        """Open a saved index, memory-mapping its codes and vectors"""
+        with open(os.path.join(path, INDEX_FILE)) as f:
+            metadata = json.load(f)
+        if metadata.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector index format: {metadata.get('format')}")
+
+        with np.load(os.path.join(path, "quantizer.npz")) as arrays:
+            quantizer = QUANTIZERS[metadata["quantizer"]].from_arrays(dict(arrays), metadata["params"])
+
+        vectors_path = os.path.join(path, "vectors.npy")
+        attributes_path = os.path.join(path, "attributes.npz")
+        return cls(
+            ids=np.load(os.path.join(path, "ids.npy"), mmap_mode="r"),
+            codes=np.load(os.path.join(path, "codes.npy"), mmap_mode="r"),
+            quantizer=quantizer,
+            vectors=np.load(vectors_path, mmap_mode="r") if os.path.exists(vectors_path) else None,
+            metadata=metadata,
+            attributes=AttributeIndex.load(attributes_path) if os.path.exists(attributes_path) else None
+        )
+
+def synthetic_catalog(count: int, dim: int = 48, clusters: int = 1000, seed: int = 0) -> np.ndarray:
+    """Unit vectors drawn around random cluster centers, like a catalog of genres and styles"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = np.empty((count, dim), dtype=np.float32)
+    for start in range(0, count, 262144):
+        size = min(262144, count - start)
+        block = centers[rng.integers(0, clusters, size)] + 0.6 * rng.standard_normal((size, dim)).astype(np.float32)
+        vectors[start:start + size] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    return vectors
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int, block_size: int = 262144) -> np.ndarray:
+    """(queries, k) rows with the highest inner products, by brute force"""
+    best = np.zeros((len(queries), 0), dtype=np.int64)
+    best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+    for start in range(0, len(vectors), block_size):
+        scores = queries @ vectors[start:start + block_size].T
+        rows = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+        best = np.concatenate([best, rows], axis=1)
+        best_scores = np.concatenate([best_scores, scores], axis=1)
+        keep = np.argpartition(-best_scores, min(k, best.shape[1]) - 1, axis=1)[:, :k]
+        best = np.take_along_axis(best, keep, axis=1)
+        best_scores = np.take_along_axis(best_scores, keep, axis=1)
+    return best
+
+def benchmark(count: int = 1000000, dim: int = 48, queries: int = 100, k: int = 10,
+              rerank: int = 100, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Measure recall@k, memory and latency of each index type on a synthetic catalog
+
+    Returns:
+        One result per configuration
+    """
+    vectors = synthetic_catalog(count, dim, seed=seed)
+    rng = np.random.default_rng(seed + 1)
+    query_vectors = vectors[rng.choice(count, queries, replace=False)]
+    query_vectors = query_vectors + 0.1 * rng.standard_normal(query_vectors.shape).astype(np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    truth = exact_top_k(vectors, query_vectors, k)
+    ids = np.arange(count).astype(str)
+
+    configurations = [
+        ("int8", {}, 0),
+        ("int8", {}, rerank),
+        ("pq", {"subspaces": 8}, 0),
+        ("pq", {"subspaces": 8}, rerank),
+        ("pq", {"subspaces": 16}, 0),
+        ("pq", {"subspaces": 16}, rerank)
+    ]
+
+    results = [{
+        "index": "float32 exact",
+        "memory_mb": vectors.nbytes / 2 ** 20,
+        "recall": 1.0,
+        "latency_ms": _mean_latency(lambda query: exact_top_k(vectors, query[None, :], k), query_vectors)
+    }]
+    built: Dict[str, VectorIndex] = {}
+    for quantizer, params, candidates in configurations:
+        key = f"{quantizer}{params.get('subspaces', '')}"
+        if key not in built:
+            started = time.time()
+            built[key] = VectorIndex.build(ids, vectors, quantizer, **params)
+            logger.info(f"{key}: built in {time.time() - started:.1f}s")
+        index = built[key]
+
+        found = []
+        latency = _mean_latency(
+            lambda query: found.append(index.search_rows(query, k, candidates)[0]), query_vectors
+        )
+        recall = np.mean([len(set(rows) & set(expected)) / k for rows, expected in zip(found, truth)])
+        results.append({
+            "index": f"{key}" + (f" + re-rank {candidates}" if candidates else ""),
+            "memory_mb": index.memory_bytes / 2 ** 20,
+            "recall": float(recall),
+            "latency_ms": latency
+        })
+    return results
+
+def _mean_latency(search, queries: np.ndarray) -> float:
+    started = time.perf_counter()
+    for query in queries:
+        search(query)
+    return (time.perf_counter() - started) * 1000 / len(queries)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build or benchmark the compressed track vector index")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Build an index from the feature store")
+    build.add_argument("--store", default=os.getenv("FEATURE_STORE_PATH"), help="Feature store directory")
+    build.add_argument("--output", default=os.getenv("VECTOR_INDEX_PATH"), help="Index directory")
+    build.add_argument("--column", default=VECTOR_COLUMN, help="Column to index (vector or embedding)")
+    build.add_argument("--quantizer", choices=sorted(QUANTIZERS), default="pq")
+    build.add_argument("--subspaces", type=int, default=16, help="Bytes per vector for pq")
+    build.add_argument("--documents", help="Feature documents with the tracks' filter attributes: "
+                                           "a JSON lines file, or 'mongo' for the catalog collection")
+
+    bench = commands.add_parser("benchmark", help="Measure recall, memory and latency on synthetic data")
+    bench.add_argument("--count", type=int, default=1000000)
+    bench.add_argument("--dim", type=int, default=48)
+    bench.add_argument("--queries", type=int, default=100)
+    bench.add_argument("--rerank", type=int, default=100)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "benchmark":
+        results = benchmark(args.count, args.dim, args.queries, rerank=args.rerank)
+        print(f"{'index':<24} {'memory MB':>10} {'recall@10':>10} {'ms/query':>10}")
+        for result in results:
+            print(f"{result['index']:<24} {result['memory_mb']:>10.1f} {result['recall']:>10.3f} {result['latency_ms']:>10.2f}")
+        return
+
+    if not args.store or not args.output:
+        parser.error("--store and --output (or FEATURE_STORE_PATH and VECTOR_INDEX_PATH) are required")
+
+    store = FeatureStore(args.store)
+    matrices = store.matrices([args.column])
+    present = matrices.present[args.column]
+    vectors = np.asarray(matrices.columns[args.column][present], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+    params = {"subspaces": args.subspaces} if args.quantizer == "pq" else {}
+    index = VectorIndex.build(matrices.ids[present], vectors, args.quantizer, **params)
+    if args.documents:
+        index.attributes = _load_attributes(args.documents, index.ids)
+
+    index.metadata.update({
+        "column": args.column,
+        "projection": store.projection_version if args.column == VECTOR_COLUMN else None,
+        "store_generation": store.generation
+    })
+    index.save(args.output)
+    logger.info(f"Saved index of {len(index)} tracks ({index.memory_bytes / 2 ** 20:.1f} MB in memory) to {args.output}")
+
+def _load_attributes(source: str, ids: np.ndarray) -> AttributeIndex:
+    """Attributes of the indexed tracks, in index order, from feature documents"""
+    if source == "mongo":
+        from .catalog_snapshot import create_catalog_feed
+
+        feed = create_catalog_feed()
+        if feed is None:
+            raise RuntimeError("The catalog collection is not reachable")
+        documents = feed.load()
+    else:
+        def read_lines():
+            with open(source, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        documents = read_lines()
+
+    # Later documents for a track win, as in the backfill output
+    by_id = {}
+    for document in documents:
+        audio_id = document.get("audio_id", document.get("audioId"))
+        if audio_id is not None:
+            by_id[str(audio_id)] = document
+
+    missing = sum(str(audio_id) not in by_id for audio_id in ids)
+    if missing:
+        logger.warning(f"No attributes for {missing} indexed tracks; they only match unfiltered searches")
+    return AttributeIndex.from_documents(by_id.get(str(audio_id), {}) for audio_id in ids)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import numpy as np
+
+from src.ml.feature_store import FeatureStore
+from src.ml.neighbor_table import NeighborTable, SIMILARITY_COLUMNS
+
+def make_tracks(rng: np.random.Generator, start: int, count: int):
+    return [
+        {
+            "audio_id": f"t{i}",
+            "mfccs": rng.normal(size=20).tolist(),
+            "chroma": rng.random(12).tolist(),
+            "tempo": float(rng.uniform(60, 180)),
+            "spectral_centroid": float(rng.uniform(500, 3000)),
+            "spectral_bandwidth": float(rng.uniform(500, 3000)),
+            "spectral_rolloff": float(rng.uniform(1000, 8000))
+        }
+        for i in range(start, start + count)
+    ]
+
+def assert_same_rows(table: NeighborTable, expected: NeighborTable, limit: int) -> None:
+    assert len(table) == len(expected)
+    for audio_id in map(str, expected.ids):
+        got = table.neighbors(audio_id, limit)
+        want = expected.neighbors(audio_id, limit)
+        assert len(got) == len(want), audio_id
+        # Scores are stored as float16, so near-ties may swap places
+        np.testing.assert_allclose(
+            [n["score"] for n in got], [n["score"] for n in want], atol=2e-3, err_msg=audio_id
+        )
+
+def test_update_matches_rebuild_after_deletes_and_inserts(tmp_path):
+    rng = np.random.default_rng(0)
+    store = FeatureStore(str(tmp_path / "store"))
+    store.append(make_tracks(rng, 0, 600))
+    table = NeighborTable(str(tmp_path / "table"))
+    table.rebuild(store.matrices(SIMILARITY_COLUMNS), k=10, block_size=128)
+
+    store.delete([f"t{i}" for i in range(0, 600, 30)])
+    table.update(store.matrices(SIMILARITY_COLUMNS), block_size=128)
+    store.append(make_tracks(rng, 600, 5))
+    table.update(store.matrices(SIMILARITY_COLUMNS), block_size=128)
+
+    expected = NeighborTable(str(tmp_path / "expected"))
+    expected.rebuild(store.matrices(SIMILARITY_COLUMNS), k=10, block_size=128)
+    assert_same_rows(table, expected, 10)
+    assert "t0" not in table
+
+def test_update_matches_rebuild_after_changes(tmp_path):
+    rng = np.random.default_rng(1)
+    store = FeatureStore(str(tmp_path / "store"))
+    store.append(make_tracks(rng, 0, 400))
+    table = NeighborTable(str(tmp_path / "table"))
+    table.rebuild(store.matrices(SIMILARITY_COLUMNS), k=10, block_size=128)
+
+    changed = make_tracks(rng, 0, 400)[::40]
+    store.append(changed)
+    table.update(store.matrices(SIMILARITY_COLUMNS), block_size=128)
+
+    expected = NeighborTable(str(tmp_path / "expected"))
+    expected.rebuild(store.matrices(SIMILARITY_COLUMNS), k=10, block_size=128)
+    assert_same_rows(table, expected, 10)